@@ -0,0 +1,93 @@
+"""Benchmark compiled rules against interpreted rules.
+
+Run from the top of the repository with ``python -m benchmarks.bench_codegen``.
+"""
+
+import logging
+import time
+import timeit
+from functools import partial
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.library import Album  # type: ignore
+from tests.test_plugin import new_albuminfo
+
+from beetsplug.importmodifyinfo.codegen import Program
+from beetsplug.importmodifyinfo.codegen import compile_rules
+from beetsplug.importmodifyinfo.engine import Rules
+from beetsplug.importmodifyinfo.engine import parse_rules
+from beetsplug.importmodifyinfo.engine import process_rules
+from beetsplug.importmodifyinfo.index import RuleIndex
+from beetsplug.importmodifyinfo.infomodel import AlbumInfoModel
+
+
+RULE_COUNTS = [10, 100, 1000, 10000]
+
+# Rule templates by kind of query, each formatted with the rule's number.
+RULE_KINDS: Dict[str, Callable[[int], str]] = {
+    "exact": lambda i: f"album:='album {i}' flex='{i}'",
+    "substring": lambda i: f"album:'substring {i}' flex='{i}'",
+    "regexp": lambda i: f"album::'^regexp {i}$' flex='{i}'",
+    "numeric": lambda i: f"year:{i}..{i} flex='{i}'",
+}
+
+
+def make_rules(kind: str, count: int) -> List[str]:
+    """Create rules of a kind, ending with one which matches."""
+    rules = [RULE_KINDS[kind](i) for i in range(count)]
+    rules.append("album:=album flex=matched")
+    return rules
+
+
+def apply_rules(
+    base_info: AlbumInfo,
+    rules: Rules,
+    index: Optional[RuleIndex],
+    program: Optional[Program],
+) -> None:
+    """Apply album rules to a fresh copy of an AlbumInfo."""
+    info = base_info.copy()
+    album = AlbumInfoModel(info)
+    process_rules(rules, info, album, index, program=program)
+
+
+def main() -> None:
+    """Time applying album rules interpreted and compiled."""
+    logging.getLogger("beets").setLevel(logging.WARNING)
+    base_info = new_albuminfo()
+    print(
+        f"{'kind':>10} {'rules':>6} {'linear (ms)':>12} {'indexed (ms)':>13}"
+        f" {'compiled (ms)':>14} {'compile (ms)':>13}"
+    )
+    for kind in RULE_KINDS:
+        for count in RULE_COUNTS:
+            rules = parse_rules(make_rules(kind, count), Album)
+            start = time.perf_counter()
+            program = compile_rules(rules, Album)
+            compile_time = time.perf_counter() - start
+
+            timings = []
+            for index, prog in [
+                (None, None),
+                (RuleIndex(rules), None),
+                (None, program),
+            ]:
+                func = partial(apply_rules, base_info, rules, index, prog)
+                number = max(1, 10000 // count)
+                timings.append(
+                    min(timeit.repeat(func, number=number, repeat=3)) / number
+                )
+
+            linear, indexed, compiled = (t * 1000 for t in timings)
+            print(
+                f"{kind:>10} {count:>6} {linear:>12.3f} {indexed:>13.3f}"
+                f" {compiled:>14.3f} {compile_time * 1000:>13.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark indexed rule dispatch against a linear scan of the rules.
+
+Run from the top of the repository with ``python -m benchmarks.bench_index``.
+"""
+
+import logging
+import timeit
+from functools import partial
+from typing import List
+from typing import Optional
+
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.library import Album  # type: ignore
+from tests.test_plugin import new_albuminfo
+
+from beetsplug.importmodifyinfo.engine import Rules
+from beetsplug.importmodifyinfo.engine import parse_rules
+from beetsplug.importmodifyinfo.engine import process_rules
+from beetsplug.importmodifyinfo.index import RuleIndex
+from beetsplug.importmodifyinfo.infomodel import AlbumInfoModel
+
+
+RULE_COUNTS = [10, 100, 1000, 10000]
+
+
+def make_rules(count: int) -> List[str]:
+    """Create rules, mostly exact album matches with some substring matches."""
+    rules = []
+    for i in range(count):
+        if i % 10 == 0:
+            rules.append(f"album:'substring {i}' flex='{i}'")
+        else:
+            rules.append(f"album:=~'album {i}' flex='{i}'")
+    # Ensure there is a match for the album being benchmarked.
+    rules.append("album:=album flex=matched")
+    return rules
+
+
+def apply_rules(base_info: AlbumInfo, rules: Rules, index: Optional[RuleIndex]) -> None:
+    """Apply album rules to a fresh copy of an AlbumInfo."""
+    info = base_info.copy()
+    album = AlbumInfoModel(info)
+    process_rules(rules, info, album, index)
+
+
+def main() -> None:
+    """Time applying album rules with and without the index."""
+    logging.getLogger("beets").setLevel(logging.WARNING)
+    base_info = new_albuminfo()
+    print(f"{'rules':>8} {'linear (ms)':>12} {'indexed (ms)':>13}")
+    for count in RULE_COUNTS:
+        rules = parse_rules(make_rules(count), Album)
+
+        linear = partial(apply_rules, base_info, rules, None)
+        indexed = partial(apply_rules, base_info, rules, RuleIndex(rules))
+
+        number = max(1, 10000 // count)
+        linear_time = min(timeit.repeat(linear, number=number, repeat=3)) / number
+        indexed_time = min(timeit.repeat(indexed, number=number, repeat=3)) / number
+        print(f"{count:>8} {linear_time * 1000:>12.3f} {indexed_time * 1000:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
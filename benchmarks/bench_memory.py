@@ -0,0 +1,102 @@
+"""Benchmark the memory used by parsed rules.
+
+Compares the rules as they are kept, with slots and tuples, against the
+same rules as named tuples holding a dictionary of mods and a list of
+dels, as they were kept before. Run from the top of the repository with
+``python -m benchmarks.bench_memory``.
+"""
+
+import logging
+import tracemalloc
+from functools import partial
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+
+from beets.dbcore import Query  # type: ignore
+from beets.library import Album  # type: ignore
+
+from beetsplug.importmodifyinfo import ImportModifyInfoPlugin
+from beetsplug.importmodifyinfo.engine import Rule
+from beetsplug.importmodifyinfo.engine import Rules
+
+from .data import RULE_KINDS
+from .data import make_rules
+
+
+RULE_COUNT = 10000
+
+
+class DictRule(NamedTuple):
+    """A rule as it was kept before, for comparison."""
+
+    modify: str
+    query: Query
+    mods: Dict[str, Any]
+    dels: List[str]
+
+
+def allocated(func: Callable[[], Any]) -> int:
+    """Return the bytes allocated by a function for its result."""
+    tracemalloc.start()
+    try:
+        result = func()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def dict_rules(rules: Rules) -> List[DictRule]:
+    """Copy rules as named tuples with a dictionary of mods and list of dels."""
+    return [
+        DictRule(
+            rule.modify,
+            rule.query,
+            {field: value for field, value, _ in rule.mods},
+            list(rule.dels),
+        )
+        for rule in rules
+    ]
+
+
+def slot_rules(rules: Rules) -> Rules:
+    """Copy rules as they are kept, with new tuples of mods and dels."""
+    return [
+        Rule(
+            rule.modify,
+            rule.query,
+            tuple((field, value, parse) for field, value, parse in rule.mods),
+            tuple(rule.dels),
+        )
+        for rule in rules
+    ]
+
+
+def main() -> None:
+    """Measure the memory used by rules of each kind."""
+    logging.getLogger("beets").setLevel(logging.WARNING)
+    plugin = ImportModifyInfoPlugin()
+    print(
+        f"{'kind':>10} {'rules':>6} {'parsed (KiB)':>13} {'before (KiB)':>13}"
+        f" {'after (KiB)':>12} {'saved/rule (B)':>15}"
+    )
+    for kind in RULE_KINDS:
+        modifies = make_rules(kind, RULE_COUNT, "album")
+        # Parse in a new context each time, so no rules are reused.
+        parsed = allocated(partial(plugin.get_modifies, modifies, Album, kind))
+        rules = list(plugin.parsed_rules.pop(kind).values())
+        before = allocated(partial(dict_rules, rules))
+        after = allocated(partial(slot_rules, rules))
+        print(
+            f"{kind:>10} {RULE_COUNT:>6} {parsed / 1024:>13.1f}"
+            f" {before / 1024:>13.1f} {after / 1024:>12.1f}"
+            f" {(before - after) / RULE_COUNT:>15.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark the plugin's startup time.
+
+Measures the time taken to import the plugin with ``-X importtime``,
+after the beets modules any beets command imports anyway, and the time a
+new process takes to be ready for its first event, with the rules parsed
+or loaded from the precompiled rules. Each measurement runs in a new
+process. Run from the top of the repository with
+``python -m benchmarks.bench_startup``.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from .data import make_rules
+
+
+RULE_COUNTS = [10, 100, 1000, 10000]
+
+# Number of processes to time for each measurement, taking the fastest.
+REPEAT = 5
+
+# Modules beets has imported by the time it loads plugins. beets.ui.commands,
+# and the importer it pulls in, are only imported after plugins are loaded,
+# so importing them from the plugin counts towards its import time.
+BEETS_IMPORTS = "import beets.ui, beets.library, beets.plugins, beets.autotag"
+
+PLUGIN_MODULE = "beetsplug.importmodifyinfo"
+
+READY_SCRIPT = """
+import json, logging, sys, time
+start = time.perf_counter()
+logging.getLogger("beets").setLevel(logging.WARNING)
+from beets import config
+from beetsplug.importmodifyinfo import ImportModifyInfoPlugin
+with open(sys.argv[1]) as f:
+    config["importmodifyinfo"].set(json.load(f))
+ImportModifyInfoPlugin().set_rules()
+print(time.perf_counter() - start)
+"""
+
+
+def python(*args: str) -> str:
+    """Run Python in a new process, returning its output and import times."""
+    # Write bytecode, so later runs don't compile the modules again.
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    process = subprocess.run(  # noqa: S603
+        [sys.executable, *args], capture_output=True, text=True, check=True, env=env
+    )
+    return process.stdout + process.stderr
+
+
+def import_time() -> Tuple[float, List[str]]:
+    """Return the time taken to import the plugin in ms, and its modules."""
+    output = python(
+        "-X", "importtime", "-c", f"{BEETS_IMPORTS}; import {PLUGIN_MODULE}"
+    )
+    cumulative = 0.0
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, total, name = line.split("|")
+        name = name.strip()
+        if name == PLUGIN_MODULE:
+            cumulative = int(total) / 1000
+        elif name.startswith(f"{PLUGIN_MODULE}."):
+            modules.append(name[len(PLUGIN_MODULE) + 1 :])
+    return cumulative, modules
+
+
+def ready_time(options: Dict[str, Any], directory: str) -> float:
+    """Return the time a new process takes to be ready for events, in ms."""
+    path = os.path.join(directory, "config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(options, f)
+    return float(python("-c", READY_SCRIPT, path)) * 1000
+
+
+def main() -> None:
+    """Time importing the plugin, and getting ready for the first event."""
+    python("-c", f"import {PLUGIN_MODULE}")
+    times = [import_time() for _ in range(REPEAT)]
+    cumulative = min(t for t, _ in times)
+    print(f"import: {cumulative:.1f} ms, modules: {', '.join(times[0][1])}\n")
+
+    print(f"{'rules':>6} {'parsed (ms)':>12} {'precompiled (ms)':>17}")
+    with tempfile.TemporaryDirectory() as directory:
+        precompiled_path = os.path.join(directory, "rules.pickle")
+        for count in RULE_COUNTS:
+            rules = {
+                "modify_albuminfo": make_rules("exact", count, "album"),
+                "modify_trackinfo": make_rules("template", count, "title"),
+            }
+            parsed = min(ready_time(rules, directory) for _ in range(REPEAT))
+
+            options = {
+                **rules,
+                "precompiled": True,
+                "precompiled_path": precompiled_path,
+            }
+            ready_time(options, directory)
+            precompiled = min(ready_time(options, directory) for _ in range(REPEAT))
+            print(f"{count:>6} {parsed:>12.1f} {precompiled:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
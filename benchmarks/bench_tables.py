@@ -0,0 +1,94 @@
+"""Benchmark rules from a rule table against the same rules as entries.
+
+Measures the time taken to build the rules, from ``modify_albuminfo``
+entries or from a CSV rule table, and to apply them to an album. Run from
+the top of the repository with ``python -m benchmarks.bench_tables``.
+"""
+
+import logging
+import os
+import tempfile
+import timeit
+from functools import partial
+from typing import List
+
+from beets.library import Album  # type: ignore
+
+from beetsplug.importmodifyinfo.engine import RuleSet
+from beetsplug.importmodifyinfo.engine import parse_rules
+from beetsplug.importmodifyinfo.tables import RuleTable
+from beetsplug.importmodifyinfo.tables import load_table
+
+from .data import make_albuminfo
+
+
+ROW_COUNTS = [100, 1000, 10000, 30000]
+
+# Number of fields each rule sets.
+FIELDS = 2
+
+
+def make_rows(count: int) -> List[List[str]]:
+    """Create rows keyed by release ID, one key matching the album."""
+    return [
+        ["mb_albumid", "album_id" if i == count // 2 else f"id {i}", f"f{n}", str(i)]
+        for i in range(count)
+        for n in range(FIELDS)
+    ]
+
+
+def entries(rows: List[List[str]]) -> List[str]:
+    """Return the rows as entries, one for each key."""
+    return [
+        f"{key_field}:='{key}' {field}={value}"
+        for key_field, key, field, value in rows[::FIELDS]
+    ]
+
+
+def apply(ruleset: RuleSet) -> None:
+    """Apply rules to a new album."""
+    ruleset.apply(make_albuminfo(0))
+
+
+def main() -> None:
+    """Time building and applying rules from entries and from tables."""
+    logging.getLogger("beets").setLevel(logging.WARNING)
+    print(
+        f"{'keys':>6} {'entries build (ms)':>19} {'table build (ms)':>17}"
+        f" {'entries apply (ms)':>19} {'table apply (ms)':>17}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for count in ROW_COUNTS:
+            rows = make_rows(count)
+            path = os.path.join(directory, f"{count}.csv")
+            with open(path, "w", encoding="utf-8") as f:
+                lines = [",".join(row) for row in rows]
+                f.write("\n".join(["key_field,key_value,field,value", *lines]))
+            table = RuleTable(path, "rules", None, None)
+
+            modifies = entries(rows)
+            times = []
+            for build in (
+                partial(parse_rules, modifies, Album),
+                partial(load_table, table, Album, "rules"),
+            ):
+                times.append(min(timeit.repeat(build, number=1, repeat=3)))
+            rulesets = [
+                RuleSet(parse_rules(modifies, Album), Album),
+                RuleSet(load_table(table, Album, "rules"), Album),
+            ]
+            for ruleset in rulesets:
+                apply(ruleset)
+                times.append(
+                    min(timeit.repeat(partial(apply, ruleset), number=100, repeat=3))
+                    / 100
+                )
+            ms = [t * 1000 for t in times]
+            print(
+                f"{count:>6} {ms[0]:>19.1f} {ms[1]:>17.1f}"
+                f" {ms[2]:>19.3f} {ms[3]:>17.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Synthetic importer information and rules for benchmarks."""
+
+from functools import lru_cache
+from typing import Callable
+from typing import Dict
+from typing import List
+
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.autotag.hooks import TrackInfo
+from tests.test_plugin import set_default_values
+
+
+# Every this many rules, one matches the generated information.
+MATCH_INTERVAL = 100
+
+# Rule templates by kind, each formatted with the rule's number, the field
+# to query and whether the rule should match.
+RuleTemplate = Callable[[int, str, bool], str]
+RULE_KINDS: Dict[str, RuleTemplate] = {
+    "exact": lambda i, field, match: (
+        f"{field}:='{field if match else f'{field} {i}'}' flex='{i}'"
+    ),
+    "substring": lambda i, field, match: (
+        f"{field}:'{field if match else f'substring {i}'}' flex='{i}'"
+    ),
+    "regex": lambda i, field, match: (
+        f"{field}::'^{field if match else f'regex {i}'}$' flex='{i}'"
+    ),
+    "template": lambda i, field, match: (
+        f"{field}:'{field if match else f'substring {i}'}'"
+        f" flex='%upper{{${field}}} {i}'"
+    ),
+    "delete": lambda i, field, match: (
+        f"{field}:'{field if match else f'substring {i}'}' flex! comments!"
+    ),
+}
+
+
+def make_trackinfo(index: int) -> TrackInfo:
+    """Create a TrackInfo with every field set."""
+    info = TrackInfo(flex="flex")
+    set_default_values(info)
+    info.index = index
+    info.track_id = f"track_id {index}"
+    return info
+
+
+# functools.cache needs Python 3.9, and Python 3.8 is still supported.
+@lru_cache(maxsize=None)  # noqa: UP033
+def _albuminfo(tracks: int) -> AlbumInfo:
+    info = AlbumInfo(tracks=[make_trackinfo(i) for i in range(tracks)], flex="flex")
+    set_default_values(info)
+    info.year = 2000
+    return info
+
+
+def make_albuminfo(tracks: int) -> AlbumInfo:
+    """Create an AlbumInfo with every field set, and a number of tracks."""
+    return _albuminfo(tracks).copy()
+
+
+def make_rules(kind: str, count: int, field: str) -> List[str]:
+    """Create rules of a kind querying a field, some of which match."""
+    template = RULE_KINDS[kind]
+    return [template(i, field, i % MATCH_INTERVAL == 0) for i in range(count)]
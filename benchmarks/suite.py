@@ -0,0 +1,191 @@
+"""Benchmark suite for the rule engine.
+
+Times applying album and track rules to a received album, across numbers
+of rules, kinds of rules and numbers of tracks per album. Run from the top
+of the repository with ``python -m benchmarks.suite``, or with
+``nox --session=benchmarks`` to save the results for later comparison.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import beets  # type: ignore
+from beets import config
+from beets.library import Album  # type: ignore
+from tests.test_plugin import apply_album_metadata
+
+from beetsplug.importmodifyinfo import ImportModifyInfoPlugin
+
+from .data import RULE_KINDS
+from .data import make_albuminfo
+from .data import make_rules
+
+
+RULE_COUNTS = [10, 100, 1000, 10000]
+TRACK_COUNTS = [1, 10, 100, 500]
+
+# Cases with more rule tests than this are skipped unless asked for.
+MAX_WORK = 1_000_000
+
+# Time to spend repeating each case, in seconds, after at least 3 runs.
+MIN_TIME = 0.5
+
+Result = Dict[str, Any]
+
+
+def measure(func: Any, setup: Any) -> float:
+    """Return the fastest time taken by func, called with setup's result."""
+    times: List[float] = []
+    end = time.perf_counter() + MIN_TIME
+    while len(times) < 3 or time.perf_counter() < end:
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_rules(kind: str, rules: int, tracks: int, options: Dict[str, Any]) -> Result:
+    """Time applying album rules and per-track rules to an album."""
+    config["importmodifyinfo"].set(
+        {
+            "batch_tracks": True,
+            "modify_albuminfo": make_rules(kind, rules, "album"),
+            "modify_trackinfo": make_rules(kind, rules, "title"),
+            **options,
+        }
+    )
+    plugin = ImportModifyInfoPlugin()
+    plugin.set_rules()
+    seconds = measure(plugin.apply_albuminfo_rules, lambda: make_albuminfo(tracks))
+    return {"kind": kind, "rules": rules, "tracks": tracks, "seconds": seconds}
+
+
+def bench_metadata(tracks: int) -> Result:
+    """Time copying an album's information to a new Album, for reference."""
+    seconds = measure(
+        lambda info: apply_album_metadata(info, Album()),
+        lambda: make_albuminfo(tracks),
+    )
+    return {"kind": "metadata", "rules": 0, "tracks": tracks, "seconds": seconds}
+
+
+def run(args: argparse.Namespace) -> List[Result]:
+    """Run the selected benchmarks, printing each result as it completes."""
+    options: Dict[str, Any] = {"engine": args.engine, "cache_size": args.cache_size}
+    results = []
+    print(f"{'kind':>10} {'rules':>6} {'tracks':>6} {'ms':>10}")
+    for tracks in args.tracks:
+        results.append(bench_metadata(tracks))
+        print_result(results[-1])
+        for kind in args.kinds:
+            for rules in args.rules:
+                if rules * tracks > MAX_WORK and not args.all:
+                    continue
+                results.append(bench_rules(kind, rules, tracks, options))
+                print_result(results[-1])
+    return results
+
+
+def print_result(result: Result, baseline: Optional[float] = None) -> None:
+    """Print a result, and its change from a baseline time if there is one."""
+    line = (
+        f"{result['kind']:>10} {result['rules']:>6} {result['tracks']:>6}"
+        f" {result['seconds'] * 1000:>10.3f}"
+    )
+    if baseline:
+        line += f" {result['seconds'] / baseline:>7.2f}x"
+    print(line)
+
+
+def compare(results: List[Result], path: str) -> None:
+    """Print results alongside their change from earlier results."""
+    with open(path, encoding="utf-8") as f:
+        earlier = json.load(f)["results"]
+    baselines = {(r["kind"], r["rules"], r["tracks"]): r["seconds"] for r in earlier}
+    print(f"\nCompared with {path}:")
+    print(f"{'kind':>10} {'rules':>6} {'tracks':>6} {'ms':>10} {'change':>8}")
+    for result in results:
+        key = (result["kind"], result["rules"], result["tracks"])
+        print_result(result, baselines.get(key))
+
+
+def save(results: List[Result], directory: str, args: argparse.Namespace) -> str:
+    """Save results with details of the environment, returning the path."""
+    # datetime.UTC needs Python 3.11, and Python 3.8 is still supported.
+    now = datetime.datetime.now(datetime.timezone.utc)  # noqa: UP017
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, now.strftime("%Y%m%dT%H%M%SZ.json"))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "time": now.isoformat(),
+                "python": platform.python_version(),
+                "beets": beets.__version__,
+                "engine": args.engine,
+                "cache_size": args.cache_size,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    return path
+
+
+def latest(directory: str) -> Optional[str]:
+    """Return the path to the most recently saved results, if any."""
+    if not os.path.isdir(directory):
+        return None
+    names = sorted(n for n in os.listdir(directory) if n.endswith(".json"))
+    return os.path.join(directory, names[-1]) if names else None
+
+
+def counts(value: str) -> List[int]:
+    """Parse a comma-separated list of counts."""
+    return [int(count) for count in value.split(",")]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the benchmark suite."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=counts, default=RULE_COUNTS)
+    parser.add_argument("--tracks", type=counts, default=TRACK_COUNTS)
+    parser.add_argument(
+        "--kinds", type=lambda v: v.split(","), default=list(RULE_KINDS)
+    )
+    parser.add_argument("--engine", default="interpreted")
+    parser.add_argument("--cache-size", type=int, default=0)
+    parser.add_argument(
+        "--all", action="store_true", help=f"include cases over {MAX_WORK} tests"
+    )
+    parser.add_argument("--save", metavar="DIR", help="save results in DIR")
+    parser.add_argument(
+        "--compare",
+        metavar="FILE",
+        help="compare with earlier results, by default the latest in --save",
+    )
+    args = parser.parse_args(argv)
+
+    logging.getLogger("beets").setLevel(logging.WARNING)
+    config.read(user=False, defaults=True)
+
+    baseline = args.compare or (args.save and latest(args.save))
+    results = run(args)
+    if baseline:
+        compare(results, baseline)
+    if args.save:
+        print(f"\nSaved results to {save(results, args.save, args)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
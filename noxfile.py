@@ -179,6 +179,15 @@ def coverage(session: Session) -> None:
     session.run("coverage", *args)
 
 
+@session(python=python_versions[0])
+def benchmarks(session: Session) -> None:
+    """Run the benchmark suite, comparing with the last saved results."""
+    args = session.posargs or ["--save", ".benchmarks"]
+    session.install(".")
+    session.install("pytest")
+    session.run("python", "-m", "benchmarks.suite", *args)
+
+
 @session(python=python_versions[0])
 def typeguard(session: Session) -> None:
     """Runtime type checking using Typeguard."""
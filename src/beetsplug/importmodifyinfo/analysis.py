@@ -0,0 +1,260 @@
+"""Static analysis of rules for the importmodifyinfo plugin."""
+
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import Dict
+from typing import FrozenSet
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Type
+
+from beets.dbcore import Model  # type: ignore
+from beets.dbcore.query import AndQuery  # type: ignore
+from beets.dbcore.query import BooleanQuery
+from beets.dbcore.query import CollectionQuery
+from beets.dbcore.query import FalseQuery
+from beets.dbcore.query import FieldQuery
+from beets.dbcore.query import MatchQuery
+from beets.dbcore.query import NoneQuery
+from beets.dbcore.query import NotQuery
+from beets.dbcore.query import NumericQuery
+from beets.dbcore.query import OrQuery
+from beets.dbcore.query import RegexpQuery
+from beets.dbcore.query import StringQuery
+from beets.dbcore.query import SubstringQuery
+from beets.dbcore.query import TrueQuery
+from beets.util import functemplate  # type: ignore
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .engine import Rule
+    from .engine import Rules
+
+
+# Template functions whose results only depend on their arguments.
+PURE_FUNCTIONS: FrozenSet[str] = frozenset(
+    {"asciify", "first", "if", "left", "lower", "right", "time", "title", "upper"}
+)
+
+# Field queries whose result only depends on the value of their field.
+VALUE_QUERIES: Tuple[type, ...] = (
+    BooleanQuery,
+    MatchQuery,
+    NoneQuery,
+    NumericQuery,
+    RegexpQuery,
+    StringQuery,
+    SubstringQuery,
+)
+
+
+def query_fields(query: Any) -> Optional[Set[str]]:
+    """Return the fields a query reads, or None if they can't be determined."""
+    if isinstance(query, FieldQuery):
+        return {query.field}
+    elif isinstance(query, CollectionQuery):
+        fields: Set[str] = set()
+        for subquery in query.subqueries:
+            subfields = query_fields(subquery)
+            if subfields is None:
+                return None
+            fields |= subfields
+        return fields
+    elif isinstance(query, NotQuery):
+        return query_fields(query.subquery)
+    elif isinstance(query, (TrueQuery, FalseQuery)):
+        return set()
+    else:
+        return None
+
+
+def template_fields(template: functemplate.Template) -> Optional[Set[str]]:
+    """Return the fields a template reads, or None if they can't be determined."""
+    _, varnames, funcnames = template.expr.translate()
+    if not funcnames <= PURE_FUNCTIONS:
+        return None
+
+    fields = set(varnames)
+    # Formatted items fall back between these when either is empty.
+    if fields & {"artist", "albumartist"}:
+        fields |= {"artist", "albumartist"}
+    return fields
+
+
+def rule_reads(rule: "Rule") -> Optional[Set[str]]:
+    """Return the fields a rule reads, or None if they can't be determined."""
+    fields = query_fields(rule.query)
+    if fields is None:
+        return None
+
+    for _, value, parse in rule.mods:
+        if parse is not None:
+            read = template_fields(value)
+            if read is None:
+                return None
+            fields |= read
+    return fields
+
+
+def rule_writes(rule: "Rule") -> Set[str]:
+    """Return the fields a rule modifies or deletes."""
+    return {field for field, _, _ in rule.mods} | set(rule.dels)
+
+
+def field_conditions(rules: "Rules", field: str) -> Optional[List[Tuple[Any, ...]]]:
+    """Return the conditions of each rule's query which only read a field.
+
+    A rule's conditions are the subqueries of its query if it is an
+    `AndQuery`, or else the query itself, which must all match for the
+    rule to match. Returns None if no rule has a condition on the field,
+    or if a rule writes the field, as the rules which may match an object
+    then can't be told from the field's value alone.
+    """
+    if any(field in rule_writes(rule) for rule in rules):
+        return None
+
+    conditions = []
+    for rule in rules:
+        query = rule.query
+        parts = query.subqueries if isinstance(query, AndQuery) else [query]
+        conditions.append(tuple(p for p in parts if query_fields(p) == {field}))
+    return conditions if any(conditions) else None
+
+
+def rule_fields(rules: "Rules") -> Optional[Set[str]]:
+    """Return the fields a list of rules read, or None if they can't be determined."""
+    fields: Set[str] = set()
+    for rule in rules:
+        read = rule_reads(rule)
+        if read is None:
+            return None
+        fields |= read
+    return fields
+
+
+def required_fields(query: Any, empty: Model) -> Set[str]:
+    """Return the fields which must have a value for a query to match.
+
+    A field is required if a query must match on it, and its comparison
+    fails for an object with no value for it.
+    """
+    if type(query) is AndQuery:
+        fields: Set[str] = set()
+        for subquery in query.subqueries:
+            fields |= required_fields(subquery, empty)
+        return fields
+    elif type(query) is OrQuery and query.subqueries:
+        alternatives = [required_fields(q, empty) for q in query.subqueries]
+        return set.intersection(*alternatives)
+    elif type(query) in VALUE_QUERIES and query.field not in empty._getters():
+        if not query.match(empty):
+            return {query.field}
+    return set()
+
+
+def has_value(obj: Model, field: str) -> bool:
+    """Determine whether an object has a value of its own for a field."""
+    return field in obj._values_fixed or field in obj._values_flex
+
+
+class DependencyGraph:
+    """The dependencies between rules, from the fields they read and write.
+
+    A rule depends on an earlier rule if it reads or writes a field the
+    earlier rule writes, or writes a field the earlier rule reads, as
+    their order then affects the result. A rule whose reads can't be
+    determined depends on every earlier rule, and every later rule depends
+    on it. Only the most recent of these dependencies are recorded, the
+    rest being implied.
+
+    Rules are partitioned into groups which are independent of each other,
+    so each group gives the same results whatever the other groups do. A
+    group is skipped as a whole for an object which has no value for some
+    field each of its rules requires, as none of them can match.
+    """
+
+    def __init__(self, rules: "Rules", model_cls: Type[Model]) -> None:
+        self.reads = [rule_reads(rule) for rule in rules]
+        self.writes = [rule_writes(rule) for rule in rules]
+        self.written: Set[str] = set().union(*self.writes)
+        self.dependencies = self.find_dependencies()
+        self.groups = self.find_groups()
+
+        empty = model_cls()
+        self.requirements = [required_fields(rule.query, empty) for rule in rules]
+        self.skippable: List[Tuple[List[int], List[Set[str]]]] = []
+        for group in self.groups:
+            written = set().union(*(self.writes[position] for position in group))
+            requirements = [self.requirements[p] - written for p in group]
+            if all(requirements):
+                self.skippable.append((group, requirements))
+        self.required: Set[str] = set().union(
+            *(r for _, requirements in self.skippable for r in requirements)
+        )
+
+    def find_dependencies(self) -> List[Set[int]]:
+        """Return the earlier rules each rule directly depends on."""
+        writer: Dict[str, int] = {}
+        readers: Dict[str, Set[int]] = {}
+        barrier: Optional[int] = None
+        dependencies: List[Set[int]] = []
+        for position, reads in enumerate(self.reads):
+            writes = self.writes[position]
+            depends: Set[int] = set()
+            if barrier is not None:
+                depends.add(barrier)
+
+            if reads is None:
+                depends.update(writer.values())
+                for field_readers in readers.values():
+                    depends.update(field_readers)
+                barrier = position
+                writer.clear()
+                readers.clear()
+            else:
+                for field in reads | writes:
+                    if field in writer:
+                        depends.add(writer[field])
+                for field in writes:
+                    depends.update(readers.pop(field, ()))
+                for field in reads:
+                    readers.setdefault(field, set()).add(position)
+
+            for field in writes:
+                writer[field] = position
+            depends.discard(position)
+            dependencies.append(depends)
+        return dependencies
+
+    def find_groups(self) -> List[List[int]]:
+        """Return the groups of rules connected by their dependencies."""
+        parents = list(range(len(self.dependencies)))
+
+        def root(position: int) -> int:
+            while parents[position] != position:
+                parents[position] = parents[parents[position]]
+                position = parents[position]
+            return position
+
+        for position, depends in enumerate(self.dependencies):
+            for dependency in depends:
+                parents[root(dependency)] = root(position)
+
+        groups: Dict[int, List[int]] = {}
+        for position in range(len(parents)):
+            groups.setdefault(root(position), []).append(position)
+        return list(groups.values())
+
+    def skipped(self, obj: Model) -> Set[int]:
+        """Return the positions of rules which can't match an object."""
+        absent = {field for field in self.required if not has_value(obj, field)}
+        if not absent:
+            return set()
+
+        skipped: Set[int] = set()
+        for group, requirements in self.skippable:
+            if all(not absent.isdisjoint(r) for r in requirements):
+                skipped.update(group)
+        return skipped
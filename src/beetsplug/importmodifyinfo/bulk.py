@@ -0,0 +1,258 @@
+"""Bulk application of rules to the library for the importmodifyinfo plugin."""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+from typing import cast
+
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.dbcore.query import AndQuery  # type: ignore
+from beets.dbcore.query import FieldQuery
+from beets.library import Album  # type: ignore
+from beets.library import Item
+from beets.library import Library
+from beets.library import parse_query_parts
+
+from .cache import DELETE
+from .cache import Change
+from .cache import Changes
+from .cache import Edits
+from .cache import Info
+from .cache import apply_edits
+from .snapshot import SnapshotStore
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .plugin import ImportModifyInfoPlugin
+
+
+# Number of changed objects to store in each database transaction.
+BATCH_SIZE = 1000
+
+# The changes rules made to each object in a shard, by ID, the number of
+# objects in the shard, and the number of those without a snapshot.
+ShardResult = Tuple[List[Tuple[int, Edits]], int, int]
+
+# The plugin and library connection of a worker process.
+_worker: Optional[Tuple["ImportModifyInfoPlugin", Library]] = None
+
+
+class ShardQuery(FieldQuery):  # type: ignore
+    """Match objects whose ID falls in one of a number of shards."""
+
+    def __init__(self, shard: int, shards: int) -> None:
+        super().__init__("id", shard)
+        self.shards = shards
+
+    def col_clause(self) -> Tuple[str, Tuple[int, int]]:
+        """Select the shard in SQLite."""
+        return f"{self.field} % ? = ?", (self.shards, self.pattern)
+
+    def match(self, obj: Union[Item, Album]) -> bool:
+        """Determine whether an object is in the shard."""
+        return bool(obj.id % self.shards == self.pattern)
+
+
+def apply_rules(
+    plugin: "ImportModifyInfoPlugin",
+    lib: Library,
+    kind: str,
+    query: List[str],
+    jobs: int,
+    snapshot_path: Optional[str] = None,
+) -> Tuple[int, int, int]:
+    """Apply rules to the albums or tracks matching a query, and store them.
+
+    If the path to a snapshot store is given, the rules are applied to the
+    latest snapshot of the info received for each object rather than to
+    its current values, and objects without a snapshot are skipped.
+
+    With more than one job, the objects are sharded by ID across a pool of
+    forked processes, each reading them through its own connection to the
+    library. Changes are only stored by this process, in batches of
+    `BATCH_SIZE` per transaction. Returns the number of objects changed,
+    the number matching the query, and the number without a snapshot.
+    """
+    results: List[ShardResult]
+    if jobs > 1 and can_fork(lib):
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(
+            jobs, context, initializer=init_worker, initargs=(plugin, lib)
+        ) as pool:
+            results = list(
+                pool.map(
+                    process_shard,
+                    [kind] * jobs,
+                    [query] * jobs,
+                    range(jobs),
+                    [jobs] * jobs,
+                    [snapshot_path] * jobs,
+                )
+            )
+    else:
+        results = [process_objects(plugin, lib, kind, query, snapshot_path)]
+
+    changes = [change for shard_changes, _, _ in results for change in shard_changes]
+    store_changes(lib, kind, changes)
+    count = sum(count for _, count, _ in results)
+    return len(changes), count, sum(missing for _, _, missing in results)
+
+
+def can_fork(lib: Library) -> bool:
+    """Determine whether worker processes can be forked to read the library."""
+    in_memory = lib.path in (":memory:", b":memory:")
+    return not in_memory and "fork" in multiprocessing.get_all_start_methods()
+
+
+def init_worker(plugin: "ImportModifyInfoPlugin", lib: Library) -> None:
+    """Set up a forked worker with its own connection to the library."""
+    global _worker
+    _worker = plugin, Library(lib.path, lib.directory)
+
+
+def process_shard(
+    kind: str,
+    query: List[str],
+    shard: int,
+    shards: int,
+    snapshot_path: Optional[str] = None,
+) -> ShardResult:
+    """Apply rules to one shard of the objects in a worker process."""
+    plugin, lib = cast(Tuple["ImportModifyInfoPlugin", Library], _worker)
+    return process_objects(plugin, lib, kind, query, snapshot_path, shard, shards)
+
+
+def process_objects(
+    plugin: "ImportModifyInfoPlugin",
+    lib: Library,
+    kind: str,
+    query: List[str],
+    snapshot_path: Optional[str] = None,
+    shard: int = 0,
+    shards: int = 1,
+) -> ShardResult:
+    """Apply rules to the objects in a shard, returning their changes."""
+    results = object_changes(plugin, lib, kind, query, snapshot_path, shard, shards)
+    changes = []
+    count = missing = 0
+    for obj, obj_changes in results:
+        count += 1
+        if obj_changes is None:
+            missing += 1
+        elif obj_changes:
+            changes.append((obj.id, [(c.field, c.new) for c in obj_changes]))
+    return changes, count, missing
+
+
+def diff_objects(
+    plugin: "ImportModifyInfoPlugin",
+    lib: Library,
+    kind: str,
+    query: List[str],
+    snapshot_path: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Generate a report of the changes rules would make to each object.
+
+    Objects are read, and reports generated, one at a time, so any number
+    of objects can be reported on in constant memory. Nothing is stored.
+    Objects which wouldn't change, or have no snapshot, are left out.
+    """
+    id_field = "mb_albumid" if kind == "album" else "mb_trackid"
+    for obj, changes in object_changes(plugin, lib, kind, query, snapshot_path):
+        if changes:
+            yield {
+                "kind": kind,
+                "id": obj.id,
+                "mbid": obj.get(id_field),
+                "changes": [change_report(change) for change in changes],
+            }
+
+
+def change_report(change: Change) -> Dict[str, Any]:
+    """Return a report of a change, leaving out values which are absent."""
+    report: Dict[str, Any] = {"field": change.field}
+    if change.old is not DELETE:
+        report["old"] = change.old
+    if change.new is DELETE:
+        report["deleted"] = True
+    else:
+        report["new"] = change.new
+    return report
+
+
+def object_changes(
+    plugin: "ImportModifyInfoPlugin",
+    lib: Library,
+    kind: str,
+    query: List[str],
+    snapshot_path: Optional[str] = None,
+    shard: int = 0,
+    shards: int = 1,
+) -> Iterator[Tuple[Union[Item, Album], Optional[Changes]]]:
+    """Generate the objects in a shard, and the changes rules make to them.
+
+    If the path to a snapshot store is given, the rules are applied to
+    each object's snapshot, and the changes are None for objects without
+    one. The objects are modified, but not stored.
+    """
+    model_cls = Album if kind == "album" else Item
+    dbquery, _ = parse_query_parts(query, model_cls)
+    if shards > 1:
+        dbquery = AndQuery([dbquery, ShardQuery(shard, shards)])
+
+    objs = lib.albums(dbquery) if kind == "album" else lib.items(dbquery)
+    snapshots = SnapshotStore(snapshot_path) if snapshot_path else None
+    try:
+        for obj in objs:
+            if snapshots is None:
+                yield obj, plugin.apply_model_rules(obj)
+                continue
+
+            snapshot = snapshot_info(snapshots, obj)
+            if snapshot is None:
+                yield obj, None
+            else:
+                yield obj, plugin.apply_model_rules(obj, *snapshot)
+    finally:
+        if snapshots is not None:
+            snapshots.close()
+
+
+def snapshot_info(
+    snapshots: SnapshotStore, obj: Union[Item, Album]
+) -> Optional[Tuple[Info, Optional[AlbumInfo]]]:
+    """Return the snapshot of the info for an object, and of its album's info.
+
+    Tracks of albums are found by their release track ID in the snapshot of
+    the album, and singletons by their recording ID.
+    """
+    album_info = None
+    if isinstance(obj, Album):
+        info = snapshots.get_album(obj.mb_albumid)
+    elif obj.singleton:
+        info = snapshots.get_track(obj.mb_trackid)
+    else:
+        album_info = snapshots.get_album(obj.mb_albumid)
+        tracks = album_info.tracks if album_info is not None else []
+        info = next(
+            (t for t in tracks if t.release_track_id == obj.mb_releasetrackid), None
+        )
+    return None if info is None else (info, album_info)
+
+
+def store_changes(lib: Library, kind: str, changes: List[Tuple[int, Edits]]) -> None:
+    """Apply changes to objects in the library, storing them in batches."""
+    get = lib.get_album if kind == "album" else lib.get_item
+    for start in range(0, len(changes), BATCH_SIZE):
+        with lib.transaction():
+            for obj_id, edits in changes[start : start + BATCH_SIZE]:
+                obj = get(obj_id)
+                apply_edits(obj, edits)
+                obj.store()
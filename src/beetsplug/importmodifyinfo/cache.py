@@ -0,0 +1,163 @@
+"""Caching of rule results for the importmodifyinfo plugin."""
+
+from collections import OrderedDict
+from typing import Any
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.autotag.hooks import TrackInfo
+from beets.dbcore import Model  # type: ignore
+
+
+class Delete:
+    """The type of `DELETE`, which is pickled by reference to keep its identity."""
+
+    def __repr__(self) -> str:
+        """Return the name of the sentinel."""
+        return "DELETE"
+
+    def __reduce__(self) -> str:
+        """Pickle the sentinel as a reference to the module's global."""
+        return "DELETE"
+
+
+# Sentinel value of an edit which deletes its field.
+DELETE = Delete()
+
+# The field edits made by applying rules, in order.
+Edit = Tuple[str, Any]
+Edits = List[Edit]
+
+Info = Union[AlbumInfo, TrackInfo]
+
+
+class Change(NamedTuple):
+    """A change to a field's value, either of which may be `DELETE`."""
+
+    field: str
+    old: Any
+    new: Any
+
+
+Changes = List[Change]
+
+
+class CacheInfo(NamedTuple):
+    """Statistics for a rule result cache."""
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class RuleCache:
+    """A bounded LRU cache of the edits rules made to info.
+
+    Entries are keyed by the values of the fields the rules read, or of
+    every field when those can't be determined, so info which looks the
+    same to the rules has the same edits replayed rather than recomputed.
+
+    The cache may be used by several threads at once without a lock. An
+    entry evicted by another thread is simply missed, and the statistics
+    may miss a few counts.
+    """
+
+    def __init__(self, maxsize: int, fields: Optional[Iterable[str]]) -> None:
+        self.maxsize = maxsize
+        self.fields = None if fields is None else sorted(fields)
+        self.entries: OrderedDict[Hashable, Edits] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, info: Info, obj: Model) -> Hashable:
+        """Return the cache key for info and its object's current values."""
+        return fingerprint(obj, self.fields)
+
+    def get(self, key: Hashable) -> Optional[Edits]:
+        """Return the edits cached for a key, if any."""
+        try:
+            edits = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            # Evicted by another thread since it was read.
+            pass
+        return edits
+
+    def put(self, key: Hashable, edits: Edits) -> None:
+        """Cache the edits for a key, evicting the least recently used."""
+        self.entries[key] = [(field, copy_value(value)) for field, value in edits]
+        try:
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        except KeyError:
+            # Evicted by another thread, which also kept the cache bounded.
+            pass
+
+    def clear(self) -> None:
+        """Remove every entry and reset the statistics."""
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def info(self) -> CacheInfo:
+        """Return the cache's statistics."""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+
+def fingerprint(obj: Model, fields: Optional[List[str]]) -> Hashable:
+    """Return the values of an object's fields, or of every field if None."""
+    if fields is None:
+        fields = sorted(obj.keys())
+    return tuple((field, freeze(obj.get(field))) for field in fields)
+
+
+def freeze(value: Any) -> Hashable:
+    """Return a hashable equivalent of a field value."""
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value  # type: ignore
+
+
+def copy_value(value: Any) -> Any:
+    """Copy a mutable field value, so edits don't share it."""
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+def replay_edits(info: Info, edits: Edits) -> None:
+    """Apply previously recorded edits to info."""
+    for field, value in edits:
+        if value is DELETE:
+            info.pop(field, None)
+        else:
+            info[field] = copy_value(value)
+
+
+def apply_edits(obj: Model, edits: Edits) -> None:
+    """Apply edits to a model, deleting fields by setting fixed ones to null."""
+    for field, value in edits:
+        if value is DELETE:
+            try:
+                del obj[field]
+            except KeyError:
+                pass
+        else:
+            obj[field] = copy_value(value)
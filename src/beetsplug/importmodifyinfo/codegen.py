@@ -0,0 +1,174 @@
+"""Compilation of rules into generated Python code for the importmodifyinfo plugin."""
+
+import unicodedata
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Set
+from typing import Type
+
+from beets.dbcore import Model  # type: ignore
+from beets.dbcore.query import AndQuery  # type: ignore
+from beets.dbcore.query import BooleanQuery
+from beets.dbcore.query import FalseQuery
+from beets.dbcore.query import MatchQuery
+from beets.dbcore.query import NoneQuery
+from beets.dbcore.query import NotQuery
+from beets.dbcore.query import NumericQuery
+from beets.dbcore.query import OrQuery
+from beets.dbcore.query import RegexpQuery
+from beets.dbcore.query import StringQuery
+from beets.dbcore.query import SubstringQuery
+from beets.dbcore.query import TrueQuery
+from beets.util import as_string  # type: ignore
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .engine import Rules
+
+
+# Sentinel for a flexible field with no value.
+MISSING = object()
+
+# A compiled rule set, called with an object and a function to apply the
+# rule at a position to it, for each rule whose query matches in turn.
+Program = Callable[[Model, Callable[[int], Any]], None]
+
+
+class RuleCompiler:
+    """Generate the source of a single function which processes a rule set.
+
+    Each rule becomes an `if` statement testing its query against the
+    object, with exact, case-insensitive, substring, regular expression
+    and null comparisons inlined and their patterns prepared up front.
+    Other queries fall back to calling their own `match` method. Field
+    values are read once into local variables, and read again only after
+    a matching rule modifies them.
+    """
+
+    def __init__(self, rules: "Rules", model_cls: Type[Model]) -> None:
+        self.rules = rules
+        self.getters: Set[str] = set(model_cls._getters())
+        self.fixed: Set[str] = set(model_cls._fields)
+        self.namespace: Dict[str, Any] = {
+            "as_string": as_string,
+            "normalize": unicodedata.normalize,
+            "MISSING": MISSING,
+        }
+        self.variables: Dict[str, str] = {}
+        self.loads: List[str] = []
+        self.lines: List[str] = ["def process(obj, apply):", "    get = obj.get"]
+
+    def compile(self) -> Program:
+        """Return the generated function."""
+        for position, rule in enumerate(self.rules):
+            self.loads = []
+            condition = self.expression(rule.query)
+            self.lines.extend(self.loads)
+            self.lines.append(f"    if {condition}:")
+            self.lines.append(f"        apply({position})")
+            modified = {field for field, _, _ in rule.mods}
+            for field in sorted(modified & set(self.variables)):
+                self.lines.append(f"        {self.variables[field]} = get({field!r})")
+        self.lines.append("    return None")
+
+        source = "\n".join(self.lines) + "\n"
+        code = compile(source, "<importmodifyinfo rules>", "exec")
+        exec(code, self.namespace)  # noqa: S102
+        process: Program = self.namespace["process"]
+        process.source = source  # type: ignore
+        return process
+
+    def constant(self, value: Any) -> str:
+        """Return the name of a new global bound to a value."""
+        name = f"c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def value(self, field: str) -> str:
+        """Return an expression for the value of a field.
+
+        Values other than computed fields are read into a variable before
+        the rule being compiled, unless an earlier rule already read them.
+        """
+        if field in self.getters:
+            return f"get({field!r})"
+        elif field not in self.variables:
+            self.variables[field] = f"v{len(self.variables)}"
+            self.loads.append(f"    {self.variables[field]} = get({field!r})")
+        return self.variables[field]
+
+    def expression(self, query: Any) -> str:
+        """Return an expression which tests a query against `obj`."""
+        kind = type(query)
+        if kind is AndQuery:
+            if not query.subqueries:
+                return "True"
+            elif len(query.subqueries) == 1:
+                return self.expression(query.subqueries[0])
+            return " and ".join(f"({self.expression(q)})" for q in query.subqueries)
+        elif kind is OrQuery:
+            if not query.subqueries:
+                return "False"
+            return " or ".join(f"({self.expression(q)})" for q in query.subqueries)
+        elif kind is NotQuery:
+            return f"not ({self.expression(query.subquery)})"
+        elif kind is TrueQuery:
+            return "True"
+        elif kind is FalseQuery:
+            return "False"
+        else:
+            return self.field_expression(query)
+
+    def field_expression(self, query: Any) -> str:
+        """Return an expression which tests a field query against `obj`."""
+        kind = type(query)
+        if kind in (MatchQuery, BooleanQuery):
+            return f"{self.value(query.field)} == {self.constant(query.pattern)}"
+        elif kind is StringQuery:
+            pattern = self.constant(query.pattern.lower())
+            return f"as_string({self.value(query.field)}).lower() == {pattern}"
+        elif kind is SubstringQuery:
+            pattern = self.constant(query.pattern.lower())
+            return f"{pattern} in as_string({self.value(query.field)}).lower()"
+        elif kind is RegexpQuery:
+            search = self.constant(query.pattern.search)
+            value = f"normalize('NFC', as_string({self.value(query.field)}))"
+            return f"{search}({value}) is not None"
+        elif kind is NoneQuery:
+            return f"{self.value(query.field)} is None"
+        elif kind is NumericQuery:
+            if query.field in self.fixed or query.field in self.getters:
+                value = self.value(query.field)
+            else:
+                # Only flexible fields may be absent, which never matches.
+                value = f"get({query.field!r}, MISSING)"
+            return f"{self.constant(numeric_match(query))}({value})"
+        else:
+            return f"{self.constant(query.match)}(obj)"
+
+
+def numeric_match(query: NumericQuery) -> Callable[[Any], bool]:
+    """Return a function testing a field's value against a numeric query."""
+    point, rangemin, rangemax = query.point, query.rangemin, query.rangemax
+
+    def match(value: Any) -> bool:
+        if value is MISSING:
+            return False
+        elif isinstance(value, str):
+            value = query._convert(value)
+
+        if point is not None:
+            return bool(value == point)
+        return (rangemin is None or value >= rangemin) and (
+            rangemax is None or value <= rangemax
+        )
+
+    return match
+
+
+def compile_rules(rules: "Rules", model_cls: Type[Model]) -> Program:
+    """Compile a rule set into a single generated function."""
+    return RuleCompiler(rules, model_cls).compile()
@@ -0,0 +1,717 @@
+"""The rule engine of the importmodifyinfo plugin.
+
+Rules are parsed from modify entries, as given to `beet modify`, and
+applied to album or track info from the importer. This is independent of
+the plugin's configuration and events, so other plugins and scripts can
+apply the same rules directly:
+
+    ruleset = RuleSet.compile(["albumtype:ep albumtypes=ep"], Album)
+    for info in infos:
+        ruleset.apply(info)
+
+Rule sets may be applied by several threads at once, and from asyncio
+code in a thread pool:
+
+    edits = await ruleset.apply_async(info)
+"""
+
+import shlex
+import time
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+from typing import Type
+from typing import Union
+
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.autotag.hooks import TrackInfo
+from beets.dbcore import Model  # type: ignore
+from beets.dbcore import Query
+from beets.library import Album  # type: ignore
+from beets.library import Item
+from beets.library import parse_query_parts
+from beets.ui import UserError  # type: ignore
+from beets.ui import decargs
+from beets.ui.commands import modify_parse_args  # type: ignore
+from beets.util import as_string  # type: ignore
+from beets.util import functemplate
+
+from .analysis import PURE_FUNCTIONS
+from .analysis import DependencyGraph
+from .analysis import field_conditions
+from .analysis import query_fields
+from .analysis import template_fields
+from .cache import DELETE
+from .cache import Edits
+from .cache import Info
+from .cache import RuleCache
+from .cache import replay_edits
+from .codegen import Program
+from .codegen import compile_rules
+from .index import RuleIndex
+from .infomodel import AlbumInfoModel
+from .infomodel import InfoModel
+from .infomodel import TrackInfoModel
+from .stats import InstrumentedQuery
+from .stats import Stats
+from .store import PersistentCache
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from concurrent.futures import Executor
+
+
+Mods = Dict[str, str]
+Dels = List[str]
+
+# A compiled modification: the field it assigns, a template or a literal
+# value already parsed for the field, and for a template, the function
+# parsing its rendered value for the field.
+Mod = Tuple[str, Any, Optional[Callable[[str], Any]]]
+
+# Matches of rules shared between objects, by position, None if untested.
+SharedMatches = Dict[int, Optional[bool]]
+
+# Characters which introduce a template symbol or function call.
+TEMPLATE_CHARS = ("$", "%")
+
+# The field rule sets are partitioned by, naming the info's metadata source.
+PARTITION_FIELD = "data_source"
+
+# Fields whose formatted values fall back to each other when empty.
+FALLBACK_FIELDS = frozenset({"artist", "albumartist"})
+
+
+class Rule:
+    """A modify rule, with its query parsed and its templates compiled.
+
+    Rules live as long as the plugin, and there may be thousands of them,
+    so they have slots rather than a dictionary each, and hold their mods
+    and dels as tuples.
+    """
+
+    __slots__ = ("dels", "modify", "mods", "query")
+
+    def __init__(
+        self,
+        modify: str,
+        query: Query,
+        mods: Tuple[Mod, ...],
+        dels: Tuple[str, ...],
+    ) -> None:
+        self.modify = modify
+        self.query = query
+        self.mods = mods
+        self.dels = dels
+
+    def __repr__(self) -> str:
+        """Return a representation of the rule, by its entry."""
+        return f"Rule({self.modify!r})"
+
+
+Rules = List[Rule]
+
+
+class LazyTemplate(functemplate.Template):  # type: ignore
+    """A template which is only parsed and compiled when first needed.
+
+    Compiling a template takes far longer than parsing the rest of its
+    rule, and most templates are never evaluated in a run, so they are
+    compiled when first evaluated instead. Pickling only keeps the source.
+
+    The fields the template reads are also found when first needed, as
+    `fields`, or None if they can't be determined.
+    """
+
+    def __init__(self, template: str) -> None:
+        self.original = template
+
+    def __getattr__(self, name: str) -> Any:
+        """Parse or compile the template on first use of either."""
+        if name == "expr":
+            self.expr = functemplate._parse(self.original)
+            return self.expr
+        elif name == "compiled":
+            self.compiled = self.translate()
+            return self.compiled
+        elif name == "fields":
+            fields = template_fields(self)
+            self.fields = None if fields is None else tuple(sorted(fields))
+            return self.fields
+        raise AttributeError(name)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        """Reduce the template to its source."""
+        return LazyTemplate, (self.original,)
+
+
+# A cache of rule results, such as a `RuleCache` or `PersistentCache`.
+ResultCache = Union[RuleCache, PersistentCache]
+
+
+class RuleSet:
+    """A list of rules for albums or tracks, ready to apply to info.
+
+    The rules are indexed, analysed and optionally compiled to Python code
+    when the rule set is created, and applied in order to each album or
+    track info given, as on import. Results are looked up in the given
+    caches first, and stored in each which didn't have them.
+
+    If some rules only match info from certain metadata sources, such as
+    those whose query includes `data_source:Discogs`, the rule set is
+    partitioned by data source. The rules for each data source, without
+    those which can't match it, make a rule set of their own, built when
+    info from that source is first seen, and each info is then processed
+    by its source's rule set, found with a single lookup.
+    """
+
+    def __init__(
+        self,
+        rules: Rules,
+        model_cls: Type[Model],
+        compiled: bool = False,
+        stats: Optional[Stats] = None,
+        caches: Sequence[ResultCache] = (),
+        partitioned: bool = True,
+    ) -> None:
+        self.model_cls = model_cls
+        self.kind = "album" if issubclass(model_cls, Album) else "track"
+        self.modifies = [rule.modify for rule in rules]
+        self.index = RuleIndex(rules)
+        self.graph = DependencyGraph(rules, model_cls)
+        self.query_fields = [query_fields(rule.query) for rule in rules]
+        self.written_fields = {field for rule in rules for field, _, _ in rule.mods}
+
+        # The conditions of each rule on the data source, if partitioned,
+        # and the rule sets of the data sources seen so far.
+        self.conditions = (
+            field_conditions(rules, PARTITION_FIELD) if partitioned else None
+        )
+        self.partitions: Dict[Any, RuleSet] = {}
+        self.parsed_rules = rules
+        self.compiled = compiled
+        self.stats = stats
+
+        if stats is not None:
+            # Instrument the rules only after analysing their queries.
+            rules = instrument(rules, self.kind, stats)
+        self.rules = rules
+        # Partitioned rules are only run by the rule sets of their partitions.
+        self.program = (
+            compile_rules(rules, model_cls)
+            if compiled and self.conditions is None
+            else None
+        )
+
+        self.caches = list(caches)
+        self.cache: Optional[RuleCache] = next(
+            (cache for cache in caches if isinstance(cache, RuleCache)), None
+        )
+
+    @classmethod
+    def compile(
+        cls,
+        modifies: List[str],
+        model_cls: Type[Model],
+        compiled: bool = False,
+        context: str = "rules",
+    ) -> "RuleSet":
+        """Parse modify entries into a rule set for `Album` or `Item` info.
+
+        If compiled is set, the rules are compiled to Python code rather
+        than interpreted. Errors in the entries are reported with context.
+        """
+        return cls(parse_rules(modifies, model_cls, context), model_cls, compiled)
+
+    def model(self, info: Info, album_info: Optional[AlbumInfo] = None) -> InfoModel:
+        """Return a model of info for the rules to match against.
+
+        A track's model falls back to its album info, if given, for fields
+        it has no value for.
+        """
+        if self.kind == "album":
+            return AlbumInfoModel(info)
+        return TrackInfoModel(info, album_info)
+
+    def apply(self, info: Info) -> Edits:
+        """Apply the rules to album or track info, returning the edits made."""
+        return self.run(info, self.model(info))
+
+    def apply_many(
+        self, infos: Iterable[Info], album_info: Optional[AlbumInfo] = None
+    ) -> List[Edits]:
+        """Apply the rules to each of several infos, returning their edits.
+
+        If album info is given for the tracks of an album, they fall back to
+        it for fields they have no value for, and rules whose queries only
+        read such fields are only tested once for all of them.
+        """
+        infos = list(infos)
+        if self.kind == "album" or album_info is None:
+            return [self.apply(info) for info in infos]
+
+        items = [TrackInfoModel(info, album_info) for info in infos]
+        partitions = [self.partition(item) for item in items]
+        shared_matches: Dict[int, SharedMatches] = {}
+        for partition in partitions:
+            if id(partition) not in shared_matches:
+                partition_items = [
+                    item for i, item in enumerate(items) if partitions[i] is partition
+                ]
+                shared_matches[id(partition)] = dict.fromkeys(
+                    partition.album_level_rules(partition_items)
+                )
+        return [
+            self.run(info, items[i], shared_matches[id(partitions[i])])
+            for i, info in enumerate(infos)
+        ]
+
+    async def apply_async(
+        self, info: Info, executor: Optional["Executor"] = None
+    ) -> Edits:
+        """Apply the rules to info in a thread, returning the edits made.
+
+        The rules are applied by the executor, or by the event loop's
+        default executor, so the event loop isn't blocked while templates
+        are rendered.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.apply, info)
+
+    async def apply_many_async(
+        self,
+        infos: Iterable[Info],
+        album_info: Optional[AlbumInfo] = None,
+        executor: Optional["Executor"] = None,
+    ) -> List[Edits]:
+        """Apply the rules to each of several infos in a thread, as a batch.
+
+        This is `apply_many`, run by the executor as for `apply_async`.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, self.apply_many, list(infos), album_info
+        )
+
+    def partition(self, obj: Union[Item, Album]) -> "RuleSet":
+        """Return the rule set for an object's data source.
+
+        This is the rule set itself, unless it is partitioned.
+        """
+        if self.conditions is None:
+            return self
+
+        source = obj.get(PARTITION_FIELD)
+        ruleset = self.partitions.get(source)
+        if ruleset is None:
+            ruleset = self.partitions.setdefault(source, self.build_partition(source))
+        return ruleset
+
+    def build_partition(self, source: Any) -> "RuleSet":
+        """Build the rule set of the rules which may match a data source."""
+        probe = self.model_cls()
+        if source is not None:
+            probe[PARTITION_FIELD] = source
+        conditions = self.conditions or []
+        rules = [
+            rule
+            for position, rule in enumerate(self.parsed_rules)
+            if all(condition.match(probe) for condition in conditions[position])
+        ]
+        return RuleSet(
+            rules, self.model_cls, self.compiled, self.stats, partitioned=False
+        )
+
+    def album_level_rules(self, items: Sequence[TrackInfoModel]) -> Set[int]:
+        """Return the positions of track rules which only read album fields."""
+        excluded = self.written_fields.union(Item._getters())
+        positions = set()
+        for position, fields in enumerate(self.query_fields):
+            if fields is None or not fields.isdisjoint(excluded):
+                continue
+            if not any(item.provides(field) for item in items for field in fields):
+                positions.add(position)
+        return positions
+
+    def run(
+        self,
+        info: Info,
+        obj: Union[Item, Album],
+        shared_matches: Optional[SharedMatches] = None,
+    ) -> Edits:
+        """Apply the rules for info on its object, replaying cached edits.
+
+        The caches are consulted in order, and the edits are stored in each
+        cache which didn't have them.
+        """
+        missed = []
+        for cache in self.caches:
+            key = cache.key(info, obj)
+            edits = cache.get(key)
+            if edits is not None:
+                replay_edits(info, edits)
+                break
+            missed.append((cache, key))
+        else:
+            edits = self.process(info, obj, shared_matches)
+
+        for cache, key in missed:
+            cache.put(key, edits)
+        return edits
+
+    def process(
+        self,
+        info: Info,
+        obj: Union[Item, Album],
+        shared_matches: Optional[SharedMatches] = None,
+        dry_run: bool = False,
+    ) -> Edits:
+        """Apply the rules for info on its object, without any caches.
+
+        Shared matches are by position in the rule set for the object's
+        data source, if partitioned.
+        """
+        ruleset = self.partition(obj)
+        return process_rules(
+            ruleset.rules,
+            info,
+            obj,
+            ruleset.index,
+            shared_matches,
+            ruleset.program,
+            ruleset.graph,
+            dry_run,
+        )
+
+
+def parse_modify(modify: str) -> Tuple[List[str], Mods, Dels]:
+    """Parse modify string into query, mods, and dels."""
+    modify = as_string(modify)
+    args = shlex.split(modify)
+    query, mods, dels = modify_parse_args(decargs(args))
+    return query, mods, dels
+
+
+def parse_rules(
+    modifies: List[str],
+    model_cls: Type[Model],
+    context: str = "rules",
+    previous: Optional[Mapping[str, Rule]] = None,
+) -> Rules:
+    """Parse modify entries into rules, reusing those already parsed."""
+    parsed: Dict[str, Rule] = dict(previous or {})
+    rules = []
+    for modify in modifies:
+        rule = parsed.get(modify)
+        if rule is None:
+            rule = parsed[modify] = parse_rule(modify, model_cls, context)
+        rules.append(rule)
+    return rules
+
+
+def parse_rule(modify: str, model_cls: Type[Model], context: str = "rules") -> Rule:
+    """Parse a modify entry into a rule."""
+    query, mods, dels = parse_modify(modify)
+    if not query:
+        raise UserError(f"{context}: no query found in entry {modify}")
+    elif not mods and not dels:
+        raise UserError(f"{context}: no mods found in entry {modify}")
+    dbquery, _ = parse_query_parts(query, model_cls)
+    return Rule(modify, dbquery, compile_mods(mods, model_cls), tuple(dels))
+
+
+def compile_mods(mods: Mods, model_cls: Type[Model]) -> Tuple[Mod, ...]:
+    """Compile mod values, parsing literal values up front."""
+    compiled: List[Mod] = []
+    for key, value in mods.items():
+        if any(c in value for c in TEMPLATE_CHARS):
+            parse = model_cls._type(key).parse
+            compiled.append((key, LazyTemplate(value), parse))
+        else:
+            compiled.append((key, model_cls._parse(key, value), None))
+    return tuple(compiled)
+
+
+def instrument(rules: Rules, kind: str, stats: Stats) -> Rules:
+    """Return rules whose queries record their statistics."""
+    return [
+        Rule(
+            rule.modify,
+            InstrumentedQuery(rule.query, stats.rule(kind, rule.modify)),
+            rule.mods,
+            rule.dels,
+        )
+        for rule in rules
+    ]
+
+
+def process_rules(
+    rules: Rules,
+    info: Info,
+    obj: Union[Item, Album],
+    index: Optional[RuleIndex] = None,
+    shared_matches: Optional[SharedMatches] = None,
+    program: Optional[Program] = None,
+    graph: Optional[DependencyGraph] = None,
+    dry_run: bool = False,
+) -> Edits:
+    """Process rules for info on an object, returning the edits made.
+
+    If an index is supplied, only the rules it selects as candidates
+    are tested, in configuration order. The candidates are selected
+    again whenever a rule modifies an indexed field, so later rules
+    can still match the modified values.
+
+    If shared matches are supplied, the query of a rule at any position
+    among its keys is only tested once, and its result is reused for
+    every object processed with the same shared matches.
+
+    If a dependency graph of the rules is supplied, groups of rules
+    which it determines can't match the object are skipped.
+
+    If a program compiled from the rules is supplied, it is run in
+    place of testing each rule, and the index, shared matches and
+    dependency graph are not used.
+
+    In a dry run, the edits are only recorded, and the info is left
+    unchanged. Modifications are still made to the object, so later
+    rules match against them as usual.
+    """
+    edits: Edits = []
+    target = None if dry_run else info
+    context = TemplateContext(obj)
+
+    def apply(position: int) -> Dict[str, Any]:
+        rule = rules[position]
+        obj_mods = apply_rule(rule, target, obj, context)
+        edits.extend((field, DELETE) for field in rule.dels)
+        values = obj if dry_run else info
+        edits.extend((field, values[field]) for field in obj_mods)
+        return obj_mods
+
+    if program is not None:
+        program(obj, apply)
+        return edits
+
+    skipped = graph.skipped(obj) if graph is not None else None
+
+    def select(start: int) -> List[int]:
+        if index is None:
+            positions = list(range(start, len(rules)))
+        else:
+            positions = index.candidates(obj, start)
+        if skipped:
+            positions = [p for p in positions if p not in skipped]
+        return positions
+
+    positions = select(0)
+    i = 0
+    while i < len(positions):
+        position = positions[i]
+        i += 1
+        if match_rule(rules[position], position, obj, shared_matches):
+            obj_mods = apply(position)
+            if index is not None and not index.fields.isdisjoint(obj_mods):
+                positions = select(position + 1)
+                i = 0
+    return edits
+
+
+def match_rule(
+    rule: Rule,
+    position: int,
+    obj: Union[Item, Album],
+    shared_matches: Optional[SharedMatches] = None,
+) -> bool:
+    """Test a rule's query, reusing a shared result where there is one."""
+    if shared_matches is None or position not in shared_matches:
+        return bool(rule.query.match(obj))
+
+    matched = shared_matches[position]
+    if matched is None:
+        matched = shared_matches[position] = bool(rule.query.match(obj))
+    return matched
+
+
+def apply_rule(
+    rule: Rule,
+    info: Optional[Union[TrackInfo, AlbumInfo]],
+    obj: Union[Item, Album],
+    context: "TemplateContext",
+) -> Dict[str, Any]:
+    """Apply a matching rule to info and its object, returning the mods.
+
+    If info is None, the rule is only applied to the object. Templates are
+    evaluated in the object's context.
+    """
+    if isinstance(rule.query, InstrumentedQuery):
+        stats = rule.query.stats
+        start = time.perf_counter()
+        obj_mods = evaluate_mods(rule.mods, obj, context)
+        rendered = time.perf_counter()
+        assign_mods(rule, info, obj, obj_mods)
+        context.invalidate(obj_mods)
+        stats.render_time += rendered - start
+        stats.assign_time += time.perf_counter() - rendered
+        return obj_mods
+
+    # Evaluate every mod before assigning any, so all values are
+    # rendered against the object as it was when this rule matched.
+    obj_mods = evaluate_mods(rule.mods, obj, context)
+    assign_mods(rule, info, obj, obj_mods)
+    context.invalidate(obj_mods)
+    return obj_mods
+
+
+def assign_mods(
+    rule: Rule,
+    info: Optional[Union[TrackInfo, AlbumInfo]],
+    obj: Union[Item, Album],
+    obj_mods: Dict[str, Any],
+) -> None:
+    """Apply a rule's dels and evaluated mods to info and its object.
+
+    If info is None, only the mods are assigned to the object.
+    """
+    if info is not None:
+        if isinstance(obj, InfoModel):
+            # The object is read from the info, so keep the values it had
+            # for later rules to match against, as a copy would.
+            obj.retain(rule.dels)
+        for field in rule.dels:
+            try:
+                del info[field]
+            except KeyError:
+                pass
+
+    for field, value in obj_mods.items():
+        # Indirect to deal with type conversions, and allow for later
+        # rules to match the modified values.
+        obj[field] = value
+        if info is not None:
+            info[field] = obj[field]
+
+
+def evaluate_mods(
+    mods: Tuple[Mod, ...],
+    obj: Union[Item, Album],
+    context: "TemplateContext",
+) -> Dict[str, Any]:
+    """Evaluate compiled mods against an object, in its context."""
+    return {
+        key: value if parse is None else parse(render(value, obj, context))
+        for key, value, parse in mods
+    }
+
+
+def render(
+    template: functemplate.Template,
+    obj: Union[Item, Album],
+    context: Optional["TemplateContext"] = None,
+) -> str:
+    """Evaluate a template against an object, formatting only what it reads.
+
+    `evaluate_template` lists every field of the object for the template,
+    which for a model of info means reading every field of the info. Only
+    the fields the template reads which the object has are listed here.
+    Objects in a library, whose items also list their album's fields, and
+    templates whose fields can't be determined use every field instead.
+
+    Values and function results are shared with other templates evaluated
+    in the same context, if given.
+    """
+    if context is None:
+        context = TemplateContext(obj)
+    fields = template.fields if isinstance(template, LazyTemplate) else None
+    if fields is None or obj._db is not None:
+        rendered: str = template.substitute(obj.formatted(), context.functions())
+        return rendered
+
+    rendered = template.substitute(context.values(fields), context.functions())
+    return rendered
+
+
+class TemplateContext:
+    """The values and functions templates are evaluated with for an object.
+
+    A context lasts for the rules applied to one object, so templates
+    reading the same fields, or calling the same functions with the same
+    arguments, in many mods format or compute each only once. Formatted
+    values are kept until a rule modifies their field, while computed
+    fields, which may read any other, are kept until any field is
+    modified. Only functions whose results depend on nothing but their
+    arguments have their results kept.
+    """
+
+    def __init__(self, obj: Union[Item, Album]) -> None:
+        self.obj = obj
+        # Formatted values by field, None for fields the object doesn't have.
+        self.formatted: Dict[str, Optional[str]] = {}
+        self.computed: Set[str] = set()
+        self.template_funcs: Optional[Dict[str, Callable[..., Any]]] = None
+
+    def values(self, fields: Sequence[str]) -> Dict[str, str]:
+        """Return the formatted values of those fields the object has."""
+        if any(field not in self.formatted for field in fields):
+            obj = self.obj
+            keys = [f for f in fields if f in obj._fields or f in obj._values_flex]
+            if len(keys) < len(fields):
+                getters = obj._getters()
+                computed = [f for f in fields if f in getters and f not in keys]
+                self.computed.update(computed)
+                keys.extend(computed)
+            # Every key is included, as fallbacks read other fields.
+            mapping = obj.formatted(included_keys=keys)
+            for field in fields:
+                if field not in self.formatted:
+                    self.formatted[field] = mapping[field] if field in keys else None
+        values = {}
+        for field in fields:
+            value = self.formatted[field]
+            if value is not None:
+                values[field] = value
+        return values
+
+    def functions(self) -> Dict[str, Callable[..., Any]]:
+        """Return the template functions, keeping the results of pure ones."""
+        if self.template_funcs is None:
+            functions = self.obj._template_funcs()
+            for name in PURE_FUNCTIONS.intersection(functions):
+                functions[name] = memoize(functions[name])
+            self.template_funcs = functions
+        return self.template_funcs
+
+    def invalidate(self, fields: Iterable[str]) -> None:
+        """Forget the formatted values which modifying fields may change."""
+        fields = set(fields)
+        if not fields:
+            return
+        if not fields.isdisjoint(FALLBACK_FIELDS):
+            fields |= FALLBACK_FIELDS
+        for field in fields | self.computed:
+            self.formatted.pop(field, None)
+        self.computed.clear()
+
+
+def memoize(function: Callable[..., Any]) -> Callable[..., Any]:
+    """Return a function keeping the results of another by its arguments."""
+    results: Dict[Tuple[Any, ...], Any] = {}
+
+    def memoized(*args: Any) -> Any:
+        if args not in results:
+            results[args] = function(*args)
+        return results[args]
+
+    return memoized
@@ -0,0 +1,111 @@
+"""Field-indexed rule dispatch for the importmodifyinfo plugin."""
+
+from collections import defaultdict
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import DefaultDict
+from typing import Hashable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+
+from beets.dbcore import Model  # type: ignore
+from beets.dbcore.query import AndQuery  # type: ignore
+from beets.dbcore.query import FieldQuery
+from beets.dbcore.query import MatchQuery
+from beets.dbcore.query import RegexpQuery
+from beets.dbcore.query import StringQuery
+from beets.dbcore.query import SubstringQuery
+from beets.util import as_string  # type: ignore
+
+from .matchers import RegexpMatcher
+from .matchers import SubstringMatcher
+from .matchers import combinable
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .engine import Rules
+
+
+Buckets = DefaultDict[str, DefaultDict[Hashable, List[int]]]
+
+
+class RuleIndex:
+    """Index rules by the exact field values their queries require.
+
+    Rules whose query is a conjunction including an exact (`field:=value`)
+    or case-insensitive exact (`field:=~value`) match are bucketed by that
+    field and value, so only rules whose bucket matches the object's
+    current value need their queries tested. Rules matching a substring
+    (`field:value`) or regular expression (`field::value`) instead are
+    combined into a matcher for each field, which finds every rule whose
+    pattern the object's current value matches in a single scan. All other
+    rules are kept in a fallback list and are always tested.
+    """
+
+    def __init__(self, rules: "Rules") -> None:
+        self.exact: Buckets = defaultdict(lambda: defaultdict(list))
+        self.folded: Buckets = defaultdict(lambda: defaultdict(list))
+        self.substrings: DefaultDict[str, SubstringMatcher] = defaultdict(
+            SubstringMatcher
+        )
+        self.regexps: DefaultDict[str, RegexpMatcher] = defaultdict(RegexpMatcher)
+        self.fallback: List[int] = []
+        self.keys: List[Optional[FieldQuery]] = []
+
+        for position, rule in enumerate(rules):
+            key = index_key(rule.query)
+            self.keys.append(key)
+            if key is None:
+                self.fallback.append(position)
+            elif isinstance(key, StringQuery):
+                self.folded[key.field][key.pattern.lower()].append(position)
+            elif isinstance(key, SubstringQuery):
+                self.substrings[key.field].add(key.pattern, position)
+            elif isinstance(key, RegexpQuery):
+                self.regexps[key.field].add(key.pattern, position)
+            else:
+                self.exact[key.field][key.pattern].append(position)
+
+        self.fields: Set[str] = set(self.exact) | set(self.folded)
+        self.fields.update(self.substrings, self.regexps)
+
+    def candidates(self, obj: Model, start: int = 0) -> List[int]:
+        """Return the positions of rules from `start` which may match `obj`."""
+        runs: List[Sequence[int]] = [self.fallback]
+        for field, buckets in self.exact.items():
+            try:
+                runs.append(buckets.get(obj.get(field), ()))
+            except TypeError:
+                # Unhashable values can never equal a query pattern.
+                pass
+        for field, buckets in self.folded.items():
+            runs.append(buckets.get(as_string(obj.get(field)).lower(), ()))
+        for matchers in (self.substrings, self.regexps):
+            for field, matcher in matchers.items():
+                runs.append(matcher.match(obj.get(field)))
+
+        # Each run is already sorted, so this sort is close to linear.
+        return sorted(pos for run in runs for pos in run if pos >= start)
+
+
+def index_key(query: Any) -> Optional[FieldQuery]:
+    """Return the subquery of a rule's query to index it by, if any.
+
+    Exact matches are preferred, as they select the fewest candidates.
+    """
+    if type(query) is not AndQuery:
+        return None
+
+    indexable: Tuple[type, ...] = (MatchQuery, StringQuery)
+    for subquery in query.subqueries:
+        if type(subquery) in indexable:
+            return subquery
+    for subquery in query.subqueries:
+        if type(subquery) is SubstringQuery or (
+            type(subquery) is RegexpQuery and combinable(subquery.pattern)
+        ):
+            return subquery
+    return None
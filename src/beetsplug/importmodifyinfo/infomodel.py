@@ -0,0 +1,248 @@
+"""Model views over importer information for the importmodifyinfo plugin."""
+
+from typing import Any
+from typing import ClassVar
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+from beets.autotag import SPECIAL_FIELDS  # type: ignore
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.autotag.hooks import TrackInfo
+from beets.library import Album  # type: ignore
+from beets.library import Item
+
+
+Info = Union[AlbumInfo, TrackInfo]
+
+# Sentinel for a field with no value in the info.
+MISSING = object()
+
+
+class InfoValues:
+    """A model's fixed or flexible values, read from info on demand.
+
+    This stands in for the model's own value storage, deriving each value
+    from the info the same way the importer would when copying it into a
+    new model. Values
+    are converted for their field when first read, and assignments are
+    kept here rather than being written to the info.
+    """
+
+    def __init__(self, model: Any, info: Info, fixed: bool) -> None:
+        self.model = model
+        self.fixed = fixed
+        self.values: Dict[str, Any] = {}
+
+    def _load(self, key: str) -> Any:
+        if (key in self.model._fields) != self.fixed:
+            value = MISSING
+        else:
+            value = self.model._info_value(key)
+            if value is not MISSING:
+                value = self.model._type(key).normalize(value)
+        self.values[key] = value
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        """Determine whether a field has a value."""
+        try:
+            value = self.values[key]
+        except KeyError:
+            value = self._load(key)
+        return value is not MISSING
+
+    def __getitem__(self, key: str) -> Any:
+        """Get the value for a field, raising KeyError if it has none."""
+        try:
+            value = self.values[key]
+        except KeyError:
+            value = self._load(key)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        """Get the value for a field, or `default` if it has none."""
+        try:
+            value = self.values[key]
+        except KeyError:
+            value = self._load(key)
+        if value is MISSING:
+            return default
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        """Assign the value for a field."""
+        self.values[key] = value
+
+    def keys(self) -> List[str]:
+        """Return the fields which have values."""
+        candidates: Iterable[str] = self.model._info_keys()
+        keys = dict.fromkeys(candidates)
+        keys.update(dict.fromkeys(self.values))
+        return [key for key in keys if key in self]
+
+
+class InfoModel:
+    """A lightweight model backed directly by importer information.
+
+    Field values are looked up in the info only when a query or template
+    asks for them, rather than copying every field into a new model for
+    each event. Assigned values are kept by the model, as with a copy, so
+    the caller remains responsible for writing them back to the info.
+    """
+
+    # Fields set from the info even when the info has no value for them,
+    # mapped to the info field they come from.
+    explicit_fields: ClassVar[Dict[str, str]] = {}
+
+    # Fields set from the info only when it has a true value for them.
+    truthy_fields: ClassVar[Dict[str, str]] = {}
+
+    # Info fields which are not copied to the model as-is.
+    special_fields: ClassVar[Tuple[str, ...]] = ()
+
+    def __init__(self, info: Info) -> None:
+        # Deliberately skip `Model.__init__`, as there is nothing to copy.
+        self._db = None
+        self._dirty: Set[str] = set()
+        self._info = info
+        self._values_fixed = InfoValues(self, info, fixed=True)
+        self._values_flex = InfoValues(self, info, fixed=False)
+
+    def _info_value(self, key: str) -> Any:
+        """Return the info's value for a model field, or `MISSING`."""
+        if key not in self.special_fields:
+            value = self._info.get(key)
+            if value is not None:
+                return value
+
+        if key in self.explicit_fields:
+            return self._info.get(self.explicit_fields[key])
+        elif key in self.truthy_fields:
+            value = self._info.get(self.truthy_fields[key])
+            if value:
+                return value
+        return MISSING
+
+    def _info_keys(self) -> Iterable[str]:
+        """Return the model fields which may have values in the info."""
+        yield from self.explicit_fields
+        yield from self.truthy_fields
+        for key in self._info:
+            if key not in self.special_fields:
+                yield key
+
+    def retain(self, keys: Iterable[str]) -> None:
+        """Keep the current values of fields about to be removed from the info."""
+        for key in keys:
+            self._values_fixed.get(key)
+            self._values_flex.get(key)
+
+
+class AlbumInfoModel(InfoModel, Album):  # type: ignore
+    """An `Album` backed by an `AlbumInfo`."""
+
+    explicit_fields: ClassVar[Dict[str, str]] = {
+        field: field
+        for field in (
+            "artist",
+            "artists",
+            "artist_sort",
+            "artists_sort",
+            "artist_credit",
+            "artists_credit",
+            "year",
+        )
+    }
+    # The album's IDs, as set from those of its items on import.
+    truthy_fields: ClassVar[Dict[str, str]] = {
+        "mb_albumid": "album_id",
+        "mb_albumartistid": "artist_id",
+        "mb_albumartistids": "artists_ids",
+        "mb_releasegroupid": "releasegroup_id",
+    }
+    special_fields = SPECIAL_FIELDS["album"]
+
+
+class TrackInfoModel(InfoModel, Item):  # type: ignore
+    """An `Item` backed by a `TrackInfo`.
+
+    If the album the track belongs to is given, fields the track itself
+    has no value for fall back to the album's, as they would be applied to
+    the item on import.
+    """
+
+    explicit_fields: ClassVar[Dict[str, str]] = {
+        "artist": "artist",
+        "artists": "artists",
+        "artist_sort": "artist_sort",
+        "artists_sort": "artists_sort",
+        "artist_credit": "artist_credit",
+        "artists_credit": "artists_credit",
+        "title": "title",
+        "mb_trackid": "track_id",
+        "mb_releasetrackid": "release_track_id",
+    }
+    truthy_fields: ClassVar[Dict[str, str]] = {
+        "mb_artistid": "artist_id",
+        "mb_artistids": "artists_ids",
+    }
+    special_fields = SPECIAL_FIELDS["track"]
+
+    # Item fields set from the album, mapped to the album info field.
+    album_fields: ClassVar[Dict[str, str]] = {
+        "album": "album",
+        "albumartist": "artist",
+        "albumartists": "artists",
+        "albumartist_sort": "artist_sort",
+        "albumartists_sort": "artists_sort",
+        "albumartist_credit": "artist_credit",
+        "albumartists_credit": "artists_credit",
+        "mb_albumid": "album_id",
+        "mb_albumartistid": "artist_id",
+        "mb_albumartistids": "artists_ids",
+        "mb_releasegroupid": "releasegroup_id",
+        "comp": "va",
+        "disctotal": "mediums",
+        "year": "year",
+        "month": "month",
+        "day": "day",
+    }
+
+    def __init__(self, info: TrackInfo, album_info: Optional[AlbumInfo] = None):
+        super().__init__(info)
+        self._album_info = album_info
+
+    def _info_value(self, key: str) -> Any:
+        value = super()._info_value(key)
+        if value is MISSING and self._album_info is not None:
+            value = self._album_value(self._album_info, key)
+        return value
+
+    def _album_value(self, album_info: AlbumInfo, key: str) -> Any:
+        """Return the album info's value for an item field, or `MISSING`."""
+        if key in self.album_fields:
+            value = album_info.get(self.album_fields[key])
+        elif key not in SPECIAL_FIELDS["album"]:
+            value = album_info.get(key)
+        else:
+            value = None
+        return MISSING if value is None else value
+
+    def _info_keys(self) -> Iterable[str]:
+        yield from super()._info_keys()
+        if self._album_info is not None:
+            yield from self.album_fields
+            for key in self._album_info:
+                if key not in SPECIAL_FIELDS["album"]:
+                    yield key
+
+    def provides(self, key: str) -> bool:
+        """Determine whether the track itself has a value for a field."""
+        return InfoModel._info_value(self, key) is not MISSING
@@ -0,0 +1,163 @@
+"""Combined matching of many rules' patterns on a field."""
+
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Any
+from typing import DefaultDict
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Pattern
+from typing import Tuple
+
+from beets.util import as_string  # type: ignore
+
+
+# A trie of characters, with an empty key marking where a string ends.
+Trie = Dict[str, "Trie"]
+
+# A regular expression, and the nodes it combines if any.
+Node = Tuple[Pattern[str], Tuple["Node", ...]]
+
+# Number of regular expressions combined at each level of the tree.
+FANOUT = 8
+
+
+class SubstringMatcher:
+    """Find which of many substrings a value contains in a single scan.
+
+    The lowercased substrings are combined into a single regular
+    expression, structured as a trie, which captures the longest of them
+    starting at each offset of the lowercased value. Any other substring
+    starting at the same offset is a prefix of that one, so each substring
+    is mapped to the positions of its own rules and those of its prefixes,
+    giving the matches an Aho-Corasick automaton would report.
+    """
+
+    def __init__(self) -> None:
+        self.positions: DefaultDict[str, List[int]] = defaultdict(list)
+        self.pattern: Optional[Pattern[str]] = None
+        self.matches: Dict[str, List[int]] = {}
+
+    def add(self, substring: str, position: int) -> None:
+        """Add the substring of the rule at a position."""
+        self.positions[substring.lower()].append(position)
+        self.pattern = None
+
+    def compile(self) -> Pattern[str]:
+        """Combine the substrings into a single regular expression."""
+        trie: Trie = {}
+        for substring in self.positions:
+            node = trie
+            for char in substring:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        self.matches = {
+            substring: [
+                position
+                for end in range(len(substring) + 1)
+                for position in self.positions.get(substring[:end], ())
+            ]
+            for substring in self.positions
+        }
+        # Set last, as other threads match once the pattern is set.
+        self.pattern = re.compile(f"(?=({trie_pattern(trie)}))")
+        return self.pattern
+
+    def match(self, value: Any) -> List[int]:
+        """Return the positions of the rules whose substring `value` contains."""
+        pattern = self.pattern or self.compile()
+        found = set(pattern.findall(as_string(value).lower()))
+        return sorted({p for substring in found for p in self.matches[substring]})
+
+
+class RegexpMatcher:
+    """Find which of many regular expressions match a value in a few scans.
+
+    The expressions are combined into a tree of alternations, each only
+    searched for if its parent matched, so a value matching none of them
+    is rejected with a single search, and each expression it matches is
+    found with a few more. A single expression with a group for each would
+    be slower, as Python's regular expressions copy their groups when
+    backtracking. Only expressions which are `combinable` may be added.
+    """
+
+    def __init__(self) -> None:
+        self.positions: DefaultDict[str, List[int]] = defaultdict(list)
+        self.root: Optional[Node] = None
+
+    def add(self, expression: Pattern[str], position: int) -> None:
+        """Add the regular expression of the rule at a position."""
+        self.positions[expression.pattern].append(position)
+        self.root = None
+
+    def compile(self) -> "Node":
+        """Combine the regular expressions into a tree of alternations."""
+        nodes: List[Node] = [(re.compile(e), ()) for e in self.positions]
+        while len(nodes) > 1:
+            nodes = [
+                (combine(nodes[i : i + FANOUT]), tuple(nodes[i : i + FANOUT]))
+                for i in range(0, len(nodes), FANOUT)
+            ]
+        self.root = nodes[0]
+        return self.root
+
+    def match(self, value: Any) -> List[int]:
+        """Return the positions of the rules whose expression `value` matches."""
+        # Values are normalized as by `RegexpQuery`.
+        value = unicodedata.normalize("NFC", as_string(value))
+        positions = []
+        nodes = [self.root or self.compile()]
+        while nodes:
+            pattern, children = nodes.pop()
+            if pattern.search(value) is None:
+                continue
+            if children:
+                nodes.extend(children)
+            else:
+                positions.extend(self.positions[pattern.pattern])
+        return sorted(positions)
+
+
+def combine(nodes: List["Node"]) -> Pattern[str]:
+    """Return an alternation of the expressions of nodes."""
+    return re.compile("|".join(f"(?:{pattern.pattern})" for pattern, _ in nodes))
+
+
+def combinable(expression: Pattern[str]) -> bool:
+    """Return whether a regular expression can be combined with others.
+
+    Expressions with groups of their own, which may be referred to by
+    number, or with flags, which apply to the whole expression, can't be.
+    """
+    if expression.groups or expression.flags != re.UNICODE:
+        return False
+    try:
+        re.compile(f"(?:{expression.pattern})")
+    except re.error:
+        return False
+    return True
+
+
+def trie_pattern(trie: Trie) -> str:
+    """Return a regular expression matching the strings of a trie.
+
+    Where a string is a prefix of others, the longer strings are tried
+    first, so the longest string is matched.
+    """
+    branches = []
+    for char, child in sorted(trie.items()):
+        if not char:
+            continue
+        chars = [char]
+        # Follow chains of single characters without recursing.
+        while len(child) == 1 and "" not in child:
+            ((char, child),) = child.items()
+            chars.append(char)
+        branches.append(re.escape("".join(chars)) + trie_pattern(child))
+
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    return f"(?:{pattern})?" if "" in trie else pattern
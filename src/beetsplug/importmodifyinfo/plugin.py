@@ -1,33 +1,63 @@
 """ImportModifyInfo Plugin for Beets."""
 
-import shlex
+import json
+import os
+import threading
+import time
+import weakref
+from optparse import Values
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import NamedTuple
 from typing import Optional
 from typing import Tuple
 from typing import Type
 from typing import Union
 
-from beets.autotag import SPECIAL_FIELDS  # type: ignore
-from beets.autotag import apply_item_metadata
+import confuse
 from beets.autotag.hooks import AlbumInfo  # type: ignore
 from beets.autotag.hooks import TrackInfo
 from beets.dbcore import Model  # type: ignore
-from beets.dbcore import Query
 from beets.library import Album  # type: ignore
 from beets.library import Item
-from beets.library import parse_query_parts
+from beets.library import Library
 from beets.plugins import BeetsPlugin  # type: ignore
-from beets.ui import UserError  # type: ignore
+from beets.ui import Subcommand  # type: ignore
+from beets.ui import UserError
 from beets.ui import decargs
-from beets.ui.commands import modify_parse_args  # type: ignore
-from beets.util import as_string  # type: ignore
-from beets.util import functemplate
+from beets.ui import print_
+from confuse import yaml_util
 
+from .stats import RuleStats
+from .stats import Stats
 
-Mods = Dict[str, str]
-Dels = List[str]
-Rules = List[Tuple[str, Query, Mods, Dels]]
+
+if TYPE_CHECKING:  # pragma: no cover
+    from beets.importer import ImportSession  # type: ignore
+    from beets.importer import ImportTask
+
+    from .cache import CacheInfo
+    from .cache import Changes
+    from .cache import Info
+    from .cache import RuleCache
+    from .engine import Rule
+    from .engine import Rules
+    from .engine import RuleSet
+    from .precompiled import PrecompiledRules
+    from .snapshot import SnapshotStore
+    from .store import ResultStore
+    from .tables import RuleTable
+
+
+class RuleSets(NamedTuple):
+    """The album and track rule sets, which are replaced together."""
+
+    album: "RuleSet"
+    item: "RuleSet"
 
 
 class ImportModifyInfoPlugin(BeetsPlugin):  # type: ignore
@@ -36,112 +66,708 @@ class ImportModifyInfoPlugin(BeetsPlugin):  # type: ignore
     def __init__(self, name: Optional[str] = "importmodifyinfo") -> None:
         super().__init__(name)
         self.config.add(
-            {"enabled": True, "modify_trackinfo": [], "modify_albuminfo": []}
+            {
+                "enabled": True,
+                "batch_tracks": False,
+                "apply_on_choice": False,
+                "engine": "interpreted",
+                "cache_size": 0,
+                "persistent_cache": False,
+                "cache_path": "importmodifyinfo.db",
+                "stats": False,
+                "stats_path": "importmodifyinfo-stats.json",
+                "snapshots": False,
+                "snapshot_path": "importmodifyinfo-snapshots",
+                "precompiled": False,
+                "precompiled_path": "importmodifyinfo-rules.pickle",
+                "reload": False,
+                "reload_interval": 5,
+                "modify_trackinfo": [],
+                "modify_albuminfo": [],
+                "trackinfo_tables": [],
+                "albuminfo_tables": [],
+            }
+        )
+        self.rulesets: Optional[RuleSets] = None
+        # Held while building or reloading the rules, but not to use them.
+        self.lock = threading.Lock()
+        self.store: Optional[ResultStore] = None
+
+        # Parsed rules by option and entry, reused for unchanged entries.
+        self.parsed_rules: Dict[str, Dict[str, Rule]] = {}
+
+        # The entries and tables each kind's rules were built from.
+        self.rule_sources: Dict[str, Tuple[List[str], List[RuleTable]]] = {}
+
+        # Modification times of the configuration files, to reload them.
+        self.config_mtimes = {
+            filename: mtime for _, filename, mtime in self.config_files()
+        }
+        self.next_reload = 0.0
+        # Whether and how often to check them, read when the rules are built
+        # rather than on every event.
+        self.reload = False
+        self.reload_interval: float = 5
+
+        # Whether to also process the tracks of albums, read when the rules
+        # are built rather than on every event.
+        self.batch_tracks = False
+
+        # Tracks already processed, when also processing the tracks of albums.
+        self.processed_tracks: weakref.WeakValueDictionary[int, TrackInfo] = (
+            weakref.WeakValueDictionary()
         )
-        self.configured = False
+
+        # Info received while looking up the candidates of an import task,
+        # whose rules are only applied if it is chosen, when applying rules
+        # on choice. Lookups are tracked by thread, as the importer's
+        # pipeline may look up candidates while other threads receive info.
+        self.lookups = threading.local()
+        self.deferred: weakref.WeakValueDictionary[int, Info] = (
+            weakref.WeakValueDictionary()
+        )
+
+        # Statistics for this run, if they are being recorded.
+        self.stats: Optional[Stats] = None
+
+        # Snapshots of the info received, if they are being recorded.
+        self.snapshots: Optional[SnapshotStore] = None
+
+        # Rules parsed by earlier runs, if they are being reused.
+        self.precompiled: Optional[PrecompiledRules] = None
 
         if self.config["enabled"].get(bool):
-            self.register_listener("trackinfo_received", self.apply_trackinfo_rules)
-            self.register_listener("albuminfo_received", self.apply_albuminfo_rules)
-
-    def set_rules(self) -> None:
-        """Set rules from configuration."""
-        if not self.configured:
-            item_modifies: List[str] = self.config["modify_trackinfo"].get(list)
-            self.item_rules = self.get_modifies(item_modifies, Item, "modify_trackinfo")
-
-            album_modifies: List[str] = self.config["modify_albuminfo"].get(list)
-            self.album_rules = self.get_modifies(
-                album_modifies, Album, "modify_albuminfo"
+            listeners: Dict[str, Callable[..., None]] = {
+                "trackinfo_received": self.apply_trackinfo_rules,
+                "albuminfo_received": self.apply_albuminfo_rules,
+            }
+            if self.config["apply_on_choice"].get(bool):
+                listeners = {
+                    "trackinfo_received": self.defer_info,
+                    "albuminfo_received": self.defer_info,
+                    "import_task_choice": self.apply_choice_rules,
+                }
+                self.register_listener("import_task_start", self.defer_lookup)
+            if self.config["stats"].get(bool):
+                self.stats = Stats()
+                listeners = {
+                    event: self.stats.timed(event, listener)
+                    for event, listener in listeners.items()
+                }
+                self.register_listener("cli_exit", self.write_stats)
+
+            for event, listener in listeners.items():
+                self.register_listener(event, listener)
+            self.register_listener("cli_exit", self.close_store)
+
+    def set_rules(self) -> RuleSets:
+        """Set rules from configuration, returning the rule sets in use.
+
+        The rules are parsed when first needed. If `reload` is enabled, the
+        configuration files are checked for changes, and rule sets whose
+        entries changed are rebuilt. The rule sets are then replaced in a
+        single assignment, so events already being handled keep using the
+        rules they started with.
+
+        Events may be handled by several threads at once, such as those of
+        the importer's pipeline. Once the rules are built, they are returned
+        without taking a lock, unless the files are due to be checked.
+        Otherwise only one thread builds or reloads the rules, and the
+        others wait for it and use its rules.
+        """
+        rulesets = self.rulesets
+        if rulesets is not None and not self.reload_due():
+            return rulesets
+
+        with self.lock:
+            return self.build_rulesets()
+
+    def build_rulesets(self) -> RuleSets:
+        """Build the rules, unless they were built or are unchanged."""
+        rulesets = self.rulesets
+        if (
+            rulesets is not None
+            and not self.reload_config()
+            and not self.tables_changed()
+        ):
+            return rulesets
+
+        self.batch_tracks = self.config["batch_tracks"].get(bool)
+        self.reload = self.config["reload"].get(bool)
+        self.reload_interval = self.config["reload_interval"].as_number()
+        if self.config["snapshots"].get(bool) and self.snapshots is None:
+            from .snapshot import SnapshotStore
+
+            self.snapshots = SnapshotStore(self.snapshot_path())
+        if self.config["persistent_cache"].get(bool) and self.store is None:
+            from .store import ResultStore
+
+            self.store = ResultStore(self.cache_path())
+        if self.config["precompiled"].get(bool) and self.precompiled is None:
+            from .precompiled import PrecompiledRules
+
+            self.precompiled = PrecompiledRules(self.precompiled_path())
+
+        rulesets = self.rulesets = RuleSets(
+            self.build_rules(
+                rulesets and rulesets.album, "album", Album, "modify_albuminfo"
+            ),
+            self.build_rules(
+                rulesets and rulesets.item, "track", Item, "modify_trackinfo"
+            ),
+        )
+        return rulesets
+
+    def build_rules(
+        self,
+        previous: Optional["RuleSet"],
+        kind: str,
+        model_cls: Type[Model],
+        option: str,
+    ) -> "RuleSet":
+        """Build the rule set of a kind, unless its entries are unchanged."""
+        from .analysis import rule_fields
+        from .engine import ResultCache
+        from .engine import RuleSet
+        from .store import PersistentCache
+        from .store import rules_hash
+
+        modifies: List[str] = self.config[option].get(list)
+        tables = self.get_tables(f"{kind}info_tables")
+        sources = (modifies, tables)
+        if previous is not None and self.rule_sources.get(kind) == sources:
+            return previous
+
+        rules = self.kind_rules(kind, modifies, tables, model_cls, option)
+        self.rule_sources[kind] = sources
+
+        cache = self.get_cache(rules)
+        caches: List[ResultCache] = [cache] if cache else []
+        if self.store is not None and rules:
+            caches.append(
+                PersistentCache(
+                    self.store,
+                    kind,
+                    rules_hash([rule.modify for rule in rules]),
+                    rule_fields(rules),
+                    "album_id" if kind == "album" else "track_id",
+                )
             )
-            self.configured = True
+        engine = self.config["engine"].as_choice(["interpreted", "compiled"])
+        return RuleSet(rules, model_cls, engine == "compiled", self.stats, caches)
+
+    def kind_rules(
+        self,
+        kind: str,
+        modifies: List[str],
+        tables: List["RuleTable"],
+        model_cls: Type[Model],
+        option: str,
+    ) -> "Rules":
+        """Return the rules of a kind, from its entries and its rule tables."""
+        rules = self.load_rules(kind, modifies, model_cls, option)
+        if not tables:
+            return rules
+
+        from .tables import insert_tables
+        from .tables import load_table
+
+        context = f"{self.name}.{kind}info_tables"
+        return insert_tables(
+            rules, [(t.position, load_table(t, model_cls, context)) for t in tables]
+        )
+
+    def load_rules(
+        self, kind: str, modifies: List[str], model_cls: Type[Model], option: str
+    ) -> "Rules":
+        """Parse the rules of a kind, or load them if they were precompiled."""
+        if self.precompiled is None:
+            return self.get_modifies(modifies, model_cls, option)
+
+        from .precompiled import rules_key
+
+        key = rules_key(modifies, model_cls)
+        rules = self.precompiled.get(kind, key)
+        if rules is not None:
+            self.parsed_rules[option] = {rule.modify: rule for rule in rules}
+            return rules
+
+        rules = self.get_modifies(modifies, model_cls, option)
+        if not self.precompiled.put(kind, key, rules):
+            self._log.debug("{} rules can't be precompiled", kind)
+        return rules
+
+    def get_tables(self, option: str) -> List["RuleTable"]:
+        """Return the rule tables of an option, with their modification times.
+
+        Each table is given by its path, or by a dictionary with its `path`,
+        the `table` of an SQLite database, and the `position` among the
+        configured rules to apply it at.
+        """
+        from .tables import RuleTable
+
+        tables = []
+        for n, view in enumerate(self.config[option]):
+            if isinstance(view.get(), dict):
+                path = view["path"].get(confuse.Filename(in_app_dir=True))
+                table = view["table"].get(str) if view["table"].exists() else "rules"
+                position = None
+                if view["position"].exists():
+                    position = view["position"].get(int)
+                    if position < 0:
+                        raise UserError(f"{self.name}.{option}[{n}]: negative position")
+            else:
+                path = view.get(confuse.Filename(in_app_dir=True))
+                table, position = "rules", None
+            try:
+                mtime: Optional[int] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtime = None
+            tables.append(RuleTable(path, table, position, mtime))
+        return tables
+
+    def tables_changed(self) -> bool:
+        """Return whether any rule table has changed since its rules were built."""
+        return any(
+            self.get_tables(f"{kind}info_tables") != sources[1]
+            for kind, sources in self.rule_sources.items()
+        )
+
+    def reload_config(self) -> bool:
+        """Reload the plugin's configuration from files which have changed.
+
+        Files are only checked if `reload` is enabled, and then at most once
+        every `reload_interval` seconds. Only this plugin's section is read
+        again. Returns whether any file was reloaded.
+        """
+        if not self.reload_due():
+            return False
+        self.next_reload = time.monotonic() + self.reload_interval
+
+        reloaded = False
+        for source, filename, mtime in self.config_files():
+            if self.config_mtimes.get(filename) == mtime:
+                continue
+            self.config_mtimes[filename] = mtime
+            try:
+                data = yaml_util.load_yaml(filename, loader=source.loader)
+            except confuse.ConfigReadError as exc:
+                self._log.warning("not reloading configuration: {}", exc)
+                continue
+
+            section = (data or {}).get(self.name)
+            if section is None:
+                source.pop(self.name, None)
+            else:
+                source[self.name] = section
+            self._log.debug("reloaded configuration from {}", filename)
+            reloaded = True
+        return reloaded
+
+    def reload_due(self) -> bool:
+        """Return whether the configuration files are due to be checked."""
+        return self.reload and time.monotonic() >= self.next_reload
+
+    def config_files(self) -> List[Tuple[confuse.YamlSource, str, int]]:
+        """Return the configuration files, with their names and modification times."""
+        files = []
+        for source in self.config.root().sources:
+            if isinstance(source, confuse.YamlSource) and source.filename:
+                try:
+                    mtime = os.stat(source.filename).st_mtime_ns
+                except OSError:
+                    continue
+                files.append((source, source.filename, mtime))
+        return files
+
+    def stats_path(self) -> str:
+        """Return the path to the statistics file."""
+        path: str = self.config["stats_path"].get(confuse.Filename(in_app_dir=True))
+        return path
+
+    def write_stats(self) -> None:
+        """Add the statistics for this run to the statistics file."""
+        if self.stats is not None:
+            self.stats.save(self.stats_path())
+
+    def get_cache(self, rules: "Rules") -> Optional["RuleCache"]:
+        """Create a result cache for rules, if caching is enabled."""
+        from .analysis import rule_fields
+        from .cache import RuleCache
+
+        cache_size: int = self.config["cache_size"].get(int)
+        if cache_size <= 0 or not rules:
+            return None
+        return RuleCache(cache_size, rule_fields(rules))
+
+    def cache_path(self) -> str:
+        """Return the path to the persistent cache database."""
+        path: str = self.config["cache_path"].get(confuse.Filename(in_app_dir=True))
+        return path
+
+    def precompiled_path(self) -> str:
+        """Return the path to the precompiled rules file."""
+        path: str = self.config["precompiled_path"].get(
+            confuse.Filename(in_app_dir=True)
+        )
+        return path
+
+    def snapshot_path(self) -> str:
+        """Return the path to the snapshot store directory."""
+        path: str = self.config["snapshot_path"].get(confuse.Filename(in_app_dir=True))
+        return path
+
+    def close_store(self) -> None:
+        """Write any pending results and snapshots to disk, and close them."""
+        if self.store is not None:
+            self.store.close()
+        if self.snapshots is not None:
+            self.snapshots.close()
+
+    def cache_info(self) -> Dict[str, Optional["CacheInfo"]]:
+        """Return statistics for the album and track result caches."""
+        rulesets = self.set_rules()
+        return {
+            "album": rulesets.album.cache.info() if rulesets.album.cache else None,
+            "track": rulesets.item.cache.info() if rulesets.item.cache else None,
+        }
 
     def get_modifies(
         self, items: List[str], model_cls: Type[Model], context: str
-    ) -> Rules:
-        """Parse modify items from configuration."""
-        modifies = []
-        for modify in items:
-            query, mods, dels = self.parse_modify(modify)
-            if not query:
-                raise UserError(
-                    f"importmodifyinfo.{context}: no query found in entry {modify}"
-                )
-            elif not mods and not dels:
-                raise UserError(
-                    f"importmodifyinfo.{context}: no mods found in entry {modify}"
-                )
-            dbquery, _ = parse_query_parts(query, model_cls)
-            modifies.append((modify, dbquery, mods, dels))
-        return modifies
+    ) -> "Rules":
+        """Parse modify items from configuration.
+
+        Items parsed by the previous call for the same context are reused,
+        rather than being parsed again.
+        """
+        from .engine import parse_rules
 
-    def parse_modify(self, modify: str) -> Tuple[List[str], Mods, Dels]:
-        """Parse modify string into query, mods, and dels."""
-        modify = as_string(modify)
-        args = shlex.split(modify)
-        query, mods, dels = modify_parse_args(decargs(args))
-        return query, mods, dels
+        rules = parse_rules(
+            items,
+            model_cls,
+            f"{self.name}.{context}",
+            self.parsed_rules.get(context),
+        )
+        self.parsed_rules[context] = {rule.modify: rule for rule in rules}
+        return rules
 
     def apply_albuminfo_rules(self, info: AlbumInfo) -> None:
         """Apply rules for album information from the importer."""
-        self.set_rules()
+        rulesets = self.set_rules()
+        if self.snapshots is not None:
+            self.snapshots.add_album(info)
+
+        rulesets.album.apply(info)
 
-        album = Album()
-        apply_album_metadata(info, album)
-        self.process_rules(self.album_rules, info, album, Album)
+        if self.batch_tracks and rulesets.item.rules:
+            self.apply_album_tracks_rules(info, rulesets.item)
 
     def apply_trackinfo_rules(self, info: TrackInfo) -> None:
         """Apply rules for track information from the importer."""
-        self.set_rules()
+        rulesets = self.set_rules()
+
+        if self.batch_tracks:
+            if self.processed_tracks.get(id(info)) is info:
+                return
+            self.processed_tracks[id(info)] = info
+
+        if self.snapshots is not None:
+            self.snapshots.add_track(info)
+        rulesets.item.apply(info)
+
+    def defer_lookup(self, session: "ImportSession", task: "ImportTask") -> None:
+        """Defer rules for the candidates an import task is about to look up.
 
-        item = Item()
-        apply_item_metadata(item, info)
-        self.process_rules(self.item_rules, info, item, Item)
+        The importer looks up the task's candidates right after this event,
+        so its lookup is wrapped to defer rules for info received in the
+        meantime, and to stop deferring once it returns or raises.
+        """
+        lookup_candidates = task.lookup_candidates
 
-    def process_rules(
+        def deferring_lookup_candidates() -> None:
+            self.lookups.active = True
+            try:
+                lookup_candidates()
+            finally:
+                self.lookups.active = False
+
+        task.lookup_candidates = deferring_lookup_candidates
+
+    def defer_info(self, info: "Info") -> None:
+        """Record info received for import candidates, or apply rules to it.
+
+        The autotagger fetches several candidates for each album or track,
+        of which at most one is chosen, so their rules are only applied to
+        the chosen candidate. Info received other than while looking up the
+        candidates of an import task has its rules applied at once.
+        """
+        if not getattr(self.lookups, "active", False):
+            self.apply_info_rules(info)
+            return
+        self.deferred[id(info)] = info
+
+    def apply_choice_rules(self, session: "ImportSession", task: "ImportTask") -> None:
+        """Apply rules to the candidate chosen for an import task, if any."""
+        from beets.importer import action
+
+        match = task.match if task.choice_flag is action.APPLY else None
+        if match is None:
+            return
+        if self.deferred.pop(id(match.info), None) is match.info:
+            self.apply_info_rules(match.info)
+
+    def apply_info_rules(self, info: "Info") -> None:
+        """Apply rules to album or track information from the importer."""
+        if isinstance(info, AlbumInfo):
+            self.apply_albuminfo_rules(info)
+        else:
+            self.apply_trackinfo_rules(info)
+
+    def apply_album_tracks_rules(self, info: AlbumInfo, ruleset: "RuleSet") -> None:
+        """Apply track rules to all the tracks of an album in one pass.
+
+        The tracks fall back to the album for fields they have no value for.
+        Rules whose queries only read such fields match every track alike,
+        so they are only tested once per album.
+        """
+        tracks = []
+        for track in info.tracks:
+            if self.processed_tracks.get(id(track)) is not track:
+                self.processed_tracks[id(track)] = track
+                tracks.append(track)
+        ruleset.apply_many(tracks, info)
+
+    def apply_model_rules(
         self,
-        rules: Rules,
-        info: Union[TrackInfo, AlbumInfo],
         obj: Union[Item, Album],
-        model_cls: Type[Model],
+        info: Optional[Union[TrackInfo, AlbumInfo]] = None,
+        album_info: Optional[AlbumInfo] = None,
+    ) -> "Changes":
+        """Apply rules to an album or item from the library, returning its changes.
+
+        If info is given, such as a snapshot of the info received for the
+        object, the rules are applied to it, and otherwise the object stands
+        in for its own info. Either way, the rules are run as a dry run, so
+        fields they delete stay visible to later rules as they would on
+        import, and their edits are then applied to the object. The object
+        is modified in place, but not stored, and the changes are the fields
+        whose values differ from those they had before.
+        """
+        from .cache import DELETE
+        from .cache import Change
+        from .cache import apply_edits
+
+        rulesets = self.set_rules()
+        ruleset = rulesets.album if isinstance(obj, Album) else rulesets.item
+
+        before = {field: obj.get(field, DELETE) for field in ruleset.graph.written}
+        if info is None:
+            edits = ruleset.process(obj, obj, dry_run=True)
+        else:
+            model = ruleset.model(info, album_info)
+            edits = ruleset.process(info, model, dry_run=True)
+        apply_edits(obj, edits)
+
+        changes = []
+        for field in sorted({field for field, _ in edits}):
+            value = obj.get(field, DELETE)
+            if value != before[field]:
+                changes.append(Change(field, before[field], value))
+        return changes
+
+    def commands(self) -> List[Subcommand]:
+        """Return the plugin's commands."""
+        command = Subcommand(
+            "importmodifyinfo", help="manage the importmodifyinfo plugin"
+        )
+        command.parser.usage += (
+            "\n       %prog apply [-j JOBS] [-s] [QUERY]"
+            "\n       %prog diff [-s] [QUERY]"
+            "\n       %prog cache stats|clear"
+            "\n       %prog explain"
+            "\n       %prog stats"
+        )
+        command.parser.add_option(
+            "-j",
+            "--jobs",
+            type="int",
+            default=os.cpu_count() or 1,
+            help="number of processes to apply rules with [default: %default]",
+        )
+        command.parser.add_option(
+            "-s",
+            "--snapshots",
+            action="store_true",
+            default=False,
+            help="apply rules to snapshots of the info received for apply or diff",
+        )
+        command.func = self.run_command
+        return [command]
+
+    def run_command(self, lib: Library, opts: Values, args: List[str]) -> None:
+        """Run an importmodifyinfo subcommand."""
+        args = decargs(args)
+        if args[:1] == ["cache"] and args[1:] in (["stats"], ["clear"]):
+            from .store import ResultStore
+
+            store = ResultStore(self.cache_path())
+            try:
+                if args[1] == "stats":
+                    self.cache_stats(store)
+                else:
+                    store.clear()
+                    print_(f"Cleared {store.path}")
+            finally:
+                store.close()
+        elif args[:1] == ["apply"]:
+            self.apply_library(lib, args[1:], opts.jobs, opts.snapshots)
+        elif args[:1] == ["diff"]:
+            self.diff_library(lib, args[1:], opts.snapshots)
+        elif args == ["explain"]:
+            self.explain()
+        elif args == ["stats"]:
+            self.show_stats()
+        else:
+            raise UserError(f"importmodifyinfo: unknown command: {' '.join(args)}")
+
+    def apply_library(
+        self, lib: Library, query: List[str], jobs: int, snapshots: bool = False
     ) -> None:
-        """Process rules for info on an object."""
-        for _, query, mods, dels in rules:
-            templates = {
-                key: functemplate.template(value) for key, value in mods.items()
-            }
-            obj_mods = {
-                key: model_cls._parse(key, obj.evaluate_template(templates[key]))
-                for key in mods.keys()
-            }
-            if query.match(obj):
-                for field in dels:
-                    try:
-                        del info[field]
-                    except KeyError:
-                        pass
-
-                for field, value in obj_mods.items():
-                    # Indirect to deal with type conversions, and allow for later
-                    # rules to match the modified values.
-                    obj[field] = value
-                    info[field] = obj[field]
-
-
-def apply_album_metadata(album_info: AlbumInfo, album: Album) -> None:
-    """Set the album's metadata to match the AlbumInfo object."""
-    album.artist = album_info.artist
-    album.artists = album_info.artists
-    album.artist_sort = album_info.artist_sort
-    album.artists_sort = album_info.artists_sort
-    album.artist_credit = album_info.artist_credit
-    album.artists_credit = album_info.artists_credit
-    album.year = album_info.year
-
-    for field, value in album_info.items():
-        # We only overwrite fields that are not already hardcoded.
-        if field in SPECIAL_FIELDS["album"]:
-            continue
-        if value is None:
-            continue
-        album[field] = value
+        """Apply the rules to the albums and tracks in the library.
+
+        If snapshots is set, the rules are applied to the snapshots of the
+        info received for them instead of their current values.
+        """
+        from . import bulk
+
+        snapshot_path = self.snapshot_path() if snapshots else None
+        for kind, kind_query in self.library_queries(query):
+            start = time.perf_counter()
+            changed, total, missing = bulk.apply_rules(
+                self, lib, kind, kind_query, jobs, snapshot_path
+            )
+            elapsed = time.perf_counter() - start
+            summary = f"{kind}s: {changed} of {total} changed"
+            if snapshots:
+                summary += f", {missing} without snapshots"
+            print_(f"{summary} in {elapsed:.1f}s")
+
+    def diff_library(
+        self, lib: Library, query: List[str], snapshots: bool = False
+    ) -> None:
+        """Show the changes the rules would make to the library, as JSON lines.
+
+        If snapshots is set, the rules are applied to the snapshots of the
+        info received for the albums and tracks instead.
+        """
+        from . import bulk
+
+        snapshot_path = self.snapshot_path() if snapshots else None
+        for kind, kind_query in self.library_queries(query):
+            reports = bulk.diff_objects(self, lib, kind, kind_query, snapshot_path)
+            for report in reports:
+                print_(json.dumps(report, default=str))
+
+    def library_queries(self, query: List[str]) -> List[Tuple[str, List[str]]]:
+        """Return the queries for library objects which rules apply to, by kind.
+
+        Album rules apply to albums, and track rules to singletons, or to
+        every track when tracks of albums are processed too.
+        """
+        rulesets = self.set_rules()
+        queries = []
+        if rulesets.album.rules:
+            queries.append(("album", query))
+        if rulesets.item.rules:
+            if self.batch_tracks:
+                queries.append(("track", query))
+            else:
+                queries.append(("track", [*query, "singleton:true"]))
+        return queries
+
+    def cache_stats(self, store: "ResultStore") -> None:
+        """Show the number of results in the persistent cache."""
+        from .store import rules_hash
+
+        current = {}
+        for kind, model_cls, option in (
+            ("album", Album, "modify_albuminfo"),
+            ("track", Item, "modify_trackinfo"),
+        ):
+            modifies: List[str] = self.config[option].get(list)
+            tables = self.get_tables(f"{kind}info_tables")
+            rules = self.kind_rules(kind, modifies, tables, model_cls, option)
+            current[kind] = rules_hash([rule.modify for rule in rules])
+        counts = store.counts()
+        print_(f"Persistent cache: {store.path}")
+        for kind in ("album", "track"):
+            total = sum(n for (k, _), n in counts.items() if k == kind)
+            valid = counts.get((kind, current[kind]), 0)
+            print_(f"{kind} results: {total} ({valid} for the current rules)")
+
+    def explain(self) -> None:
+        """Show how the rules are analysed and dispatched."""
+        from .engine import PARTITION_FIELD
+
+        rulesets = self.set_rules()
+        for kind, ruleset in (("album", rulesets.album), ("track", rulesets.item)):
+            rules, index, graph = ruleset.rules, ruleset.index, ruleset.graph
+            if not rules:
+                continue
+            print_(f"{kind} rules: {len(rules)}, in {len(graph.groups)} groups")
+            groups = {p: n for n, group in enumerate(graph.groups, 1) for p in group}
+            for position, rule in enumerate(rules):
+                reads = graph.reads[position]
+                key = index.keys[position]
+                print_(f"  {position}: {rule.modify}")
+                print_(f"      reads: {'unknown' if reads is None else join(reads)}")
+                print_(f"      writes: {join(graph.writes[position])}")
+                print_(f"      after: {join(graph.dependencies[position])}")
+                print_(f"      requires: {join(graph.requirements[position])}")
+                print_(f"      indexed by: {'-' if key is None else key.field}")
+                print_(f"      group: {groups[position]}")
+                if ruleset.conditions is not None:
+                    field = PARTITION_FIELD if ruleset.conditions[position] else "-"
+                    print_(f"      partitioned by: {field}")
+
+            skippable = {tuple(group) for group, _ in graph.skippable}
+            for n, group in enumerate(graph.groups, 1):
+                skip = " (skipped without its required fields)"
+                note = skip if tuple(group) in skippable else ""
+                print_(f"  group {n}: rules {join(group)}{note}")
+
+    def show_stats(self) -> None:
+        """Show the recorded statistics for the current rules."""
+        path = self.stats_path()
+        stats = Stats.load(path)
+        print_(f"Statistics: {path}")
+        for event, event_stats in sorted(stats.events.items()):
+            print_(
+                f"{event}: {event_stats.count} events, {event_stats.time * 1000:.1f} ms"
+            )
+
+        for kind, option in (
+            ("album", "modify_albuminfo"),
+            ("track", "modify_trackinfo"),
+        ):
+            modifies: List[str] = self.config[option].get(list)
+            if not modifies:
+                continue
+            print_(f"\n{kind} rules:")
+            print_(
+                f"{'evaluations':>11} {'matches':>8} {'match ms':>9}"
+                f" {'render ms':>9} {'assign ms':>9}  rule"
+            )
+            for modify in modifies:
+                rule = stats.rules[kind].get(modify) or RuleStats()
+                print_(
+                    f"{rule.evaluations:>11} {rule.matches:>8}"
+                    f" {rule.match_time * 1000:>9.2f}"
+                    f" {rule.render_time * 1000:>9.2f}"
+                    f" {rule.assign_time * 1000:>9.2f}  {modify}"
+                )
+
+
+def join(values: Iterable[Any]) -> str:
+    """Join sorted values for display, or return '-' if there are none."""
+    return ", ".join(str(value) for value in sorted(values)) or "-"
@@ -0,0 +1,100 @@
+"""Precompiled rules for the importmodifyinfo plugin."""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Type
+
+import beets  # type: ignore
+from beets.dbcore import Model  # type: ignore
+
+from .engine import Rules
+
+
+# Version of the file format, and of the rules it holds.
+FORMAT_VERSION = 1
+
+
+class PrecompiledRules:
+    """A file of parsed rules by kind, to reuse instead of parsing them again.
+
+    Each kind's rules are stored along with a key for the entries they
+    were parsed from and everything their parsing depends on, and only
+    reused if the key is unchanged. The file is a pickle, so it must only
+    be written by the plugin itself.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._entries: Optional[Dict[str, Tuple[str, Rules]]] = None
+
+    @property
+    def entries(self) -> Dict[str, Tuple[str, Rules]]:
+        """Return the key and rules of each kind, reading the file if needed."""
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path, "rb") as f:
+                    version, entries = pickle.load(f)  # noqa: S301
+            except Exception:  # noqa: BLE001, S110
+                # Missing or unreadable files are replaced when rules are saved.
+                pass
+            else:
+                if version == FORMAT_VERSION:
+                    self._entries = entries
+        return self._entries
+
+    def get(self, kind: str, key: str) -> Optional[Rules]:
+        """Return the rules of a kind, if they were parsed with this key."""
+        entry = self.entries.get(kind)
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1]
+
+    def put(self, kind: str, key: str, rules: Rules) -> bool:
+        """Save the rules of a kind, parsed with a key, to the file.
+
+        Returns whether the rules were saved, which they can't be if some
+        query, such as one added by a plugin, can't be pickled.
+        """
+        entries = {**self.entries, kind: (key, rules)}
+        try:
+            data = pickle.dumps((FORMAT_VERSION, entries), pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return False
+        self._entries = entries
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+        return True
+
+
+def rules_key(modifies: List[str], model_cls: Type[Model]) -> str:
+    """Return a key for rules parsed from entries for a model.
+
+    Besides the entries, parsing depends on the versions of Python and
+    beets, and the types of the model's fields, which plugins may add.
+    """
+    types: Dict[str, Any] = {
+        field: type(field_type).__qualname__
+        for field, field_type in {**model_cls._types, **model_cls._fields}.items()
+    }
+    data = [
+        FORMAT_VERSION,
+        sys.version,
+        beets.__version__,
+        model_cls.__name__,
+        sorted(types.items()),
+        modifies,
+    ]
+    return hashlib.sha1(json.dumps(data).encode("utf-8")).hexdigest()  # noqa: S324
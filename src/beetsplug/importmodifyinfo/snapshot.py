@@ -0,0 +1,182 @@
+"""Snapshots of received info for the importmodifyinfo plugin."""
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+from typing import IO
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.autotag.hooks import TrackInfo
+
+from .cache import Info
+
+
+# Size in bytes after which a new segment is started.
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+INDEX_NAME = "index.jsonl"
+
+# The location of a snapshot: its segment, offset, length and digest.
+Location = Tuple[int, int, int, str]
+
+
+class SnapshotStore:
+    """An append-only store of the info received, before any rules applied.
+
+    Snapshots are kept as JSON lines in numbered segment files in a
+    directory, each line holding the info for one album, with its tracks,
+    or one singleton track. An index file records where the latest
+    snapshot of each album or track is, by kind and MusicBrainz ID, and
+    is read into memory when first needed. A snapshot is only appended
+    when the info differs from the latest one for its ID, so repeated
+    imports of the same release add nothing. Segments are memory-mapped
+    for reading. The store may be used by any thread, one at a time.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._index: Optional[Dict[Tuple[str, str], Location]] = None
+        self.segment = 1
+        self.segment_file: Optional[IO[bytes]] = None
+        self.index_file: Optional[IO[bytes]] = None
+        self.maps: Dict[int, mmap.mmap] = {}
+        self.lock = threading.RLock()
+
+    @property
+    def index(self) -> Dict[Tuple[str, str], Location]:
+        """Return the location of each snapshot, reading the index if needed."""
+        with self.lock:
+            if self._index is None:
+                self._index = read_index(os.path.join(self.path, INDEX_NAME))
+            return self._index
+
+    def segment_path(self, segment: int) -> str:
+        """Return the path of a segment file."""
+        return os.path.join(self.path, f"segment-{segment:05d}.jsonl")
+
+    def add(self, kind: str, mbid: str, info: Info) -> None:
+        """Store a snapshot of info, unless it's unchanged or can't be encoded."""
+        try:
+            line = json.dumps(encode_info(info), sort_keys=True).encode("utf-8")
+        except (TypeError, ValueError):
+            return
+        digest = hashlib.sha1(line).hexdigest()  # noqa: S324
+        with self.lock:
+            location = self.index.get((kind, mbid))
+            if location is not None and location[3] == digest:
+                return
+
+            segment_file = self.open_segment(len(line) + 1)
+            offset = segment_file.tell()
+            segment_file.write(line + b"\n")
+
+            if self.index_file is None:
+                self.index_file = open(os.path.join(self.path, INDEX_NAME), "ab")  # noqa: SIM115
+            entry = [kind, mbid, self.segment, offset, len(line), digest]
+            self.index_file.write(json.dumps(entry).encode("utf-8") + b"\n")
+            self.index[kind, mbid] = self.segment, offset, len(line), digest
+
+    def open_segment(self, size: int) -> IO[bytes]:
+        """Return the segment to append to, starting a new one when full."""
+        if self.segment_file is None:
+            os.makedirs(self.path, exist_ok=True)
+            segments = [
+                int(name[8:-6])
+                for name in os.listdir(self.path)
+                if name.startswith("segment-") and name.endswith(".jsonl")
+            ]
+            self.segment = max(segments, default=1)
+            self.segment_file = open(self.segment_path(self.segment), "ab")  # noqa: SIM115
+        if self.segment_file.tell() and self.segment_file.tell() + size > SEGMENT_SIZE:
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(self.segment_path(self.segment), "ab")  # noqa: SIM115
+        return self.segment_file
+
+    def get(self, kind: str, mbid: str) -> Optional[Info]:
+        """Return the latest snapshot of info by kind and ID, if there is one."""
+        with self.lock:
+            location = self.index.get((kind, mbid))
+            if location is None:
+                return None
+            segment, offset, length, _ = location
+            self.flush()
+
+            segment_map = self.maps.get(segment)
+            if segment_map is None or len(segment_map) < offset + length:
+                if segment_map is not None:
+                    segment_map.close()
+                with open(self.segment_path(segment), "rb") as f:
+                    segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[segment] = segment_map
+            return decode_info(kind, json.loads(segment_map[offset : offset + length]))
+
+    def add_album(self, info: AlbumInfo) -> None:
+        """Store a snapshot of album info, with its tracks, if it has an ID."""
+        if info.get("album_id"):
+            self.add("album", info.album_id, info)
+
+    def add_track(self, info: TrackInfo) -> None:
+        """Store a snapshot of track info, if it has an ID."""
+        if info.get("track_id"):
+            self.add("track", info.track_id, info)
+
+    def get_album(self, mbid: str) -> Optional[AlbumInfo]:
+        """Return the latest snapshot of album info, if there is one."""
+        return self.get("album", mbid)
+
+    def get_track(self, mbid: str) -> Optional[TrackInfo]:
+        """Return the latest snapshot of singleton track info, if there is one."""
+        return self.get("track", mbid)
+
+    def flush(self) -> None:
+        """Write any buffered snapshots to disk."""
+        with self.lock:
+            for f in (self.segment_file, self.index_file):
+                if f is not None:
+                    f.flush()
+
+    def close(self) -> None:
+        """Write any buffered snapshots, and close the files."""
+        with self.lock:
+            for f in (self.segment_file, self.index_file):
+                if f is not None:
+                    f.close()
+            self.segment_file = self.index_file = None
+            for segment_map in self.maps.values():
+                segment_map.close()
+            self.maps.clear()
+
+
+def read_index(path: str) -> Dict[Tuple[str, str], Location]:
+    """Read the location of each snapshot from an index file, if there is one."""
+    index: Dict[Tuple[str, str], Location] = {}
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                kind, mbid, segment, offset, length, digest = json.loads(line)
+                index[kind, mbid] = segment, offset, length, digest
+    return index
+
+
+def encode_info(info: Info) -> Dict[str, Any]:
+    """Encode info as a dictionary, omitting fields with no value."""
+    encoded = {key: value for key, value in info.items() if value is not None}
+    if "tracks" in encoded:
+        encoded["tracks"] = [encode_info(track) for track in encoded["tracks"]]
+    return encoded
+
+
+def decode_info(kind: str, encoded: Dict[str, Any]) -> Info:
+    """Decode info encoded by `encode_info`."""
+    if kind == "album":
+        tracks: List[TrackInfo] = [TrackInfo(**t) for t in encoded.pop("tracks", [])]
+        return AlbumInfo(tracks, **encoded)
+    return TrackInfo(**encoded)
@@ -0,0 +1,143 @@
+"""Instrumentation of rules for the importmodifyinfo plugin."""
+
+import json
+import os
+import time
+from typing import Any
+from typing import Callable
+from typing import ClassVar
+from typing import Dict
+from typing import Tuple
+
+from beets.dbcore import Model  # type: ignore
+from beets.dbcore import Query
+
+
+class Counters:
+    """A set of counters, which can be combined with those saved earlier."""
+
+    fields: ClassVar[Tuple[str, ...]] = ()
+
+    def __init__(self) -> None:
+        for field in self.fields:
+            setattr(self, field, 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the counters as a dictionary."""
+        return {field: getattr(self, field) for field in self.fields}
+
+    def update(self, values: Dict[str, Any]) -> None:
+        """Add counters from a dictionary to these."""
+        for field in self.fields:
+            setattr(self, field, getattr(self, field) + values.get(field, 0))
+
+
+class RuleStats(Counters):
+    """Counts and cumulative times, in seconds, for a single rule."""
+
+    fields = ("evaluations", "matches", "match_time", "render_time", "assign_time")
+    evaluations: int
+    matches: int
+    match_time: float
+    render_time: float
+    assign_time: float
+
+
+class EventStats(Counters):
+    """The number of times an event was handled, and the total time taken."""
+
+    fields = ("count", "time")
+    count: int
+    time: float
+
+
+class Stats:
+    """Statistics for the rules of each kind, by rule, and for each event."""
+
+    def __init__(self) -> None:
+        self.rules: Dict[str, Dict[str, RuleStats]] = {"album": {}, "track": {}}
+        self.events: Dict[str, EventStats] = {}
+
+    def rule(self, kind: str, modify: str) -> RuleStats:
+        """Return the statistics for a rule, creating them if needed."""
+        try:
+            return self.rules[kind][modify]
+        except KeyError:
+            stats = self.rules[kind][modify] = RuleStats()
+            return stats
+
+    def event(self, event: str) -> EventStats:
+        """Return the statistics for an event, creating them if needed."""
+        try:
+            return self.events[event]
+        except KeyError:
+            stats = self.events[event] = EventStats()
+            return stats
+
+    def timed(self, event: str, func: Callable[..., None]) -> Callable[..., None]:
+        """Wrap an event listener to record its statistics."""
+        stats = self.event(event)
+
+        def listener(*args: Any, **kwargs: Any) -> None:
+            start = time.perf_counter()
+            try:
+                func(*args, **kwargs)
+            finally:
+                stats.count += 1
+                stats.time += time.perf_counter() - start
+
+        return listener
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the statistics as a dictionary."""
+        return {
+            "events": {event: s.to_dict() for event, s in self.events.items()},
+            "rules": {
+                kind: {modify: s.to_dict() for modify, s in rules.items()}
+                for kind, rules in self.rules.items()
+            },
+        }
+
+    def update(self, values: Dict[str, Any]) -> None:
+        """Add statistics from a dictionary to these."""
+        for event, event_values in values.get("events", {}).items():
+            self.event(event).update(event_values)
+        for kind, rules in values.get("rules", {}).items():
+            self.rules.setdefault(kind, {})
+            for modify, rule_values in rules.items():
+                self.rule(kind, modify).update(rule_values)
+
+    @classmethod
+    def load(cls, path: str) -> "Stats":
+        """Load statistics from a JSON file, if it exists."""
+        stats = cls()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                stats.update(json.load(f))
+        return stats
+
+    def save(self, path: str) -> None:
+        """Add these statistics to those in a JSON file."""
+        stats = self.load(path)
+        stats.update(self.to_dict())
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(stats.to_dict(), f, indent=2)
+
+
+class InstrumentedQuery(Query):  # type: ignore
+    """A rule's query, recording each evaluation in the rule's statistics."""
+
+    def __init__(self, query: Query, stats: RuleStats) -> None:
+        self.query = query
+        self.stats = stats
+
+    def match(self, obj: Model) -> bool:
+        """Match the wrapped query, recording the result and time taken."""
+        start = time.perf_counter()
+        matched: bool = self.query.match(obj)
+        self.stats.match_time += time.perf_counter() - start
+        self.stats.evaluations += 1
+        if matched:
+            self.stats.matches += 1
+        return matched
@@ -0,0 +1,207 @@
+"""Persistent storage of rule results for the importmodifyinfo plugin."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import cast
+
+from beets.dbcore import Model  # type: ignore
+
+from .cache import DELETE
+from .cache import Edits
+from .cache import Info
+from .cache import fingerprint
+
+
+# Number of stored results to write before committing them.
+COMMIT_INTERVAL = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    rules TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    edits TEXT NOT NULL,
+    PRIMARY KEY (kind, id)
+)
+"""
+
+
+class ResultStore:
+    """An SQLite database of the edits rules made to info in earlier runs.
+
+    Results are stored per kind of info and MusicBrainz ID, along with a
+    hash of the rules which produced them and a fingerprint of the values
+    those rules read. The database is only opened once it is first used,
+    and may then be used by any thread, one at a time.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self.pending = 0
+        self.lock = threading.RLock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Return the connection to the database, opening it if needed."""
+        with self.lock:
+            if self._connection is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._connection = sqlite3.connect(self.path, check_same_thread=False)
+                self._connection.execute(SCHEMA)
+            return self._connection
+
+    def invalidate(self, kind: str, rules: str) -> None:
+        """Remove results of a kind which were produced by other rules."""
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM results WHERE kind = ? AND rules != ?", (kind, rules)
+            )
+            self.connection.commit()
+
+    def get(
+        self, kind: str, mbid: str, rules: str, fingerprint: str
+    ) -> Optional[Edits]:
+        """Return the stored edits for info, if the result is still valid."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT edits FROM results "
+                "WHERE kind = ? AND id = ? AND rules = ? AND fingerprint = ?",
+                (kind, mbid, rules, fingerprint),
+            ).fetchone()
+        if row is None:
+            return None
+        return decode_edits(row[0])
+
+    def put(
+        self, kind: str, mbid: str, rules: str, fingerprint: str, edits: Edits
+    ) -> None:
+        """Store the edits made to info, replacing any earlier result."""
+        try:
+            encoded = encode_edits(edits)
+        except (TypeError, ValueError):
+            # Values which can't be stored are simply not cached.
+            return
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (kind, mbid, rules, fingerprint, encoded),
+            )
+            self.pending += 1
+            if self.pending >= COMMIT_INTERVAL:
+                self.commit()
+
+    def commit(self) -> None:
+        """Commit any stored results."""
+        with self.lock:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self) -> None:
+        """Commit any stored results and close the database."""
+        with self.lock:
+            if self._connection is not None:
+                self.commit()
+                self._connection.close()
+                self._connection = None
+
+    def counts(self) -> Dict[Tuple[str, str], int]:
+        """Return the number of stored results by kind and rules hash."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT kind, rules, COUNT(*) FROM results GROUP BY kind, rules"
+            ).fetchall()
+        return {(kind, rules): count for kind, rules, count in rows}
+
+    def clear(self) -> None:
+        """Remove every stored result."""
+        with self.lock:
+            self.connection.execute("DELETE FROM results")
+            self.connection.commit()
+            self.connection.execute("VACUUM")
+
+
+class PersistentCache:
+    """A view of the stored results for one kind of info and set of rules.
+
+    This provides the same interface as `RuleCache`, keyed by the info's
+    MusicBrainz ID and a fingerprint of the fields the rules read, so a
+    release whose data is unchanged since an earlier run has the stored
+    edits replayed. Info without an ID is never cached.
+    """
+
+    def __init__(
+        self,
+        store: ResultStore,
+        kind: str,
+        rules: str,
+        fields: Optional[Iterable[str]],
+        id_field: str,
+    ) -> None:
+        self.store = store
+        self.kind = kind
+        self.rules = rules
+        self.fields = None if fields is None else sorted(fields)
+        self.id_field = id_field
+        self.hits = 0
+        self.misses = 0
+        store.invalidate(kind, rules)
+
+    def key(self, info: Info, obj: Model) -> Hashable:
+        """Return the cache key for info and its object's current values."""
+        mbid = info.get(self.id_field)
+        if not mbid:
+            return None
+        values = repr(fingerprint(obj, self.fields)).encode("utf-8")
+        return str(mbid), hashlib.sha1(values).hexdigest()  # noqa: S324
+
+    def get(self, key: Hashable) -> Optional[Edits]:
+        """Return the edits stored for a key, if any."""
+        edits = None
+        if key is not None:
+            mbid, digest = cast(Tuple[str, str], key)
+            edits = self.store.get(self.kind, mbid, self.rules, digest)
+
+        if edits is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return edits
+
+    def put(self, key: Hashable, edits: Edits) -> None:
+        """Store the edits for a key."""
+        if key is not None:
+            mbid, digest = cast(Tuple[str, str], key)
+            self.store.put(self.kind, mbid, self.rules, digest, edits)
+
+
+def rules_hash(modifies: List[str]) -> str:
+    """Return a hash identifying a list of configured rules."""
+    return hashlib.sha256(json.dumps(modifies).encode("utf-8")).hexdigest()
+
+
+def encode_edits(edits: Edits) -> str:
+    """Encode edits as JSON, representing deletions by the field alone."""
+    return json.dumps(
+        [[field] if value is DELETE else [field, value] for field, value in edits]
+    )
+
+
+def decode_edits(encoded: str) -> Edits:
+    """Decode edits encoded by `encode_edits`."""
+    edits: List[Tuple[str, Any]] = []
+    for edit in json.loads(encoded):
+        edits.append((edit[0], DELETE if len(edit) == 1 else edit[1]))
+    return edits
@@ -0,0 +1,146 @@
+"""External rule tables for the importmodifyinfo plugin."""
+
+import csv
+import os
+import shlex
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import Type
+
+from beets.dbcore import Model  # type: ignore
+from beets.dbcore.query import AndQuery  # type: ignore
+from beets.dbcore.query import MatchQuery
+from beets.ui import UserError  # type: ignore
+
+from .engine import Rule
+from .engine import Rules
+from .engine import compile_mods
+
+
+# The columns of a rule table, in order.
+COLUMNS = ("key_field", "key_value", "field", "value")
+
+# File extensions of SQLite databases, and of tab-separated tables.
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+TSV_EXTENSIONS = (".tab", ".tsv")
+
+# A row of a rule table: the key field and value, and a field and value.
+Row = Tuple[str, str, str, str]
+
+
+class RuleTable(NamedTuple):
+    """A table of rules, and where to apply them among the configured rules.
+
+    The modification time is kept so a changed table can be told apart.
+    """
+
+    path: str
+    table: str
+    position: Optional[int]
+    mtime: Optional[int]
+
+
+def load_table(table: RuleTable, model_cls: Type[Model], context: str) -> Rules:
+    """Read a rule table, and build its rules."""
+    return table_rules(read_rows(table, context), model_cls, f"{context}: {table.path}")
+
+
+def read_rows(table: RuleTable, context: str) -> List[Row]:
+    """Read the rows of a rule table from a CSV, TSV or SQLite file."""
+    extension = os.path.splitext(table.path)[1].lower()
+    try:
+        if extension in SQLITE_EXTENSIONS:
+            return read_sqlite(table.path, table.table)
+        delimiter = "\t" if extension in TSV_EXTENSIONS else ","
+        with open(table.path, encoding="utf-8", newline="") as f:
+            return read_csv(f, delimiter)
+    except (OSError, csv.Error, sqlite3.Error) as exc:
+        raise UserError(f"{context}: can't read {table.path}: {exc}") from exc
+
+
+def read_csv(lines: Iterable[str], delimiter: str) -> List[Row]:
+    """Read rows from delimited lines, with a header naming the columns."""
+    reader = csv.DictReader(lines, delimiter=delimiter)
+    missing = [c for c in COLUMNS if c not in (reader.fieldnames or ())]
+    if missing:
+        raise csv.Error(f"missing columns {', '.join(missing)}")
+    return [
+        (row["key_field"], row["key_value"], row["field"], row["value"] or "")
+        for row in reader
+    ]
+
+
+def read_sqlite(path: str, table: str) -> List[Row]:
+    """Read rows from a table of an SQLite database, which must exist."""
+    uri = f"{Path(path).absolute().as_uri()}?mode=ro"
+    name = table.replace('"', '""')
+    with closing(sqlite3.connect(uri, uri=True)) as connection:
+        rows = connection.execute(
+            f'SELECT key_field, key_value, field, value FROM "{name}"'  # noqa: S608
+        )
+        return [
+            (str(key_field), str(key_value), str(field), "" if v is None else str(v))
+            for key_field, key_value, field, v in rows
+        ]
+
+
+def table_rules(rows: Iterable[Row], model_cls: Type[Model], context: str) -> Rules:
+    """Build rules from the rows of a rule table.
+
+    The rows for each key field and value make one rule, in the order the
+    key first appears, which sets each field to its value, or deletes it
+    for fields ending in `!`, as `beet modify` would. Each rule matches the
+    key exactly, as a `key_field:=key_value` query, so rules are looked up
+    by the rule index rather than tested in turn.
+    """
+    groups: Dict[Tuple[str, str], Tuple[Dict[str, str], List[str]]] = {}
+    for n, (key_field, key_value, field, value) in enumerate(rows, 1):
+        if not key_field or not field:
+            raise UserError(f"{context}: no key field or field in row {n}")
+        mods, dels = groups.setdefault((key_field, key_value), ({}, []))
+        if field.endswith("!"):
+            dels.append(field[:-1])
+        else:
+            mods[field] = value
+
+    rules = []
+    for (key_field, key_value), (mods, dels) in groups.items():
+        modify = shlex.join(
+            [
+                f"{key_field}:={key_value}",
+                *(f"{field}={value}" for field, value in mods.items()),
+                *(f"{field}!" for field in dels),
+            ]
+        )
+        query = AndQuery(
+            [MatchQuery(key_field, key_value, key_field in model_cls._fields)]
+        )
+        rules.append(Rule(modify, query, compile_mods(mods, model_cls), tuple(dels)))
+    return rules
+
+
+def insert_tables(rules: Rules, tables: List[Tuple[Optional[int], Rules]]) -> Rules:
+    """Insert the rules of tables before the rules at their positions.
+
+    Tables without a position, or past the end, come after every rule, and
+    tables at the same position keep their order.
+    """
+    placed = sorted(
+        (len(rules) if position is None else min(position, len(rules)), n)
+        for n, (position, _) in enumerate(tables)
+    )
+    combined: Rules = []
+    start = 0
+    for position, n in placed:
+        combined.extend(rules[start:position])
+        combined.extend(tables[n][1])
+        start = position
+    combined.extend(rules[start:])
+    return combined
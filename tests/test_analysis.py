@@ -0,0 +1,148 @@
+"""Tests for the importmodifyinfo rule analysis."""
+
+from typing import List
+from typing import Optional
+from typing import Set
+
+import pytest
+from beets.dbcore.query import Query  # type: ignore
+from beets.dbcore.query import TrueQuery
+from beets.library import Album  # type: ignore
+from beets.library import Item
+from beets.library import parse_query_parts
+from beets.util import functemplate  # type: ignore
+
+from beetsplug.importmodifyinfo.analysis import DependencyGraph
+from beetsplug.importmodifyinfo.analysis import query_fields
+from beetsplug.importmodifyinfo.analysis import required_fields
+from beetsplug.importmodifyinfo.analysis import rule_fields
+from beetsplug.importmodifyinfo.analysis import template_fields
+from beetsplug.importmodifyinfo.engine import Rule
+from beetsplug.importmodifyinfo.plugin import ImportModifyInfoPlugin
+
+
+class OpaqueQuery(Query):  # type: ignore
+    """A query whose fields are unknown."""
+
+    def match(self, obj: Item) -> bool:
+        """Match every object."""
+        return True
+
+
+@pytest.mark.parametrize(
+    "query,fields",
+    [
+        (["album:a"], {"album"}),
+        (["album:a", "^title:=b"], {"album", "title"}),
+        (["album:a", ",", "year:2000..2001"], {"album", "year"}),
+        (["singleton:true"], {"album_id"}),
+        (["a"], {"album", "albumartist", "artist", "title", "genre", "comments"}),
+    ],
+)
+def test_query_fields(query: List[str], fields: Optional[Set[str]]) -> None:
+    """Test the fields read by parsed queries."""
+    dbquery, _ = parse_query_parts(query, Item)
+    assert query_fields(dbquery) == fields
+
+
+def test_query_fields_unknown() -> None:
+    """Test queries which can't be analysed."""
+    assert query_fields(TrueQuery()) == set()
+    assert query_fields(OpaqueQuery()) is None
+    dbquery, _ = parse_query_parts(["album:a"], Item)
+    dbquery.subqueries.append(OpaqueQuery())
+    assert query_fields(dbquery) is None
+
+
+@pytest.mark.parametrize(
+    "template,fields",
+    [
+        ("plain", set()),
+        ("$album - $title", {"album", "title"}),
+        ("%upper{$artist}", {"artist", "albumartist"}),
+        ("%if{$comp,$album}", {"comp", "album"}),
+        ("%aunique{}", None),
+    ],
+)
+def test_template_fields(template: str, fields: Optional[Set[str]]) -> None:
+    """Test the fields read by templates."""
+    assert template_fields(functemplate.template(template)) == fields
+
+
+def test_rule_fields() -> None:
+    """Test the fields read by a list of rules."""
+    query, _ = parse_query_parts(["album:a"], Item)
+    genre = functemplate.template("$genre")
+    rules = [Rule("", query, (("title", genre, str), ("x", 1, None)), ())]
+    assert rule_fields(rules) == {"album", "genre"}
+
+    unknown = functemplate.template("%x{}")
+    rules.append(Rule("", query, (("title", unknown, str),), ()))
+    assert rule_fields(rules) is None
+    assert rule_fields([Rule("", OpaqueQuery(), (), ())]) is None
+
+
+def graph(*modifies: str) -> DependencyGraph:
+    """Return the dependency graph of album rules."""
+    plugin = ImportModifyInfoPlugin()
+    rules = plugin.get_modifies(list(modifies), Album, "modify_albuminfo")
+    return DependencyGraph(rules, Album)
+
+
+def test_dependencies() -> None:
+    """Test the dependencies found between rules."""
+    rules = graph(
+        "album:a flex=x",
+        "genre:b year=1",
+        "flex:x title=$year",
+        "album:c album=d",
+        "genre:e flex2=y",
+    )
+    assert rules.dependencies == [set(), set(), {0, 1}, {0}, set()]
+    assert rules.groups == [[0, 1, 2, 3], [4]]
+
+
+def test_dependencies_unknown() -> None:
+    """Test that rules reading unknown fields depend on every other rule."""
+    rules = graph("album:a flex=x", "genre:b title=%x{}", "year:1 flex=y")
+    assert rules.reads[1] is None
+    assert rules.dependencies == [set(), {0}, {1}]
+    assert rules.groups == [[0, 1, 2]]
+
+
+@pytest.mark.parametrize(
+    "query,fields",
+    [
+        (["album:a", "flex:b"], {"album", "flex"}),
+        (["flex:a", ",", "flex:=b", "other:c"], {"flex"}),
+        (["^flex:a"], set()),
+        (["flex::^$"], set()),
+        (["year:2000"], {"year"}),
+        (["year:0"], set()),
+        (["flex:0..1"], {"flex"}),
+        (["path:a"], set()),
+    ],
+)
+def test_required_fields(query: List[str], fields: Set[str]) -> None:
+    """Test the fields which must have a value for queries to match."""
+    dbquery, _ = parse_query_parts(query, Album)
+    assert required_fields(dbquery, Album()) == fields
+
+
+def test_skipped() -> None:
+    """Test that groups are skipped when their required fields are absent."""
+    rules = graph(
+        "flex:a other=x",
+        "flex:b flex2:c other=y",
+        "flex2:d flex3=z",
+        "flex3:z flex2:e flex4=w",
+        "flex:c , flex2:d year=1",
+    )
+    assert rules.groups == [[0, 1], [2, 3], [4]]
+    assert rules.required == {"flex", "flex2"}
+
+    album = Album(flex="a")
+    assert rules.skipped(album) == {2, 3}
+    assert rules.skipped(Album()) == {0, 1, 2, 3}
+    album = Album(flex="a", flex2="d")
+    assert rules.skipped(album) == set()
@@ -0,0 +1,89 @@
+"""Tests for the importmodifyinfo rule result cache."""
+
+import pickle
+from collections import OrderedDict
+from typing import Hashable
+
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.library import Album  # type: ignore
+
+from beetsplug.importmodifyinfo.cache import DELETE
+from beetsplug.importmodifyinfo.cache import CacheInfo
+from beetsplug.importmodifyinfo.cache import RuleCache
+from beetsplug.importmodifyinfo.cache import freeze
+from beetsplug.importmodifyinfo.cache import replay_edits
+
+
+def test_key() -> None:
+    """Test that keys only depend on the cache's fields."""
+    cache = RuleCache(2, {"genre", "album"})
+    assert cache.fields == ["album", "genre"]
+    key = cache.key(None, Album(album="a", genre="g", label="l"))
+    assert key == (("album", "a"), ("genre", "g"))
+    assert cache.key(None, Album(album="a", genre="g", label="m")) == key
+
+    cache = RuleCache(2, None)
+    assert cache.key(None, Album(album="a")) != cache.key(
+        None, Album(album="a", label="l")
+    )
+
+
+def test_lru() -> None:
+    """Test that the least recently used entries are evicted."""
+    cache = RuleCache(2, ())
+    cache.put("a", [("album", "a")])
+    cache.put("b", [("album", "b")])
+    assert cache.get("a") == [("album", "a")]
+    cache.put("c", [("album", "c")])
+    assert cache.get("b") is None
+    assert cache.get("c") == [("album", "c")]
+    assert cache.info() == CacheInfo(hits=2, misses=1, maxsize=2, currsize=2)
+
+    cache.clear()
+    assert cache.info() == CacheInfo(hits=0, misses=0, maxsize=2, currsize=0)
+
+
+def test_concurrent_eviction() -> None:
+    """Test that entries evicted by another thread are tolerated."""
+
+    class EvictingDict(OrderedDict):  # type: ignore[type-arg]
+        """Entries evicted by another thread just before being moved."""
+
+        def move_to_end(self, key: Hashable, last: bool = True) -> None:
+            self.clear()
+            super().move_to_end(key, last)
+
+    cache = RuleCache(2, ())
+    cache.put("a", [("album", "a")])
+    cache.entries = EvictingDict(cache.entries)
+    assert cache.get("a") == [("album", "a")]
+    cache.put("b", [("album", "b")])
+    assert cache.info() == CacheInfo(hits=1, misses=0, maxsize=2, currsize=0)
+
+
+def test_freeze() -> None:
+    """Test that field values are made hashable."""
+    assert freeze(["a", ["b"]]) == ("a", ("b",))
+    assert freeze({"a": 1}) == "{'a': 1}"
+    assert freeze(1.5) == 1.5
+
+
+def test_replay_edits() -> None:
+    """Test that edits are replayed in order."""
+    values = ["a"]
+    info = AlbumInfo(tracks=[], album="old", label="label")
+    replay_edits(
+        info,
+        [("label", DELETE), ("catalognum", DELETE), ("album", "new"), ("x", values)],
+    )
+    assert "label" not in info
+    assert info.album == "new"
+    assert info.x == values
+    assert info.x is not values
+
+
+def test_delete_pickle() -> None:
+    """Test that deletions keep their identity when pickled."""
+    edits = pickle.loads(pickle.dumps([("label", DELETE)]))  # noqa: S301
+    assert edits[0][1] is DELETE
+    assert repr(DELETE) == "DELETE"
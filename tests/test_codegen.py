@@ -0,0 +1,135 @@
+"""Tests for the importmodifyinfo rule compiler."""
+
+from typing import Any
+from typing import Dict
+from typing import List
+
+import pytest
+from beets.dbcore.query import AndQuery  # type: ignore
+from beets.dbcore.query import FalseQuery
+from beets.dbcore.query import NumericQuery
+from beets.dbcore.query import OrQuery
+from beets.dbcore.query import TrueQuery
+from beets.library import Album  # type: ignore
+
+from beetsplug.importmodifyinfo.codegen import RuleCompiler
+from beetsplug.importmodifyinfo.codegen import compile_rules
+from beetsplug.importmodifyinfo.engine import Rule
+
+from .test_plugin import ImportModifyInfoTestCase
+from .test_plugin import new_albuminfo
+from .test_plugin import new_trackinfo
+
+
+ALBUM_RULES = [
+    ["album:=album album=b", "album:b album=c", "album:=c album=a"],
+    ["album:=~ALBUM flex=x", "flex:=x album=y", "album:=~Y year=1"],
+    ["album::^al.*m$ flex=regex", "album::^x flex=nomatch"],
+    ["album:ALB albumtype=ep", "^albumtype:ep flex=not", "albumtype:ep flex=ep"],
+    ["album:a , label:nomatch flex=or", "year:2000..2001 year=1990"],
+    ["year:0 flex=$album", "flex:album flex! label=$flex", "flex:album year=2"],
+    ["albumtypes:album albumtypes='ep; remix'", "albumtypes:=ep flex=list"],
+    ["comp:false flex=comp", "comp:true flex=nomatch", "flex:comp comp=true"],
+    ["mb_albumid:album_id flex=$mb_albumid", "nonexistent:x flex=nomatch"],
+    ["year:..1 flex=max", "year:2000.. label=nomatch", "year:.. albumtype=any"],
+]
+
+TRACK_RULES = [
+    ["singleton:true title=single", "singleton:false title=nomatch"],
+    ["title:title title=$artist", "title:=artist title='$title $length'"],
+    ["title:=~TITLE track_flex! title=x", "track_flex:flex title=nomatch"],
+    ["album_id:1 title=nomatch", "length:0 title=zero", "title:zero length=1"],
+    ["filesize:=0 title=size", "bitrate:=0 title=$bitrate"],
+]
+
+
+class TestCompiledEngine(ImportModifyInfoTestCase):
+    """Test that compiled rules behave as interpreted rules."""
+
+    @pytest.mark.parametrize("rules", ALBUM_RULES)
+    def test_album_equivalence(self, rules: List[str]) -> None:
+        """Test that compiled album rules produce the interpreted results."""
+        self._setup_config(modify_albuminfo=rules)
+        expected = new_albuminfo()
+        self.plugin.apply_albuminfo_rules(expected)
+
+        self.load_plugin()
+        self._setup_config(engine="compiled")
+        albuminfo = new_albuminfo()
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo == expected
+
+    @pytest.mark.parametrize("rules", TRACK_RULES)
+    def test_track_equivalence(self, rules: List[str]) -> None:
+        """Test that compiled track rules produce the interpreted results."""
+        self._setup_config(modify_trackinfo=rules, batch_tracks=True)
+        expected = new_albuminfo()
+        expected_track = new_trackinfo()
+        self.plugin.apply_albuminfo_rules(expected)
+        self.plugin.apply_trackinfo_rules(expected_track)
+
+        self.load_plugin()
+        self._setup_config(engine="compiled")
+        albuminfo = new_albuminfo()
+        trackinfo = new_trackinfo()
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        self.plugin.apply_trackinfo_rules(trackinfo)
+        assert albuminfo == expected
+        assert trackinfo == expected_track
+
+    def test_source(self) -> None:
+        """Test that field values are read once and after modification."""
+        self._setup_config(
+            engine="compiled",
+            modify_albuminfo=[
+                "album:a album=b",
+                "album:b year:2000..2001 flex=c",
+                "added:2020 , ^comp:true flex=d",
+                "album:=c flex=d",
+            ],
+        )
+        self.plugin.set_rules()
+        assert self.plugin.rulesets.album.program.source.splitlines()[2:] == [
+            "    v0 = get('album')",
+            "    if c3 in as_string(v0).lower():",
+            "        apply(0)",
+            "        v0 = get('album')",
+            "    v1 = get('year')",
+            "    if (c4 in as_string(v0).lower()) and (c5(v1)):",
+            "        apply(1)",
+            "    v2 = get('comp')",
+            "    if (c6(obj)) or (not (v2 == c7)):",
+            "        apply(2)",
+            "    if v0 == c8:",
+            "        apply(3)",
+            "    return None",
+        ]
+
+
+def test_expressions() -> None:
+    """Test expressions for queries parse_query_parts doesn't produce."""
+    compiler = RuleCompiler([], Album)
+    assert compiler.expression(AndQuery([])) == "True"
+    assert compiler.expression(OrQuery([])) == "False"
+    assert compiler.expression(TrueQuery()) == "True"
+    assert compiler.expression(FalseQuery()) == "False"
+
+
+@pytest.mark.parametrize(
+    "pattern,values",
+    [
+        ("5", {"5": True, 5: True, "6": False, None: False}),
+        ("4..6", {"5": True, 4: True, 7: False, "3.5": False}),
+        ("..6", {6: True, 7: False}),
+    ],
+)
+def test_numeric_flexible(pattern: str, values: Dict[Any, bool]) -> None:
+    """Test numeric queries against flexible fields."""
+    query = NumericQuery("flexnum", pattern)
+    program = compile_rules([Rule("", query, (), ())], Album)
+    for value, expected in values.items():
+        album = Album() if value is None else Album(flexnum=value)
+        matched: List[int] = []
+        program(album, matched.append)
+        assert bool(matched) is expected
+        assert query.match(album) is expected
@@ -0,0 +1,318 @@
+"""Tests for the importmodifyinfo rule engine."""
+
+import asyncio
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pytest
+from beets.library import Album  # type: ignore
+from beets.library import DefaultTemplateFunctions
+from beets.library import Item
+from beets.library import Library
+from beets.ui import UserError  # type: ignore
+from beets.util import functemplate  # type: ignore
+
+from beetsplug.importmodifyinfo.analysis import rule_fields
+from beetsplug.importmodifyinfo.cache import DELETE
+from beetsplug.importmodifyinfo.cache import RuleCache
+from beetsplug.importmodifyinfo.engine import LazyTemplate
+from beetsplug.importmodifyinfo.engine import RuleSet
+from beetsplug.importmodifyinfo.engine import TemplateContext
+from beetsplug.importmodifyinfo.engine import parse_rules
+from beetsplug.importmodifyinfo.engine import render
+from beetsplug.importmodifyinfo.infomodel import AlbumInfoModel
+from beetsplug.importmodifyinfo.infomodel import TrackInfoModel
+from beetsplug.importmodifyinfo.stats import Stats
+
+from .test_plugin import new_albuminfo
+from .test_plugin import new_trackinfo
+
+
+ALBUM_RULES = ["album:album album=new flex!", "album:new label=$album"]
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_apply(compiled: bool) -> None:
+    """Test applying album rules to album info."""
+    ruleset = RuleSet.compile(ALBUM_RULES, Album, compiled)
+    assert (ruleset.program is not None) is compiled
+
+    albuminfo = new_albuminfo()
+    edits = ruleset.apply(albuminfo)
+    assert edits == [("flex", DELETE), ("album", "new"), ("label", "new")]
+    assert (albuminfo.album, albuminfo.label) == ("new", "new")
+    assert "flex" not in albuminfo
+
+
+def test_apply_track() -> None:
+    """Test applying track rules to track info."""
+    ruleset = RuleSet.compile(["title:title title=$artist"], Item)
+    trackinfo = new_trackinfo()
+    assert ruleset.apply(trackinfo) == [("title", "artist")]
+    assert trackinfo.title == "artist"
+
+
+def test_apply_many() -> None:
+    """Test applying track rules to the tracks of an album."""
+    ruleset = RuleSet.compile(["albumtype:album flex=a", "title:x title=y"], Item)
+    albuminfo = new_albuminfo()
+    albuminfo.tracks.append(new_trackinfo())
+    albuminfo.tracks[1].title = "x"
+
+    edits = ruleset.apply_many(albuminfo.tracks, albuminfo)
+    assert edits == [[("flex", "a")], [("flex", "a"), ("title", "y")]]
+    assert [track.title for track in albuminfo.tracks] == ["title", "y"]
+
+    # Without the album info, the tracks have no album type to match.
+    tracks = [new_trackinfo(), new_trackinfo()]
+    assert ruleset.apply_many(tracks) == [[], []]
+
+
+def test_caches() -> None:
+    """Test that results are looked up in the rule set's caches."""
+    rules = parse_rules(ALBUM_RULES, Album)
+    cache = RuleCache(2, rule_fields(rules))
+    ruleset = RuleSet(rules, Album, caches=[cache])
+    assert ruleset.cache is cache
+
+    ruleset.apply(new_albuminfo())
+    albuminfo = new_albuminfo()
+    assert ruleset.apply(albuminfo) == [
+        ("flex", DELETE),
+        ("album", "new"),
+        ("label", "new"),
+    ]
+    assert albuminfo.label == "new"
+    assert cache.info().hits == 1
+
+
+def test_parse_rules() -> None:
+    """Test that rules already parsed are reused."""
+    rules = parse_rules(ALBUM_RULES, Album)
+    previous = {rule.modify: rule for rule in rules}
+    reparsed = parse_rules([*ALBUM_RULES, ALBUM_RULES[0]], Album, previous=previous)
+    assert reparsed == [*rules, rules[0]]
+
+    with pytest.raises(UserError, match=r"^albums: no query found in entry x=y$"):
+        parse_rules(["x=y"], Album, "albums")
+
+
+def test_lazy_template() -> None:
+    """Test that templates are only compiled when first evaluated."""
+    ruleset = RuleSet.compile(ALBUM_RULES, Album)
+    template = ruleset.rules[1].mods[0][1]
+    assert isinstance(template, LazyTemplate)
+    assert "compiled" not in vars(template)
+    assert template == pickle.loads(pickle.dumps(template))  # noqa: S301
+
+    ruleset.apply(new_albuminfo())
+    assert "compiled" in vars(template)
+    with pytest.raises(AttributeError):
+        template.missing  # noqa: B018
+
+
+def test_apply_async() -> None:
+    """Test applying rules from asyncio, in the default and given executors."""
+    ruleset = RuleSet.compile(["title:title title=$artist"], Item)
+    trackinfo = new_trackinfo()
+    assert asyncio.run(ruleset.apply_async(trackinfo)) == [("title", "artist")]
+    assert trackinfo.title == "artist"
+
+    albuminfo = new_albuminfo()
+    with ThreadPoolExecutor(2) as executor:
+        edits = asyncio.run(
+            ruleset.apply_many_async(iter(albuminfo.tracks), albuminfo, executor)
+        )
+    assert edits == [[("title", "artist")]]
+    assert albuminfo.tracks[0].title == "artist"
+
+
+def test_threads() -> None:
+    """Test applying rules from several threads at once."""
+    rules = [f"album:'<{i}>' flex={i}" for i in range(100)]
+    ruleset = RuleSet.compile([*rules, "album::^<1 label=x"], Album)
+    infos = [new_albuminfo() for _ in range(50)]
+    for i, info in enumerate(infos):
+        info.album = f"<{i}>"
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(ruleset.apply, infos))
+    assert results == [
+        [("flex", str(i)), *([("label", "x")] if str(i).startswith("1") else [])]
+        for i in range(50)
+    ]
+
+
+@pytest.mark.parametrize(
+    "template",
+    [
+        "$album $flex $missing",
+        "%upper{$albumartist}",
+        "$year-$albumtype",
+        "%ifdef{flex,yes,no} $album",
+    ],
+)
+def test_render_album(template: str) -> None:
+    """Test that templates render as `evaluate_template` would."""
+    albuminfo = new_albuminfo()
+    albuminfo.artist = ""
+    album = AlbumInfoModel(albuminfo)
+    expected = AlbumInfoModel(albuminfo).evaluate_template(template)
+    assert render(LazyTemplate(template), album) == expected
+    assert render(functemplate.template(template), album) == expected
+
+
+@pytest.mark.parametrize("template", ["$title $singleton", "$artist $track_flex"])
+def test_render_track(template: str) -> None:
+    """Test that track templates render with getters and album fallbacks."""
+    albuminfo = new_albuminfo()
+    item = TrackInfoModel(albuminfo.tracks[0], albuminfo)
+    expected = TrackInfoModel(albuminfo.tracks[0], albuminfo).evaluate_template(
+        template
+    )
+    assert render(LazyTemplate(template), item) == expected
+
+
+def test_render_projection() -> None:
+    """Test that only the fields a template reads are read from the info."""
+    album = AlbumInfoModel(new_albuminfo())
+    render(LazyTemplate("$album $flex"), album)
+    assert set(album._values_fixed.values) == {"album"}
+    assert set(album._values_flex.values) == {"flex"}
+
+    # Templates with functions which may read anything read every field.
+    render(LazyTemplate("%ifdef{flex,yes,no}"), album)
+    assert "flex_none" in album._values_flex.values
+
+
+def test_render_library() -> None:
+    """Test that objects in a library format every field."""
+    lib = Library(":memory:")
+    album = lib.add_album([Item(title="t", album="a")])
+    album.flex = "f"
+    assert render(LazyTemplate("$album $flex $missing"), album) == "a f $missing"
+
+
+PARTITIONED_RULES = [
+    "data_source:discogs flex=discogs",
+    "album:album label=any",
+    "data_source:=MusicBrainz flex=musicbrainz",
+    "^data_source:Discogs year=1",
+]
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_partitions(compiled: bool) -> None:
+    """Test that rules are applied from their data source's partition."""
+    stats = Stats()
+    ruleset = RuleSet(parse_rules(PARTITIONED_RULES, Album), Album, compiled, stats)
+    assert ruleset.program is None
+
+    for source, expected in [
+        ("Discogs", [("flex", "discogs"), ("label", "any")]),
+        ("MusicBrainz", [("label", "any"), ("flex", "musicbrainz"), ("year", 1)]),
+        (None, [("label", "any"), ("year", 1)]),
+        ("Discogs", [("flex", "discogs"), ("label", "any")]),
+    ]:
+        albuminfo = new_albuminfo()
+        albuminfo.data_source = source
+        assert ruleset.apply(albuminfo) == expected
+
+    partitions = ruleset.partitions
+    assert list(partitions) == ["Discogs", "MusicBrainz", None]
+    assert partitions["Discogs"].modifies == PARTITIONED_RULES[:2]
+    assert partitions[None].modifies == [PARTITIONED_RULES[1], PARTITIONED_RULES[3]]
+    assert (partitions["Discogs"].program is not None) is compiled
+    assert stats.rules["album"][PARTITIONED_RULES[1]].evaluations == 4
+
+
+def test_partitions_unchanged() -> None:
+    """Test that rules aren't partitioned if none or any may change the source."""
+    assert RuleSet.compile(ALBUM_RULES, Album).conditions is None
+    rules = [*PARTITIONED_RULES, "album:x data_source=Discogs"]
+    ruleset = RuleSet.compile(rules, Album)
+    assert ruleset.conditions is None
+    assert ruleset.partition(AlbumInfoModel(new_albuminfo())) is ruleset
+
+
+def test_partitions_many() -> None:
+    """Test applying partitioned track rules to the tracks of an album."""
+    ruleset = RuleSet.compile(
+        ["data_source:Discogs album:album flex=d", "album:album flex2=$flex"], Item
+    )
+    albuminfo = new_albuminfo()
+    albuminfo.tracks.append(new_trackinfo())
+    albuminfo.tracks[0].data_source = "Discogs"
+    edits = ruleset.apply_many(albuminfo.tracks, albuminfo)
+    assert edits == [[("flex", "d"), ("flex2", "d")], [("flex2", "flex")]]
+
+
+def test_template_context(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that templates share values and pure function results per object."""
+    calls: List[str] = []
+
+    def upper(s: str) -> str:
+        calls.append(s)
+        return s.upper()
+
+    monkeypatch.setattr(DefaultTemplateFunctions, "tmpl_upper", staticmethod(upper))
+    rules = [
+        "album:album flex=%upper{$album} flex2=%upper{$album} flex3=%lower{$album}",
+        "album:album album=new",
+        "album:new label=%upper{$album}-%upper{$album}",
+    ]
+    ruleset = RuleSet.compile(rules, Album)
+    albuminfo = new_albuminfo()
+    ruleset.apply(albuminfo)
+    assert (albuminfo.flex, albuminfo.flex2, albuminfo.label) == (
+        "ALBUM",
+        "ALBUM",
+        "NEW-NEW",
+    )
+    assert calls == ["album", "new"]
+
+    # Each object has a context of its own.
+    ruleset.apply(new_albuminfo())
+    assert calls == ["album", "new", "album", "new"]
+
+
+def test_template_context_invalidate() -> None:
+    """Test that values are read again once their fields are modified."""
+    albuminfo = new_albuminfo()
+    item = TrackInfoModel(albuminfo.tracks[0], albuminfo)
+    item.artist = ""
+    context = TemplateContext(item)
+    assert context.values(("title", "missing")) == {"title": "title"}
+    assert context.values(("albumartist", "artist")) == {
+        "albumartist": "artist",
+        "artist": "artist",
+    }
+
+    item.title = "new"
+    item.artist = "new artist"
+    assert context.values(("title",)) == {"title": "title"}
+    context.invalidate(["title"])
+    assert context.values(("missing", "title")) == {"title": "new"}
+
+    # Artists fall back to each other, so either is read again with both.
+    context.invalidate(["albumartist"])
+    assert context.values(("artist", "albumartist")) == {
+        "artist": "new artist",
+        "albumartist": "artist",
+    }
+
+
+def test_template_context_computed() -> None:
+    """Test that computed fields are read again once any field is modified."""
+    albuminfo = new_albuminfo()
+    item = TrackInfoModel(albuminfo.tracks[0], albuminfo)
+    context = TemplateContext(item)
+    assert context.values(("singleton", "title")) == {
+        "singleton": "True",
+        "title": "title",
+    }
+    assert context.computed == {"singleton"}
+    context.invalidate([])
+    assert context.computed == {"singleton"}
+    context.invalidate(["flex"])
+    assert (context.computed, set(context.formatted)) == (set(), {"title"})
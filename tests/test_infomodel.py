@@ -0,0 +1,130 @@
+"""Tests for the importmodifyinfo info model views."""
+
+from typing import Any
+from typing import Dict
+
+import pytest
+from beets.autotag import apply_item_metadata  # type: ignore
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.autotag.hooks import TrackInfo
+from beets.dbcore import Model  # type: ignore
+from beets.library import Album  # type: ignore
+from beets.library import Item
+
+from beetsplug.importmodifyinfo.infomodel import AlbumInfoModel
+from beetsplug.importmodifyinfo.infomodel import TrackInfoModel
+
+from .test_plugin import apply_album_metadata
+from .test_plugin import new_albuminfo
+from .test_plugin import new_trackinfo
+
+
+# The IDs an album view has for the test album info.
+ALBUM_IDS = {
+    "mb_albumid": "album_id",
+    "mb_albumartistid": "artist_id",
+    "mb_albumartistids": ["artists_ids"],
+    "mb_releasegroupid": "releasegroup_id",
+}
+
+
+def model_values(model: Model) -> Dict[str, Any]:
+    """Return the non-computed values of a model."""
+    return {key: model.get(key) for key in sorted(model.keys())}
+
+
+def album_from_info(info: AlbumInfo) -> Album:
+    """Copy an AlbumInfo into a new Album."""
+    album = Album()
+    apply_album_metadata(info, album)
+    return album
+
+
+def item_from_info(info: TrackInfo) -> Item:
+    """Copy a TrackInfo into a new Item."""
+    item = Item()
+    apply_item_metadata(item, info)
+    return item
+
+
+def test_album_values() -> None:
+    """Test that an album view has the values of a copied album, and its IDs."""
+    info = new_albuminfo()
+    expected = {**model_values(album_from_info(info)), **ALBUM_IDS}
+    assert model_values(AlbumInfoModel(info)) == expected
+
+
+def test_album_values_none() -> None:
+    """Test that an album view handles unset info fields."""
+    info = AlbumInfo(tracks=[], album="album", artist=None, year=None)
+    assert model_values(AlbumInfoModel(info)) == model_values(album_from_info(info))
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {},
+        {"artist_id": None, "artists_ids": []},
+        {"mb_trackid": "override"},
+        {"track_id": None, "title": None},
+    ],
+)
+def test_track_values(values: Dict[str, Any]) -> None:
+    """Test that a track view has the values of a copied item."""
+    info = new_trackinfo()
+    info.update(values)
+    assert model_values(TrackInfoModel(info)) == model_values(item_from_info(info))
+
+
+def test_assignment() -> None:
+    """Test that assignments are kept by the view and converted."""
+    info = new_albuminfo()
+    album = AlbumInfoModel(info)
+    album["year"] = "1999"
+    album["flex"] = "new flex"
+    assert album.year == 1999
+    assert album["flex"] == "new flex"
+    assert info.year == 0
+    assert info.flex == "flex"
+
+
+def test_retain() -> None:
+    """Test that retained values survive removal from the info."""
+    info = new_albuminfo()
+    album = AlbumInfoModel(info)
+    album.retain(["flex", "album"])
+    del info["flex"]
+    del info["album"]
+    assert album["flex"] == "flex"
+    assert album.album == "album"
+    assert "flex" in album
+
+
+def test_missing() -> None:
+    """Test fields with no value in the info."""
+    album = AlbumInfoModel(new_albuminfo())
+    assert album._values_flex["flex"] == "flex"
+    assert "flex_none" not in album
+    assert album.get("flex_none", "default") == "default"
+    with pytest.raises(KeyError):
+        album["flex_none"]
+    assert album._values_flex.get("flex_none") is None
+    with pytest.raises(KeyError):
+        album._values_flex["flex_none"]
+
+
+def test_album_ids() -> None:
+    """Test that an album view has the IDs of the album info.
+
+    A copied album doesn't, as the importer sets them from its items.
+    """
+    info = new_albuminfo()
+    album = AlbumInfoModel(info)
+    assert {field: album[field] for field in ALBUM_IDS} == ALBUM_IDS
+    copied = album_from_info(info)
+    assert not any(copied.get(field) for field in ALBUM_IDS)
+
+    info.album_id = None
+    assert AlbumInfoModel(info).mb_albumid == ""
+    info.mb_albumid = "override"
+    assert AlbumInfoModel(info).mb_albumid == "override"
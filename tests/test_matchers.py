@@ -0,0 +1,93 @@
+"""Tests for the importmodifyinfo combined pattern matchers."""
+
+import re
+from typing import Any
+from typing import Dict
+from typing import List
+
+import pytest
+from beets.dbcore.query import RegexpQuery  # type: ignore
+from beets.dbcore.query import SubstringQuery
+
+from beetsplug.importmodifyinfo.matchers import RegexpMatcher
+from beetsplug.importmodifyinfo.matchers import SubstringMatcher
+from beetsplug.importmodifyinfo.matchers import combinable
+from beetsplug.importmodifyinfo.matchers import trie_pattern
+
+
+SUBSTRINGS = ["", "a", "ab", "abc", "b", "BC", "bcd", "x", "ÄB", "İ"]
+REGEXPS = ["^a", "c$", "b+c", "", "a.c", "\\bab", "(?i:AB)", "x|y", "b\\nc"]
+VALUES = ["", "a", "abc", "xabcd", "ABCD", "äbc", "ab\nc", "İ", 1, None, ["a"]]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_substrings(value: object) -> None:
+    """Test that substrings match as substring queries do."""
+    matcher = SubstringMatcher()
+    for position, substring in enumerate(SUBSTRINGS):
+        matcher.add(substring, position)
+    expected = [
+        position
+        for position, substring in enumerate(SUBSTRINGS)
+        if SubstringQuery.value_match(substring, value)
+    ]
+    assert matcher.match(value) == expected
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_regexps(value: object) -> None:
+    """Test that regular expressions match as regular expression queries do."""
+    matcher = RegexpMatcher()
+    for position, expression in enumerate(REGEXPS):
+        matcher.add(re.compile(expression), position)
+    expected = [
+        position
+        for position, expression in enumerate(REGEXPS)
+        if RegexpQuery.value_match(re.compile(expression), value)
+    ]
+    assert matcher.match(value) == expected
+
+
+def test_shared_patterns() -> None:
+    """Test that rules with the same pattern share it, and adding recompiles."""
+    matcher = SubstringMatcher()
+    matcher.add("a", 0)
+    matcher.add("A", 2)
+    assert matcher.match("a") == [0, 2]
+    matcher.add("b", 1)
+    assert matcher.match("ab") == [0, 1, 2]
+
+    regexps = RegexpMatcher()
+    regexps.add(re.compile("a"), 0)
+    assert regexps.match("a") == [0]
+    regexps.add(re.compile("a"), 1)
+    assert regexps.match("a") == [0, 1]
+
+
+@pytest.mark.parametrize(
+    ("expression", "expected"),
+    [("a.c", True), ("(a)\\1", False), ("(?i)a", False), ("(?u)a", False)],
+)
+def test_combinable(expression: str, expected: bool) -> None:
+    """Test that expressions with groups or flags aren't combined."""
+    assert combinable(re.compile(expression)) is expected
+
+
+@pytest.mark.parametrize(
+    ("strings", "expected"),
+    [
+        (["abc"], "abc"),
+        (["ab", "abc"], "ab(?:c)?"),
+        (["ab", "ac"], "a(?:b|c)"),
+        (["", "a"], "(?:a)?"),
+    ],
+)
+def test_trie_pattern(strings: List[str], expected: str) -> None:
+    """Test that tries are written with chains of characters collapsed."""
+    trie: Dict[str, Any] = {}
+    for string in strings:
+        node = trie
+        for char in string:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    assert trie_pattern(trie) == expected
@@ -1,19 +1,48 @@
 """Tests for the 'importmodifyinfo' plugin."""
 
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from typing import Any
 from typing import List
+from typing import Optional
+from typing import Tuple
 from typing import Union
 from typing import get_type_hints
 
 import beets.plugins  # type: ignore
 import pytest
+from beets.autotag import SPECIAL_FIELDS  # type: ignore
+from beets.autotag import Recommendation
 from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.autotag.hooks import AlbumMatch
 from beets.autotag.hooks import TrackInfo
+from beets.autotag.hooks import TrackMatch
+from beets.importer import ImportTask  # type: ignore
+from beets.importer import SingletonImportTask
+from beets.importer import action
+from beets.library import Album  # type: ignore
+from beets.library import Item
+from beets.library import parse_query_parts
 from beets.plugins import BeetsPlugin
 from beets.plugins import find_plugins
 from beets.plugins import send
-from beets.test.helper import TestHelper  # type: ignore
+from beets.test.helper import ImportSessionFixture  # type: ignore
+from beets.test.helper import TestHelper
 from beets.ui import UserError  # type: ignore
+from beets.util.functemplate import Template  # type: ignore
+
+from beetsplug.importmodifyinfo import bulk
+from beetsplug.importmodifyinfo.cache import DELETE
+from beetsplug.importmodifyinfo.engine import parse_modify
+from beetsplug.importmodifyinfo.engine import process_rules
+from beetsplug.importmodifyinfo.infomodel import AlbumInfoModel
+from beetsplug.importmodifyinfo.infomodel import TrackInfoModel
+from beetsplug.importmodifyinfo.snapshot import SnapshotStore
 
 
 def new_trackinfo() -> TrackInfo:
@@ -63,6 +92,29 @@ def set_default_values(info: Union[TrackInfo, AlbumInfo]) -> None:
                 info[field] = [field]
 
 
+def apply_album_metadata(album_info: AlbumInfo, album: Album) -> None:
+    """Set the album's metadata to match the AlbumInfo object.
+
+    This is how albums were copied from their info before rules were
+    applied to views of the info, kept as the reference for them.
+    """
+    album.artist = album_info.artist
+    album.artists = album_info.artists
+    album.artist_sort = album_info.artist_sort
+    album.artists_sort = album_info.artists_sort
+    album.artist_credit = album_info.artist_credit
+    album.artists_credit = album_info.artists_credit
+    album.year = album_info.year
+
+    for field, value in album_info.items():
+        # We only overwrite fields that are not already hardcoded.
+        if field in SPECIAL_FIELDS["album"]:
+            continue
+        if value is None:
+            continue
+        album[field] = value
+
+
 class BeetsTestCase(TestHelper):  # type: ignore
     """TestHelper based TestCase for beets."""
 
@@ -76,6 +128,10 @@ class BeetsTestCase(TestHelper):  # type: ignore
 
     def load_plugins(self, *plugins: str) -> List[BeetsPlugin]:
         """Load and initialize plugins by names."""
+        for cls in beets.plugins._classes:
+            # Listeners are registered on the class, so drop those of
+            # instances from earlier tests.
+            cls.listeners = cls._raw_listeners = None
         beets.plugins._instances.clear()
         beets.plugins._classes.clear()
         super().load_plugins(*plugins)
@@ -172,6 +228,22 @@ class TestImportModifyInfoPlugin(ImportModifyInfoTestCase):
         assert albuminfo["album"] == "new album"
         assert albuminfo["artist"] == "new artist"
 
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "mb_albumid:=album_id",
+            "mb_albumartistid:=artist_id",
+            "mb_albumartistids:artists_ids",
+            "mb_releasegroupid:=releasegroup_id",
+        ],
+    )
+    def test_album_ids(self, query: str) -> None:
+        """Test that album rules match the IDs of the album info."""
+        albuminfo = new_albuminfo()
+        self._setup_config(modify_albuminfo=[f"{query} genre=matched"])
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo["genre"] == "matched"
+
     def test_album_unmatched(self) -> None:
         """Test rules not applied to an AlbumInfo object."""
         albuminfo = new_albuminfo()
@@ -318,3 +390,1188 @@ class TestImportModifyInfoPlugin(ImportModifyInfoTestCase):
         assert (
             trackinfo[field] == new_value
         ), f"field {field} was not set to {new_value} with rule {rule}"
+
+    def test_compiled_mods(self) -> None:
+        """Test that mods are compiled once when the rules are set."""
+        self._setup_config(
+            modify_albuminfo=["album:album year=1900 albumtypes=$albumtype"]
+        )
+        self.plugin.set_rules()
+        rule = self.plugin.rulesets.album.rules[0]
+        (year, value, parse), (albumtypes, template, _) = rule.mods
+        assert (year, value, parse) == ("year", 1900, None)
+        assert albumtypes == "albumtypes"
+        assert isinstance(template, Template)
+        assert repr(rule) == "Rule('album:album year=1900 albumtypes=$albumtype')"
+
+        albuminfo = new_albuminfo()
+        albuminfo.albumtype = "ep"
+        albuminfo.albumtypes = []
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo.year == 1900
+        assert albuminfo.albumtypes == ["ep"]
+
+
+def process_rules_eagerly(rules: List[str], info: AlbumInfo) -> None:
+    """Apply album rules, rendering every template before matching."""
+    album = Album()
+    apply_album_metadata(info, album)
+    for modify in rules:
+        query, mods, dels = parse_modify(modify)
+        dbquery, _ = parse_query_parts(query, Album)
+        obj_mods = {
+            key: Album._parse(key, album.evaluate_template(value))
+            for key, value in mods.items()
+        }
+        if dbquery.match(album):
+            for field in dels:
+                info.pop(field, None)
+            for field, value in obj_mods.items():
+                album[field] = value
+                info[field] = album[field]
+
+
+class TestLazyEvaluation(ImportModifyInfoTestCase):
+    """Test that lazy mod evaluation matches eager evaluation."""
+
+    @pytest.mark.parametrize(
+        "rules",
+        [
+            ["albumtype::. ^albumtypes::[a-zA-Z] albumtypes=$albumtype"],
+            ["album:album album='new album'", "album:'new album' album='new album 2'"],
+            ["album:album album='new $album'", "album:'new album' flex='$album'"],
+            ["album:nomatch flex=$album", "album:album album=$flex flex!"],
+            ["flex:flex flex! album=$flex", "flex:flex year=$year"],
+            ["album:album year=$flex", "year:0 album='zero year'"],
+        ],
+    )
+    def test_matches_eager(self, rules: List[str]) -> None:
+        """Test that lazily evaluated rules produce the eager results."""
+        expected = new_albuminfo()
+        expected.albumtype = "album"
+        expected.albumtypes = []
+        process_rules_eagerly(rules, expected)
+
+        albuminfo = new_albuminfo()
+        albuminfo.albumtype = "album"
+        albuminfo.albumtypes = []
+        self._setup_config(modify_albuminfo=rules)
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo == expected
+
+
+class TestRuleIndex(ImportModifyInfoTestCase):
+    """Test cases for the indexed rule dispatch."""
+
+    def test_buckets(self) -> None:
+        """Test that exact match rules are bucketed by field and value."""
+        self._setup_config(
+            modify_albuminfo=[
+                "album:=album album='new album'",
+                "album:=~ALBUM flex=new",
+                "album:album flex=other",
+                "album:=a , album:=b flex=or",
+            ]
+        )
+        self.plugin.set_rules()
+        index = self.plugin.rulesets.album.index
+        assert index.exact["album"]["album"] == [0]
+        assert index.folded["album"]["album"] == [1]
+        assert index.substrings["album"].positions == {"album": [2]}
+        assert index.fallback == [3]
+        assert index.fields == {"album"}
+
+    def test_matchers(self) -> None:
+        """Test that substring and regular expression rules are combined."""
+        self._setup_config(
+            modify_albuminfo=[
+                "album:ALB flex=a",
+                "album::^alb year=1",
+                "album::(a)lbum flex=grouped",
+                "album:other flex=b",
+                "album:=album artist::um$ flex=c",
+                "artist::^art flex=d",
+            ]
+        )
+        self.plugin.set_rules()
+        index = self.plugin.rulesets.album.index
+        assert index.regexps["album"].positions == {"^alb": [1]}
+        assert index.fallback == [2]
+        assert index.fields == {"album", "artist"}
+
+        album = Album()
+        apply_album_metadata(new_albuminfo(), album)
+        assert index.candidates(album) == [0, 1, 2, 4, 5]
+        assert index.candidates(album, 2) == [2, 4, 5]
+
+    def test_candidates(self) -> None:
+        """Test that only rules which may match are candidates."""
+        self._setup_config(
+            modify_albuminfo=[
+                "album:=other album='new album'",
+                "albumtypes:=x flex=list",
+                "album:album flex=other",
+                "album:=album flex=new",
+            ]
+        )
+        self.plugin.set_rules()
+        album = Album()
+        apply_album_metadata(new_albuminfo(), album)
+        assert self.plugin.rulesets.album.index.candidates(album) == [2, 3]
+        assert self.plugin.rulesets.album.index.candidates(album, 3) == [3]
+
+    def test_order_subsequent(self) -> None:
+        """Test that indexed rules can match previous modifications."""
+        self._setup_config(
+            modify_albuminfo=[
+                "album:=album album='new album'",
+                "album:=~'NEW ALBUM' album='new album 2'",
+                "album:=album flex=unreachable",
+            ]
+        )
+        albuminfo = new_albuminfo()
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo.album == "new album 2"
+        assert albuminfo.flex == "flex"
+
+    @pytest.mark.parametrize(
+        "rules",
+        [
+            ["album:=album album=b", "album:b album=c", "album:=c album=a"],
+            ["album:=album flex=x", "flex:=x album=y", "album:=~Y year=1"],
+            ["album:=~album album=$flex", "album:=flex flex!", "album:flex year=2"],
+            ["album:alb album=$flex", "album::^fl album=x", "album:x year=2"],
+        ],
+    )
+    def test_matches_linear(self, rules: List[str]) -> None:
+        """Test that indexed dispatch produces the linear scan results."""
+        self._setup_config(modify_albuminfo=rules)
+        self.plugin.set_rules()
+
+        expected = new_albuminfo()
+        album = Album()
+        apply_album_metadata(expected, album)
+        process_rules(self.plugin.rulesets.album.rules, expected, album)
+
+        albuminfo = new_albuminfo()
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo == expected
+
+
+class TestDependencyGraph(ImportModifyInfoTestCase):
+    """Test cases for skipping rules by their dependencies."""
+
+    @pytest.mark.parametrize(
+        "rules",
+        [
+            ["missing:a flex=x", "flex:flex album=y", "missing:b missing=c"],
+            ["missing:a missing=b", "missing:b flex=$missing", "flex:b year=1"],
+            ["flex:flex missing=a", "missing:a album=b", "missing:x flex=y"],
+        ],
+    )
+    def test_matches_linear(self, rules: List[str]) -> None:
+        """Test that skipping rules produces the linear scan results."""
+        self._setup_config(modify_albuminfo=rules)
+        self.plugin.set_rules()
+
+        expected = new_albuminfo()
+        album = Album()
+        apply_album_metadata(expected, album)
+        process_rules(self.plugin.rulesets.album.rules, expected, album)
+
+        albuminfo = new_albuminfo()
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo == expected
+
+    def test_explain(self) -> None:
+        """Test showing the analysis of the rules."""
+        self._setup_config(
+            modify_albuminfo=[
+                "album:=a flex=x",
+                "flex:x year=1",
+                "missing:b flex2=$genre",
+            ]
+        )
+        out = self.run_with_output("importmodifyinfo", "explain")
+        assert out.splitlines() == [
+            "album rules: 3, in 2 groups",
+            "  0: album:=a flex=x",
+            "      reads: album",
+            "      writes: flex",
+            "      after: -",
+            "      requires: album",
+            "      indexed by: album",
+            "      group: 1",
+            "  1: flex:x year=1",
+            "      reads: flex",
+            "      writes: year",
+            "      after: 0",
+            "      requires: flex",
+            "      indexed by: flex",
+            "      group: 1",
+            "  2: missing:b flex2=$genre",
+            "      reads: genre, missing",
+            "      writes: flex2",
+            "      after: -",
+            "      requires: missing",
+            "      indexed by: missing",
+            "      group: 2",
+            "  group 1: rules 0, 1",
+            "  group 2: rules 2 (skipped without its required fields)",
+        ]
+
+    def test_explain_partitioned(self) -> None:
+        """Test showing the data sources rules are partitioned by."""
+        self._setup_config(
+            modify_albuminfo=["data_source:=Discogs flex=x", "album:a flex=y"]
+        )
+        out = self.run_with_output("importmodifyinfo", "explain").splitlines()
+        partitioned = [line.strip() for line in out if "partitioned by" in line]
+        assert partitioned == ["partitioned by: data_source", "partitioned by: -"]
+
+
+class TestBatchTracks(ImportModifyInfoTestCase):
+    """Test cases for applying track rules to the tracks of albums."""
+
+    def new_albuminfo(self) -> AlbumInfo:
+        """Create an AlbumInfo object with two tracks."""
+        albuminfo = new_albuminfo()
+        albuminfo.tracks.append(new_trackinfo())
+        return albuminfo
+
+    def test_disabled(self) -> None:
+        """Test that album tracks are left alone by default."""
+        self._setup_config(modify_trackinfo=["title:title title='new title'"])
+        albuminfo = self.new_albuminfo()
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert [track.title for track in albuminfo.tracks] == ["title", "title"]
+
+    def test_tracks(self) -> None:
+        """Test that track rules apply to every track of an album."""
+        self._setup_config(
+            batch_tracks=True,
+            modify_trackinfo=["albumtype:album title='new $title'"],
+        )
+        albuminfo = self.new_albuminfo()
+        albuminfo.albumtype = "album"
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert [track.title for track in albuminfo.tracks] == [
+            "new title",
+            "new title",
+        ]
+
+    def test_setting(self) -> None:
+        """Test that the setting is read when the rules are built."""
+        self._setup_config(
+            batch_tracks=True, modify_trackinfo=["title:title title='new title'"]
+        )
+        self.plugin.set_rules()
+        self._setup_config(batch_tracks=False)
+        albuminfo = self.new_albuminfo()
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo.tracks[0].title == "new title"
+
+    def test_album_modified(self) -> None:
+        """Test that track rules see the album after album rules."""
+        self._setup_config(
+            batch_tracks=True,
+            modify_albuminfo=["flex:flex flex='new flex'"],
+            modify_trackinfo=["flex:'new flex' title=$flex"],
+        )
+        albuminfo = self.new_albuminfo()
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo.tracks[0].title == "new flex"
+        assert "flex" not in albuminfo.tracks[0]
+
+    @pytest.mark.parametrize("album_first", [True, False])
+    def test_dedup(self, album_first: bool) -> None:
+        """Test that tracks are only processed once."""
+        self._setup_config(
+            batch_tracks=True, modify_trackinfo=["title:title title='$title x'"]
+        )
+        albuminfo = self.new_albuminfo()
+        track = albuminfo.tracks[0]
+        if album_first:
+            self.plugin.apply_albuminfo_rules(albuminfo)
+            self.plugin.apply_trackinfo_rules(track)
+        else:
+            self.plugin.apply_trackinfo_rules(track)
+            self.plugin.apply_albuminfo_rules(albuminfo)
+        assert [track.title for track in albuminfo.tracks] == ["title x", "title x"]
+
+    def test_album_level_rules(self) -> None:
+        """Test that rules only reading album fields are tested once."""
+        self._setup_config(
+            batch_tracks=True,
+            modify_trackinfo=[
+                "albumtype:album flex=a",
+                "title:title track_flex=b",
+                "albumtype:album year:0 year=1999",
+                "flex:a title=c",
+                "singleton:true title=d",
+                "catalognum:x , label:y title=e",
+                "media:x flex=f",
+            ],
+        )
+        rulesets = self.plugin.set_rules()
+        albuminfo = self.new_albuminfo()
+        albuminfo.albumtype = "album"
+        items = [TrackInfoModel(track, albuminfo) for track in albuminfo.tracks]
+        assert rulesets.item.album_level_rules(items) == {0, 4, 5}
+
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        for track in albuminfo.tracks:
+            assert track.flex == "a"
+            assert track.year == 1999
+            assert track.title == "d"
+
+
+class TestApplyOnChoice(ImportModifyInfoTestCase):
+    """Test cases for applying rules only to the chosen candidate."""
+
+    def setup_method(self) -> None:
+        """Set up test cases with rules applied on choice."""
+        super().setup_method()
+        self._setup_config(
+            apply_on_choice=True,
+            modify_albuminfo=["album:album flex=new"],
+            modify_trackinfo=["title:title title=new"],
+        )
+        self.load_plugin()
+
+    def look_up(self, task: ImportTask, *infos: Union[AlbumInfo, TrackInfo]) -> None:
+        """Look up candidates for an import task, receiving their info."""
+
+        def lookup_candidates() -> None:
+            for info in infos:
+                event = "albuminfo_received" if task.is_album else "trackinfo_received"
+                send(event, info=info)
+
+        task.lookup_candidates = lookup_candidates
+        send("import_task_start", session=None, task=task)
+        task.lookup_candidates()
+
+    def choose(self, task: ImportTask, choice: Any) -> None:
+        """Choose a match or action for an import task."""
+        task.set_choice(choice)
+        send("import_task_choice", session=None, task=task)
+
+    def test_album(self) -> None:
+        """Test that only the chosen album candidate is modified."""
+        candidates = [new_albuminfo(), new_albuminfo()]
+        task = ImportTask(None, [], [])
+        self.look_up(task, *candidates)
+        assert [albuminfo.flex for albuminfo in candidates] == ["flex", "flex"]
+
+        self.choose(task, AlbumMatch(0, candidates[1], {}, [], []))
+        assert [albuminfo.flex for albuminfo in candidates] == ["flex", "new"]
+        assert candidates[1].tracks[0].title == "title"
+
+    def test_track(self) -> None:
+        """Test that the chosen track candidate is modified once."""
+        trackinfo = new_trackinfo()
+        task = SingletonImportTask(None, Item())
+        self.look_up(task, trackinfo)
+        self.choose(task, TrackMatch(0, trackinfo))
+        assert trackinfo.title == "new"
+
+        trackinfo.title = "title"
+        self.choose(task, TrackMatch(0, trackinfo))
+        assert trackinfo.title == "title"
+
+    def test_batch_tracks(self) -> None:
+        """Test that the tracks of the chosen album are modified."""
+        self._setup_config(batch_tracks=True)
+        albuminfo = new_albuminfo()
+        task = ImportTask(None, [], [])
+        self.look_up(task, albuminfo)
+        self.choose(task, AlbumMatch(0, albuminfo, {}, [], []))
+        assert (albuminfo.flex, albuminfo.tracks[0].title) == ("new", "new")
+
+    def test_skipped(self) -> None:
+        """Test that nothing is modified if no candidate is chosen."""
+        albuminfo = new_albuminfo()
+        task = ImportTask(None, [], [])
+        self.look_up(task, albuminfo)
+        self.choose(task, action.ASIS)
+        assert albuminfo.flex == "flex"
+
+    def test_outside_lookup(self) -> None:
+        """Test that info received outside of a lookup is modified at once."""
+        albuminfo = new_albuminfo()
+        send("albuminfo_received", info=albuminfo)
+        assert albuminfo.flex == "new"
+        assert not self.plugin.deferred
+
+        # Such as info for a candidate searched for when choosing.
+        albuminfo.flex = "flex"
+        self.choose(ImportTask(None, [], []), AlbumMatch(0, albuminfo, {}, [], []))
+        assert albuminfo.flex == "flex"
+
+    def test_session(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test applying rules on choice in an import session.
+
+        Sessions run from code don't send the `import` event when they end,
+        nor do sessions which fail, and info received afterwards, such as
+        by `mbsync`, is still modified.
+        """
+        candidates = [new_albuminfo(), new_albuminfo()]
+
+        def lookup_candidates(task: ImportTask) -> None:
+            for albuminfo in candidates:
+                send("albuminfo_received", info=albuminfo)
+            task.candidates = [
+                AlbumMatch(0, info, dict.fromkeys(task.items, info.tracks[0]), [], [])
+                for info in candidates
+            ]
+            task.rec = Recommendation.strong
+
+        monkeypatch.setattr(ImportTask, "lookup_candidates", lookup_candidates)
+        self.config["import"].set({"copy": False, "write": False, "quiet": True})
+        self.lib.add_album([Item(title="t", album="a", path=b"/nonexistent.mp3")])
+        session = ImportSessionFixture(self.lib, None, None, ["album:a"])
+        session.add_choice(2)
+        session.run()
+        assert [albuminfo.flex for albuminfo in candidates] == ["flex", "new"]
+
+        albuminfo = new_albuminfo()
+        send("albuminfo_received", info=albuminfo)
+        assert albuminfo.flex == "new"
+
+        def fail(task: ImportTask) -> None:
+            send("albuminfo_received", info=new_albuminfo())
+            raise RuntimeError("lookup failed")
+
+        monkeypatch.setattr(ImportTask, "lookup_candidates", fail)
+        with pytest.raises(RuntimeError):
+            ImportSessionFixture(self.lib, None, None, ["album:a"]).run()
+        albuminfo = new_albuminfo()
+        send("albuminfo_received", info=albuminfo)
+        assert albuminfo.flex == "new"
+
+    def test_stats(self) -> None:
+        """Test that choices are timed when statistics are recorded."""
+        self._setup_config(stats=True)
+        self.load_plugin()
+        trackinfo = new_trackinfo()
+        task = SingletonImportTask(None, Item())
+        self.look_up(task, trackinfo)
+        self.choose(task, TrackMatch(0, trackinfo))
+        assert trackinfo.title == "new"
+        assert self.plugin.stats.events["import_task_choice"].count == 1
+
+
+class TestRuleCache(ImportModifyInfoTestCase):
+    """Test cases for caching rule results."""
+
+    def test_disabled(self) -> None:
+        """Test that results are not cached by default."""
+        self._setup_config(modify_albuminfo=["album:album flex=new"])
+        self.plugin.apply_albuminfo_rules(new_albuminfo())
+        assert self.plugin.cache_info() == {"album": None, "track": None}
+        self.plugin.close_store()
+        assert self.plugin.store is None
+
+    def test_hits(self) -> None:
+        """Test that info the rules see alike is served from the cache."""
+        self._setup_config(
+            cache_size=8,
+            modify_albuminfo=["album:album flex='new $album' albumtypes! year=1999"],
+        )
+        expected = new_albuminfo()
+        self.plugin.apply_albuminfo_rules(expected)
+
+        albuminfo = new_albuminfo()
+        albuminfo.label = "other label"
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        albuminfo.label = "label"
+        assert albuminfo == expected
+
+        info = self.plugin.cache_info()["album"]
+        assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+        assert self.plugin.rulesets.album.cache.fields == ["album"]
+
+    def test_misses(self) -> None:
+        """Test that info the rules see differently is not served from cache."""
+        self._setup_config(
+            cache_size=8, modify_albuminfo=["album:album flex='new $year'"]
+        )
+        self.plugin.apply_albuminfo_rules(new_albuminfo())
+        albuminfo = new_albuminfo()
+        albuminfo.year = 1999
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert albuminfo.flex == "new 1999"
+        assert self.plugin.cache_info()["album"].misses == 2
+
+    def test_replay_copies(self) -> None:
+        """Test that replayed list values are not shared between infos."""
+        self._setup_config(
+            cache_size=8, modify_albuminfo=["album:album albumtypes='ep; remix'"]
+        )
+        first, second = new_albuminfo(), new_albuminfo()
+        self.plugin.apply_albuminfo_rules(first)
+        self.plugin.apply_albuminfo_rules(second)
+        assert second.albumtypes == ["ep", "remix"]
+        assert second.albumtypes is not first.albumtypes
+
+    def test_dynamic_template(self) -> None:
+        """Test that templates with unknown functions key on every field."""
+        self._setup_config(
+            cache_size=8,
+            modify_albuminfo=["album:album flex='%unknown{$album}'"],
+        )
+        self.plugin.set_rules()
+        assert self.plugin.rulesets.album.cache.fields is None
+
+        self.plugin.apply_albuminfo_rules(new_albuminfo())
+        albuminfo = new_albuminfo()
+        albuminfo.label = "other label"
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert self.plugin.cache_info()["album"].misses == 2
+
+    def test_batch_tracks(self) -> None:
+        """Test that album tracks share cached results."""
+        self._setup_config(
+            cache_size=8,
+            batch_tracks=True,
+            modify_trackinfo=["albumtype:album title='$album $title'"],
+        )
+        albuminfo = new_albuminfo()
+        albuminfo.tracks.append(new_trackinfo())
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        assert [track.title for track in albuminfo.tracks] == [
+            "album title",
+            "album title",
+        ]
+        info = self.plugin.cache_info()["track"]
+        assert (info.hits, info.misses) == (1, 1)
+
+
+class TestPersistentCache(ImportModifyInfoTestCase):
+    """Test cases for the persistent rule result cache."""
+
+    def apply(self, albuminfo: AlbumInfo) -> None:
+        """Apply album rules in a new plugin instance, closing its cache."""
+        self.load_plugin()
+        self.plugin.apply_albuminfo_rules(albuminfo)
+        self.plugin.close_store()
+
+    def test_replay(self) -> None:
+        """Test that results are replayed in later runs."""
+        self._setup_config(
+            persistent_cache=True,
+            batch_tracks=True,
+            modify_albuminfo=["album:album flex='new $album' label!"],
+            modify_trackinfo=["title:title title='new $title'"],
+        )
+        expected = new_albuminfo()
+        self.apply(expected)
+        assert expected.flex == "new album"
+        assert self.plugin.rulesets.album.caches[0].misses == 1
+
+        albuminfo = new_albuminfo()
+        self.apply(albuminfo)
+        assert albuminfo == expected
+        assert self.plugin.rulesets.album.caches[0].hits == 1
+        assert self.plugin.rulesets.item.caches[0].hits == 1
+
+    def test_invalidate(self) -> None:
+        """Test that results are discarded when the rules change."""
+        self._setup_config(
+            persistent_cache=True, modify_albuminfo=["album:album flex=old"]
+        )
+        self.apply(new_albuminfo())
+        self._setup_config(modify_albuminfo=["album:album flex=new"])
+        albuminfo = new_albuminfo()
+        self.apply(albuminfo)
+        assert albuminfo.flex == "new"
+        assert self.plugin.rulesets.album.caches[0].hits == 0
+
+    def test_changed_info(self) -> None:
+        """Test that results are not replayed when the info has changed."""
+        self._setup_config(
+            persistent_cache=True, modify_trackinfo=["title:title flex=$title"]
+        )
+        self.plugin.apply_trackinfo_rules(new_trackinfo())
+        trackinfo = new_trackinfo()
+        trackinfo.title = "title 2"
+        self.plugin.apply_trackinfo_rules(trackinfo)
+        assert trackinfo.flex == "title 2"
+        assert self.plugin.rulesets.album.caches == []
+        assert self.plugin.rulesets.item.caches[0].misses == 2
+
+    def test_cache_command(self) -> None:
+        """Test showing statistics for and clearing the cache."""
+        self._setup_config(
+            persistent_cache=True, modify_albuminfo=["album:album flex=old"]
+        )
+        self.apply(new_albuminfo())
+        self._setup_config(modify_albuminfo=["album:album flex=new"])
+
+        out = self.run_with_output("importmodifyinfo", "cache", "stats")
+        assert "album results: 1 (0 for the current rules)" in out
+        assert "track results: 0 (0 for the current rules)" in out
+
+        out = self.run_with_output("importmodifyinfo", "cache", "clear")
+        assert out.startswith("Cleared ")
+        out = self.run_with_output("importmodifyinfo", "cache", "stats")
+        assert "album results: 0" in out
+
+    def test_unknown_command(self) -> None:
+        """Test that unknown subcommands are rejected."""
+        with pytest.raises(UserError, match="unknown command: cache"):
+            self.run_command("importmodifyinfo", "cache")
+
+
+class TestApply(ImportModifyInfoTestCase):
+    """Test cases for applying rules to the library."""
+
+    def test_albums(self) -> None:
+        """Test that album rules modify matching albums and their items."""
+        self._setup_config(
+            modify_albuminfo=["album:a genre=Rock flex=x", "flex:x old!"]
+        )
+        album = self.add_album(album="a")
+        other = self.add_album(album="b")
+        for obj in (album, other):
+            obj.old = "y"
+            obj.store()
+
+        out = self.run_with_output("importmodifyinfo", "apply", "-j", "1")
+        assert "albums: 1 of 2 changed" in out
+        album.load()
+        assert (album.genre, album.flex) == ("Rock", "x")
+        assert "old" not in album
+        assert album.items()[0].genre == "Rock"
+        other.load()
+        assert other.old == "y"
+
+    @pytest.mark.parametrize("engine", ["interpreted", "compiled"])
+    @pytest.mark.parametrize(
+        ("rules", "expected"),
+        [
+            (["album:a label!", "label:= genre=x", "label::^$ flex=x"], ("", None)),
+            (["label:l flex=x", "album:a label!", "label:l genre=x"], ("x", "x")),
+        ],
+    )
+    def test_deleted_fields(
+        self, engine: str, rules: List[str], expected: Tuple[str, Optional[str]]
+    ) -> None:
+        """Test that later rules see deleted fields, as they would on import."""
+        self._setup_config(engine=engine, modify_albuminfo=rules)
+        album = self.add_album(album="a", label="l")
+
+        self.run_with_output("importmodifyinfo", "apply", "-j", "1")
+        album.load()
+        assert album.label == ""
+        assert (album.genre, album.get("flex")) == expected
+
+    def test_query(self) -> None:
+        """Test that only albums matching the query are modified."""
+        self._setup_config(modify_albuminfo=["album:a genre=Rock"])
+        album = self.add_album(album="a", albumartist="x")
+        other = self.add_album(album="a", albumartist="y")
+
+        out = self.run_with_output("importmodifyinfo", "apply", "albumartist:y")
+        assert "albums: 1 of 1 changed" in out
+        album.load()
+        other.load()
+        assert (album.genre, other.genre) == ("", "Rock")
+
+    def test_unchanged(self) -> None:
+        """Test that objects the rules don't change aren't counted."""
+        self._setup_config(modify_albuminfo=["album:a genre=Rock"])
+        self.add_album(album="a", genre="Rock")
+        out = self.run_with_output("importmodifyinfo", "apply")
+        assert "albums: 0 of 1 changed" in out
+
+    @pytest.mark.parametrize("batch_tracks", [False, True])
+    def test_tracks(self, batch_tracks: bool) -> None:
+        """Test that track rules modify singletons, or every track in batches."""
+        self._setup_config(
+            batch_tracks=batch_tracks, modify_trackinfo=["title:t title=new"]
+        )
+        album = self.add_album(title="t")
+        singleton = self.add_item(title="t")
+
+        out = self.run_with_output("importmodifyinfo", "apply")
+        assert f"tracks: {1 + batch_tracks} of {1 + batch_tracks} changed" in out
+        assert "albums:" not in out
+        singleton.load()
+        assert singleton.title == "new"
+        assert album.items()[0].title == ("new" if batch_tracks else "t")
+
+    def test_jobs(self) -> None:
+        """Test applying rules in worker processes."""
+        self.teardown_beets()
+        self.setup_beets(disk=True)
+        self.load_plugin()
+        self._setup_config(modify_trackinfo=["title:t genre=$title"])
+        items = [self.add_item(title=f"t{i}") for i in range(5)]
+
+        out = self.run_with_output("importmodifyinfo", "apply", "-j", "2")
+        assert "tracks: 5 of 5 changed" in out
+        for item in items:
+            item.load()
+            assert item.genre == item.title
+
+    def test_worker(self) -> None:
+        """Test processing a shard as a worker process would."""
+        self.teardown_beets()
+        self.setup_beets(disk=True)
+        self.load_plugin()
+        self._setup_config(modify_trackinfo=["title:t genre=x"])
+        items = [self.add_item(title="t") for _ in range(4)]
+
+        bulk.init_worker(self.plugin, self.lib)
+        try:
+            changes, count, _ = bulk.process_shard("track", [], 1, 2)
+        finally:
+            bulk._worker = None
+        assert count == 2
+        assert [obj_id for obj_id, _ in changes] == [items[0].id, items[2].id]
+        assert changes[0][1] == [("genre", "x")]
+        assert bulk.ShardQuery(1, 2).match(items[0])
+        assert not bulk.ShardQuery(1, 2).match(items[1])
+
+
+class TestDiff(ImportModifyInfoTestCase):
+    """Test cases for reporting the changes rules would make."""
+
+    def test_dry_run(self) -> None:
+        """Test that a dry run records edits without changing the info."""
+        self._setup_config(
+            modify_albuminfo=["album:album album=new flex!", "album:new year=1"]
+        )
+        self.plugin.set_rules()
+        albuminfo = new_albuminfo()
+        album = AlbumInfoModel(albuminfo)
+        edits = self.plugin.rulesets.album.process(albuminfo, album, dry_run=True)
+        assert edits == [("flex", DELETE), ("album", "new"), ("year", 1)]
+        assert albuminfo == new_albuminfo()
+
+    def test_diff(self) -> None:
+        """Test reporting changes to the library as JSON lines."""
+        self._setup_config(
+            modify_albuminfo=["album:a genre=Rock new=x", "flex:y flex!"],
+            modify_trackinfo=["title:t title=u"],
+        )
+        album = self.add_album(album="a", mb_albumid="id")
+        album.flex = "y"
+        album.store()
+        self.add_album(album="b")
+        item = self.add_item(title="t")
+
+        out = self.run_with_output("importmodifyinfo", "diff")
+        assert [json.loads(line) for line in out.splitlines()] == [
+            {
+                "kind": "album",
+                "id": album.id,
+                "mbid": "id",
+                "changes": [
+                    {"field": "flex", "old": "y", "deleted": True},
+                    {"field": "genre", "old": "", "new": "Rock"},
+                    {"field": "new", "new": "x"},
+                ],
+            },
+            {
+                "kind": "track",
+                "id": item.id,
+                "mbid": "",
+                "changes": [{"field": "title", "old": "t", "new": "u"}],
+            },
+        ]
+        album.load()
+        assert (album.genre, album.flex) == ("", "y")
+
+
+class TestSnapshots(ImportModifyInfoTestCase):
+    """Test cases for recording and applying rules to snapshots of info."""
+
+    def setup_method(self) -> None:
+        """Set up test cases with snapshots enabled."""
+        super().setup_method()
+        self._setup_config(snapshots=True, batch_tracks=True)
+        self.load_plugin()
+
+    def snapshot_album(self) -> AlbumInfo:
+        """Send album info to be recorded, returning it."""
+        albuminfo = new_albuminfo()
+        albuminfo.album_id = "album-id"
+        albuminfo.tracks[0].release_track_id = "release-track-id"
+        send("albuminfo_received", info=albuminfo)
+        self.plugin.close_store()
+        return albuminfo
+
+    def test_record(self) -> None:
+        """Test that the info is recorded before the rules are applied."""
+        self._setup_config(
+            modify_albuminfo=["album:album album=new"],
+            modify_trackinfo=["title:title title=new"],
+        )
+        albuminfo = self.snapshot_album()
+        trackinfo = new_trackinfo()
+        send("trackinfo_received", info=trackinfo)
+        self.plugin.close_store()
+        assert (albuminfo.album, albuminfo.tracks[0].title) == ("new", "new")
+        assert trackinfo.title == "new"
+
+        snapshots = SnapshotStore(self.plugin.snapshot_path())
+        album = snapshots.get_album("album-id")
+        track = snapshots.get_track("track_id")
+        assert album is not None
+        assert track is not None
+        assert (album.album, album.tracks[0].title) == ("album", "title")
+        assert track.title == "title"
+        snapshots.close()
+
+    def test_disabled(self) -> None:
+        """Test that nothing is recorded by default."""
+        self._setup_config(snapshots=False)
+        self.load_plugin()
+        send("albuminfo_received", info=new_albuminfo())
+        assert self.plugin.snapshots is None
+        assert not os.path.exists(self.plugin.snapshot_path())
+
+    def test_apply(self) -> None:
+        """Test applying rules to the snapshots of albums and tracks."""
+        self.snapshot_album()
+        singleton = self.add_item(title="t", mb_trackid="track_id")
+        send("trackinfo_received", info=new_trackinfo())
+        self.plugin.close_store()
+        album = self.add_album(mb_albumid="album-id", album="stored", genre="g")
+        item = album.items()[0]
+        item.mb_releasetrackid = "release-track-id"
+        item.store()
+        self.add_album(mb_albumid="other")
+
+        self._setup_config(
+            modify_albuminfo=["album:=album genre=$label", "flex:flex flex!"],
+            modify_trackinfo=["title:=title title=$track_flex"],
+        )
+        self.load_plugin()
+        out = self.run_with_output("importmodifyinfo", "apply", "-s")
+        assert "albums: 1 of 2 changed, 1 without snapshots" in out
+        assert "tracks: 2 of 3 changed, 1 without snapshots" in out
+
+        album.load()
+        assert (album.album, album.genre) == ("stored", "label")
+        item.load()
+        assert (item.title, item.genre) == ("flex", "label")
+        singleton.load()
+        assert singleton.title == "flex"
+
+    def test_diff(self) -> None:
+        """Test reporting the changes rules would make to snapshots."""
+        self.snapshot_album()
+        album = self.add_album(mb_albumid="album-id", album="stored")
+        self._setup_config(modify_albuminfo=["album:=album album=new"])
+        self.load_plugin()
+
+        out = self.run_with_output("importmodifyinfo", "diff", "-s")
+        report = json.loads(out)
+        assert report["changes"] == [{"field": "album", "old": "stored", "new": "new"}]
+        album.load()
+        assert album.album == "stored"
+
+
+class TestReload(ImportModifyInfoTestCase):
+    """Test cases for reloading rules when the configuration changes."""
+
+    def setup_method(self) -> None:
+        """Set up test cases with rules in a configuration file."""
+        super().setup_method()
+        self.path = os.path.join(os.fsdecode(self.temp_dir), "rules.yaml")
+        self.write_config("modify_albuminfo: ['album:album flex=old']")
+        self.config.set_file(self.path)
+        self._setup_config(reload=True, reload_interval=0)
+        self.load_plugin()
+
+    def write_config(self, section: Optional[str]) -> None:
+        """Write the plugin's section of the configuration file, if any."""
+        with open(self.path, "w", encoding="utf-8") as f:
+            if section is not None:
+                f.write(f"importmodifyinfo:\n  {section}\n")
+        # Ensure the change is seen despite the file system's resolution.
+        self.mtime = getattr(self, "mtime", 0) + 10**9
+        os.utime(self.path, ns=(self.mtime, self.mtime))
+
+    def apply(self) -> AlbumInfo:
+        """Apply the rules to new album info, returning it."""
+        albuminfo = new_albuminfo()
+        send("albuminfo_received", info=albuminfo)
+        return albuminfo
+
+    def test_reload(self) -> None:
+        """Test that changed entries are parsed again, and others reused."""
+        assert self.apply().flex == "old"
+        rulesets = self.plugin.rulesets
+        self.write_config(
+            "modify_albuminfo: ['album:album flex=old', 'album:album year=1']"
+        )
+        albuminfo = self.apply()
+        assert (albuminfo.flex, albuminfo.year) == ("old", 1)
+        assert self.plugin.rulesets.album.rules[0] is rulesets.album.rules[0]
+        assert self.plugin.rulesets.item is rulesets.item
+
+        self.write_config(None)
+        assert self.apply().flex == "flex"
+        assert self.plugin.rulesets.album.rules == []
+
+    def test_unchanged(self) -> None:
+        """Test that rule sets are kept if their entries are unchanged."""
+        self.apply()
+        rulesets = self.plugin.rulesets
+        self.write_config("modify_albuminfo: ['album:album flex=old']")
+        assert self.apply().flex == "old"
+        assert self.plugin.rulesets.album is rulesets.album
+
+    def test_threads(self) -> None:
+        """Test that rules being reloaded are only rebuilt by one thread."""
+        self.apply()
+        self.write_config("modify_albuminfo: ['album:album flex=new']")
+        built = []
+        build_rules = self.plugin.build_rules
+
+        def count_builds(*args: Any) -> Any:
+            built.append(args[1])
+            return build_rules(*args)
+
+        self.plugin.build_rules = count_builds
+        with ThreadPoolExecutor(8) as executor:
+            flexes = list(executor.map(lambda _: self.apply().flex, range(8)))
+        assert built == ["album", "track"]
+        assert set(flexes) <= {"old", "new"}
+        assert self.apply().flex == "new"
+
+        # A thread waiting while another built the rules uses them as built.
+        rulesets = self.plugin.rulesets
+        self.plugin.reload = False
+        assert self.plugin.build_rulesets() is rulesets
+
+    def test_interval(self) -> None:
+        """Test that files are only checked once per interval."""
+        self._setup_config(reload_interval=3600)
+        self.apply()
+        self.apply()
+        self.write_config("modify_albuminfo: ['album:album flex=new']")
+        assert self.apply().flex == "old"
+
+    def test_settings(self) -> None:
+        """Test that the reload settings are read when the rules are built."""
+        self.apply()
+        self._setup_config(reload=False)
+        self.write_config("modify_albuminfo: ['album:album flex=new']")
+        assert self.apply().flex == "new"
+        self.write_config("modify_albuminfo: ['album:album flex=newer']")
+        assert self.apply().flex == "new"
+
+    def test_invalid(self) -> None:
+        """Test that the rules are kept if the file can't be read."""
+        self.apply()
+        self.write_config("modify_albuminfo: [")
+        assert self.apply().flex == "old"
+
+    def test_disabled(self) -> None:
+        """Test that rules are not reloaded by default."""
+        self._setup_config(reload=False)
+        self.apply()
+        self.write_config("modify_albuminfo: ['album:album flex=new']")
+        assert self.apply().flex == "old"
+
+
+class TestStats(ImportModifyInfoTestCase):
+    """Test cases for recording rule statistics."""
+
+    def setup_method(self) -> None:
+        """Set up test cases with statistics enabled."""
+        super().setup_method()
+        self._setup_config(stats=True)
+        self.load_plugin()
+
+    @pytest.mark.parametrize("engine", ["interpreted", "compiled"])
+    def test_rules(self, engine: str) -> None:
+        """Test that rule evaluations, matches and times are recorded."""
+        rules = ["album:album flex='new $album'", "year:1..2 flex=x"]
+        self._setup_config(
+            engine=engine,
+            modify_albuminfo=rules,
+            modify_trackinfo=["title:title title=x"],
+        )
+        send("albuminfo_received", info=new_albuminfo())
+        send("albuminfo_received", info=new_albuminfo())
+        send("trackinfo_received", info=new_trackinfo())
+
+        matched = self.plugin.stats.rules["album"][rules[0]]
+        assert (matched.evaluations, matched.matches) == (2, 2)
+        assert matched.render_time > 0
+        assert matched.assign_time > 0
+        unmatched = self.plugin.stats.rules["album"][rules[1]]
+        assert (unmatched.evaluations, unmatched.matches) == (2, 0)
+        assert unmatched.render_time == 0
+        assert self.plugin.stats.events["albuminfo_received"].count == 2
+        assert self.plugin.stats.events["trackinfo_received"].count == 1
+
+    def test_index(self) -> None:
+        """Test that instrumented rules are still indexed."""
+        self._setup_config(modify_albuminfo=["album:=other flex=x"])
+        self.plugin.set_rules()
+        assert self.plugin.rulesets.album.index.exact["album"]["other"] == [0]
+
+    def test_command(self) -> None:
+        """Test showing the statistics written at exit."""
+        rules = ["album:album flex=x", "year:1..2 flex=y"]
+        self._setup_config(modify_albuminfo=rules)
+        send("albuminfo_received", info=new_albuminfo())
+        self.plugin.write_stats()
+
+        out = self.run_with_output("importmodifyinfo", "stats")
+        assert "albuminfo_received: 1 events" in out
+        assert "album rules:" in out
+        assert "track rules:" not in out
+        lines = out.splitlines()
+        assert [line.split()[:2] for line in lines[-2:]] == [["1", "1"], ["1", "0"]]
+
+    def test_disabled(self) -> None:
+        """Test that nothing is recorded by default."""
+        self._setup_config(stats=False)
+        self.load_plugin()
+        assert self.plugin.stats is None
+        self.plugin.write_stats()
+        assert not os.path.exists(self.plugin.stats_path())
+
+
+class TestPrecompiled(ImportModifyInfoTestCase):
+    """Test cases for reusing precompiled rules."""
+
+    def setup_method(self) -> None:
+        """Set up test cases with precompiled rules enabled."""
+        super().setup_method()
+        self._setup_config(
+            precompiled=True, modify_albuminfo=["album:album flex='new $album'"]
+        )
+        self.load_plugin()
+
+    def test_reuse(self) -> None:
+        """Test that rules parsed by an earlier plugin are loaded."""
+        self.plugin.set_rules()
+        assert os.path.exists(self.plugin.precompiled_path())
+
+        self.load_plugin()
+        rules = self.plugin.set_rules().album.rules
+        assert rules[0] == self.plugin.parsed_rules["modify_albuminfo"][rules[0].modify]
+        albuminfo = new_albuminfo()
+        send("albuminfo_received", info=albuminfo)
+        assert albuminfo.flex == "new album"
+
+    def test_unpicklable(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that rules which can't be saved are still used."""
+        monkeypatch.setattr(
+            "beetsplug.importmodifyinfo.precompiled.PrecompiledRules.put",
+            lambda *args: False,
+        )
+        albuminfo = new_albuminfo()
+        send("albuminfo_received", info=albuminfo)
+        assert albuminfo.flex == "new album"
+        assert not os.path.exists(self.plugin.precompiled_path())
+
+
+class TestTables(ImportModifyInfoTestCase):
+    """Test cases for rules from rule tables."""
+
+    def write_table(self, name: str, *rows: str) -> str:
+        """Write a comma separated rule table, returning its path."""
+        path = os.path.join(os.fsdecode(self.temp_dir), name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(["key_field,key_value,field,value", *rows]))
+        # Ensure the change is seen despite the file system's resolution.
+        self.mtime = getattr(self, "mtime", 0) + 10**9
+        os.utime(path, ns=(self.mtime, self.mtime))
+        return path
+
+    def test_album(self) -> None:
+        """Test that album tables apply at their position among the rules."""
+        path = self.write_table("albums.csv", "mb_albumid,album_id,flex,table")
+        self._setup_config(
+            modify_albuminfo=["album:album flex=first", "flex:table flex=last"],
+            albuminfo_tables=[{"path": path, "position": 1}],
+        )
+        albuminfo = new_albuminfo()
+        send("albuminfo_received", info=albuminfo)
+        assert albuminfo.flex == "last"
+        assert self.plugin.rulesets.album.index.keys[1].field == "mb_albumid"
+
+        self._setup_config(albuminfo_tables=[path])
+        self.load_plugin()
+        albuminfo = new_albuminfo()
+        send("albuminfo_received", info=albuminfo)
+        assert albuminfo.flex == "table"
+
+    def test_track(self) -> None:
+        """Test that track tables are read from SQLite databases."""
+        path = os.path.join(os.fsdecode(self.temp_dir), "tracks.db")
+        with closing(sqlite3.connect(path)) as connection:
+            connection.execute(
+                "CREATE TABLE tracks (key_field, key_value, field, value)"
+            )
+            connection.execute("INSERT INTO tracks VALUES ('title', 'title', 'x', 1)")
+            connection.commit()
+        self._setup_config(trackinfo_tables=[{"path": path, "table": "tracks"}])
+        trackinfo = new_trackinfo()
+        send("trackinfo_received", info=trackinfo)
+        assert trackinfo.x == "1"
+
+    def test_errors(self) -> None:
+        """Test that invalid positions and missing tables are reported."""
+        path = os.path.join(os.fsdecode(self.temp_dir), "missing.csv")
+        self._setup_config(albuminfo_tables=[{"path": path, "position": -1}])
+        with pytest.raises(UserError, match=r"albuminfo_tables\[0\]: negative"):
+            self.plugin.set_rules()
+
+        self._setup_config(albuminfo_tables=[path])
+        with pytest.raises(UserError, match=r"albuminfo_tables: can't read"):
+            self.plugin.set_rules()
+
+    def test_reload(self) -> None:
+        """Test that changed tables are read again, and unchanged ones kept."""
+        path = self.write_table("albums.csv", "album,album,flex,old")
+        self._setup_config(albuminfo_tables=[path], reload=True, reload_interval=0)
+        rulesets = self.plugin.set_rules()
+        assert self.plugin.set_rules() is rulesets
+
+        self.write_table("albums.csv", "album,album,flex,new")
+        albuminfo = new_albuminfo()
+        send("albuminfo_received", info=albuminfo)
+        assert albuminfo.flex == "new"
+        assert self.plugin.rulesets.item is rulesets.item
+
+    def test_cache_command(self) -> None:
+        """Test that cached results are counted for the table's rules."""
+        path = self.write_table("albums.csv", "album,album,flex,old")
+        self._setup_config(persistent_cache=True, albuminfo_tables=[path])
+        send("albuminfo_received", info=new_albuminfo())
+        self.plugin.close_store()
+
+        out = self.run_with_output("importmodifyinfo", "cache", "stats")
+        assert "album results: 1 (1 for the current rules)" in out
+        self.write_table("albums.csv", "album,album,flex,new")
+        out = self.run_with_output("importmodifyinfo", "cache", "stats")
+        assert "album results: 1 (0 for the current rules)" in out
+
+
+def test_lazy_imports() -> None:
+    """Test that loading the plugin doesn't import the rule engine or importer."""
+    script = (
+        "import sys; from beetsplug.importmodifyinfo import ImportModifyInfoPlugin; "
+        "ImportModifyInfoPlugin(); "
+        "prefixes = ('beetsplug.', 'beets.importer'); "
+        "print(sorted(m for m in sys.modules if m.startswith(prefixes)))"
+    )
+    output = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    ).stdout
+    assert "beetsplug.importmodifyinfo.plugin" in output
+    assert "beetsplug.importmodifyinfo.engine" not in output
+    assert "beetsplug.importmodifyinfo.bulk" not in output
+    assert "beetsplug.importmodifyinfo.store" not in output
+    assert "beets.importer" not in output
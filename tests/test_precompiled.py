@@ -0,0 +1,73 @@
+"""Tests for the importmodifyinfo precompiled rules."""
+
+import pickle
+from pathlib import Path
+
+import pytest
+from beets.dbcore import types  # type: ignore
+from beets.library import Album  # type: ignore
+from beets.library import Item
+
+from beetsplug.importmodifyinfo import precompiled
+from beetsplug.importmodifyinfo.engine import Rule
+from beetsplug.importmodifyinfo.engine import parse_rules
+from beetsplug.importmodifyinfo.precompiled import PrecompiledRules
+from beetsplug.importmodifyinfo.precompiled import rules_key
+
+
+RULES = ["album:album flex=$album", "year:2000 year=2001 flex!"]
+
+
+def test_roundtrip(tmp_path: Path) -> None:
+    """Test that saved rules are loaded by their key."""
+    path = str(tmp_path / "rules" / "rules.pickle")
+    rules = parse_rules(RULES, Album)
+    assert PrecompiledRules(path).put("album", "key", rules)
+
+    loaded = PrecompiledRules(path)
+    assert loaded.get("album", "other") is None
+    assert loaded.get("track", "key") is None
+    loaded_rules = loaded.get("album", "key")
+    assert loaded_rules is not None
+    assert [rule.modify for rule in loaded_rules] == RULES
+    assert loaded_rules[0].mods[0][1] == rules[0].mods[0][1]
+    assert loaded_rules[1].mods == (("year", 2001, None),)
+    assert loaded_rules[1].dels == ("flex",)
+
+    # Rules of other kinds are kept when saving.
+    assert loaded.put("track", "key", parse_rules(["title:a title=b"], Item))
+    assert PrecompiledRules(path).get("album", "key") is not None
+
+
+def test_unreadable(tmp_path: Path) -> None:
+    """Test that unreadable files and other versions are ignored."""
+    path = tmp_path / "rules.pickle"
+    path.write_bytes(b"not a pickle")
+    assert PrecompiledRules(str(path)).get("album", "key") is None
+
+    rules = parse_rules(RULES, Album)
+    path.write_bytes(pickle.dumps((0, {"album": ("key", rules)})))
+    assert PrecompiledRules(str(path)).get("album", "key") is None
+
+
+def test_unpicklable(tmp_path: Path) -> None:
+    """Test that rules which can't be pickled aren't saved."""
+    path = tmp_path / "rules.pickle"
+    rule = parse_rules(RULES, Album)[0]
+    unpicklable = Rule(rule.modify, lambda obj: True, rule.mods, rule.dels)
+    assert not PrecompiledRules(str(path)).put("album", "key", [unpicklable])
+    assert not path.exists()
+
+
+def test_rules_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that keys depend on the entries, model, field types and format."""
+    key = rules_key(RULES, Album)
+    assert rules_key(RULES, Album) == key
+    assert rules_key(RULES[:1], Album) != key
+    assert rules_key(RULES, Item) != key
+
+    monkeypatch.setattr(Album, "_types", {**Album._types, "flex": types.INTEGER})
+    typed_key = rules_key(RULES, Album)
+    assert typed_key != key
+    monkeypatch.setattr(precompiled, "FORMAT_VERSION", 0)
+    assert rules_key(RULES, Album) != typed_key
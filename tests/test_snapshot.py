@@ -0,0 +1,120 @@
+"""Tests for the importmodifyinfo snapshot store."""
+
+import os
+from pathlib import Path
+
+import pytest
+from beets.autotag.hooks import AlbumInfo  # type: ignore
+from beets.autotag.hooks import TrackInfo
+
+from beetsplug.importmodifyinfo import snapshot
+from beetsplug.importmodifyinfo.snapshot import SnapshotStore
+
+
+def new_albuminfo(album: str = "album") -> AlbumInfo:
+    """Create album info with a track."""
+    track = TrackInfo(title="title", release_track_id="rt", flex="x", flex_none=None)
+    return AlbumInfo([track], album=album, album_id="a", albumtypes=["ep"], year=1)
+
+
+def get_album(store: SnapshotStore) -> AlbumInfo:
+    """Return the snapshot of the test album, which must exist."""
+    album = store.get_album("a")
+    assert album is not None
+    return album
+
+
+def get_track(store: SnapshotStore, mbid: str) -> TrackInfo:
+    """Return the snapshot of a track, which must exist."""
+    track = store.get_track(mbid)
+    assert track is not None
+    return track
+
+
+def test_roundtrip(tmp_path: Path) -> None:
+    """Test that snapshots of albums and tracks are returned unchanged."""
+    store = SnapshotStore(str(tmp_path))
+    albuminfo = new_albuminfo()
+    store.add_album(albuminfo)
+    store.add_track(TrackInfo(title="single", track_id="t", length=1.5))
+    store.add_album(AlbumInfo([], album="no id"))
+    store.add_track(TrackInfo(title="no id"))
+
+    album = get_album(store)
+    assert album.album == "album"
+    assert album.albumtypes == ["ep"]
+    assert album.tracks[0].flex == "x"
+    assert "flex_none" not in album.tracks[0]
+    assert album == AlbumInfo(
+        [TrackInfo(title="title", release_track_id="rt", flex="x")],
+        album="album",
+        album_id="a",
+        albumtypes=["ep"],
+        year=1,
+    )
+    track = store.get_track("t")
+    assert track == TrackInfo(title="single", track_id="t", length=1.5)
+    assert store.get_track("a") is None
+    store.close()
+    store.close()
+
+
+def test_snapshot_unmodified(tmp_path: Path) -> None:
+    """Test that a snapshot isn't affected by later changes to the info."""
+    store = SnapshotStore(str(tmp_path))
+    albuminfo = new_albuminfo()
+    store.add_album(albuminfo)
+    albuminfo.album = "modified"
+    albuminfo.tracks[0].title = "modified"
+
+    album = get_album(store)
+    assert album.album == "album"
+    assert album.tracks[0].title == "title"
+
+
+def test_latest(tmp_path: Path) -> None:
+    """Test that only changed info is appended, and the latest is returned."""
+    store = SnapshotStore(str(tmp_path))
+    store.add_album(new_albuminfo())
+    assert get_album(store).album == "album"
+    store.add_album(new_albuminfo())
+    store.add_album(new_albuminfo("changed"))
+    assert get_album(store).album == "changed"
+    store.close()
+
+    index = tmp_path / snapshot.INDEX_NAME
+    assert len(index.read_text().splitlines()) == 2
+    store = SnapshotStore(str(tmp_path))
+    store.add_album(new_albuminfo("changed"))
+    assert get_album(store).album == "changed"
+    store.close()
+    assert len(index.read_text().splitlines()) == 2
+
+
+def test_unencodable(tmp_path: Path) -> None:
+    """Test that info which can't be encoded is not stored."""
+    store = SnapshotStore(str(tmp_path))
+    store.add_track(TrackInfo(track_id="t", flex=object()))
+    assert store.get_track("t") is None
+
+
+def test_segments(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that new segments are started once they are full."""
+    monkeypatch.setattr(snapshot, "SEGMENT_SIZE", 200)
+    store = SnapshotStore(str(tmp_path))
+    for i in range(3):
+        store.add_track(TrackInfo(track_id=str(i), title="x" * 100))
+    store.close()
+
+    store = SnapshotStore(str(tmp_path))
+    store.add_track(TrackInfo(track_id="3", title="y" * 100))
+    names = sorted(os.listdir(tmp_path))
+    assert names == [
+        snapshot.INDEX_NAME,
+        "segment-00001.jsonl",
+        "segment-00002.jsonl",
+        "segment-00003.jsonl",
+        "segment-00004.jsonl",
+    ]
+    assert [get_track(store, str(i)).title[0] for i in range(4)] == list("xxxy")
+    store.close()
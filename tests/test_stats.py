@@ -0,0 +1,58 @@
+"""Tests for the importmodifyinfo rule instrumentation."""
+
+import json
+from pathlib import Path
+from typing import List
+
+from beets.dbcore.query import MatchQuery  # type: ignore
+from beets.library import Album  # type: ignore
+
+from beetsplug.importmodifyinfo.stats import InstrumentedQuery
+from beetsplug.importmodifyinfo.stats import RuleStats
+from beetsplug.importmodifyinfo.stats import Stats
+
+
+def test_instrumented_query() -> None:
+    """Test that query evaluations and matches are counted."""
+    stats = RuleStats()
+    query = InstrumentedQuery(MatchQuery("album", "a"), stats)
+    assert query.match(Album(album="a"))
+    assert not query.match(Album(album="b"))
+    assert (stats.evaluations, stats.matches) == (2, 1)
+    assert stats.match_time > 0
+
+
+def test_timed() -> None:
+    """Test that event listeners are counted and timed."""
+    stats = Stats()
+    seen: List[str] = []
+    listener = stats.timed("albuminfo_received", seen.append)
+    listener("info")
+    assert seen == ["info"]
+    assert stats.events["albuminfo_received"].count == 1
+    assert stats.events["albuminfo_received"].time > 0
+
+
+def test_save(tmp_path: Path) -> None:
+    """Test that saved statistics are added to those saved earlier."""
+    path = str(tmp_path / "stats.json")
+    assert Stats.load(path).to_dict() == {
+        "events": {},
+        "rules": {"album": {}, "track": {}},
+    }
+
+    stats = Stats()
+    stats.rule("album", "album:a flex=b").evaluations = 2
+    stats.rule("track", "title:a title=b").matches = 1
+    stats.event("albuminfo_received").count = 3
+    stats.save(path)
+    stats.save(path)
+
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["rules"]["album"]["album:a flex=b"]["evaluations"] == 4
+    assert saved["rules"]["track"]["title:a title=b"]["matches"] == 2
+    assert saved["events"]["albuminfo_received"] == {"count": 6, "time": 0}
+
+    loaded = Stats.load(path)
+    assert loaded.rule("album", "album:a flex=b").evaluations == 4
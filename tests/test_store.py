@@ -0,0 +1,100 @@
+"""Tests for the importmodifyinfo persistent result store."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from beets.library import Album  # type: ignore
+
+from beetsplug.importmodifyinfo import store as store_module
+from beetsplug.importmodifyinfo.cache import DELETE
+from beetsplug.importmodifyinfo.cache import Edits
+from beetsplug.importmodifyinfo.store import PersistentCache
+from beetsplug.importmodifyinfo.store import ResultStore
+from beetsplug.importmodifyinfo.store import decode_edits
+from beetsplug.importmodifyinfo.store import encode_edits
+from beetsplug.importmodifyinfo.store import rules_hash
+
+
+def test_edits_roundtrip() -> None:
+    """Test that edits survive encoding."""
+    edits = [("label", DELETE), ("album", "new"), ("albumtypes", ["ep"])]
+    assert decode_edits(encode_edits(edits)) == edits
+
+
+def test_rules_hash() -> None:
+    """Test that rule hashes depend on the rules and their order."""
+    assert rules_hash(["a", "b"]) == rules_hash(["a", "b"])
+    assert rules_hash(["a", "b"]) != rules_hash(["b", "a"])
+
+
+def test_store(tmp_path: Path) -> None:
+    """Test storing, invalidating and clearing results."""
+    path = str(tmp_path / "sub" / "cache.db")
+    store = ResultStore(path)
+    store.put("album", "id", "rules", "fp", [("album", "new")])
+    store.put("album", "bad", "rules", "fp", [("album", object())])
+    store.put("track", "id", "other", "fp", [("title", DELETE)])
+    store.close()
+    store.close()
+    assert os.path.exists(path)
+
+    store = ResultStore(path)
+    assert store.get("album", "id", "rules", "fp") == [("album", "new")]
+    assert store.get("album", "id", "rules", "other") is None
+    assert store.get("album", "bad", "rules", "fp") is None
+    assert store.counts() == {("album", "rules"): 1, ("track", "other"): 1}
+
+    store.invalidate("track", "rules")
+    assert store.counts() == {("album", "rules"): 1}
+    store.clear()
+    assert store.counts() == {}
+    store.close()
+
+
+def test_threads(tmp_path: Path) -> None:
+    """Test that the store can be used by threads other than its opener."""
+    store = ResultStore(str(tmp_path / "cache.db"))
+    store.put("album", "id", "rules", "fp", [("album", "new")])
+
+    def put_and_get(i: int) -> Optional[Edits]:
+        store.put("album", str(i), "rules", "fp", [])
+        return store.get("album", "id", "rules", "fp")
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(put_and_get, range(20)))
+    assert results == [[("album", "new")]] * 20
+    assert store.counts() == {("album", "rules"): 21}
+    store.close()
+
+
+def test_commit_interval(tmp_path: Path, monkeypatch) -> None:  # type: ignore
+    """Test that stored results are committed in batches."""
+    monkeypatch.setattr(store_module, "COMMIT_INTERVAL", 2)
+    store = ResultStore(str(tmp_path / "cache.db"))
+    store.put("album", "a", "rules", "fp", [])
+    assert store.pending == 1
+    store.put("album", "b", "rules", "fp", [])
+    assert store.pending == 0
+    store.close()
+
+
+def test_persistent_cache(tmp_path: Path) -> None:
+    """Test that results are keyed by ID and the values rules read."""
+    store = ResultStore(str(tmp_path / "cache.db"))
+    cache = PersistentCache(store, "album", "rules", ["album"], "album_id")
+    album = Album(album="a", label="l")
+    assert cache.key({}, album) is None
+    assert cache.get(None) is None
+    cache.put(None, [("album", "b")])
+
+    key = cache.key({"album_id": "id"}, album)
+    assert cache.get(key) is None
+    cache.put(key, [("album", "b")])
+    assert cache.get(cache.key({"album_id": "id"}, Album(album="a"))) == [
+        ("album", "b")
+    ]
+    assert cache.get(cache.key({"album_id": "id"}, Album(album="x"))) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+    store.close()
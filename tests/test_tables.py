@@ -0,0 +1,133 @@
+"""Tests for the importmodifyinfo rule tables."""
+
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import List
+from typing import Optional
+
+import pytest
+from beets.library import Album  # type: ignore
+from beets.ui import UserError  # type: ignore
+
+from beetsplug.importmodifyinfo.cache import DELETE
+from beetsplug.importmodifyinfo.engine import RuleSet
+from beetsplug.importmodifyinfo.engine import parse_rules
+from beetsplug.importmodifyinfo.tables import RuleTable
+from beetsplug.importmodifyinfo.tables import insert_tables
+from beetsplug.importmodifyinfo.tables import load_table
+from beetsplug.importmodifyinfo.tables import read_rows
+from beetsplug.importmodifyinfo.tables import table_rules
+
+from .test_plugin import new_albuminfo
+
+
+ROWS = [
+    ("mb_albumid", "album_id", "genre", "Jazz"),
+    ("album", "other", "genre", "Rock"),
+    ("mb_albumid", "album_id", "flex!", ""),
+    ("mb_albumid", "album_id", "year", "1999"),
+]
+
+
+def table(path: Path, name: str = "rules", position: Optional[int] = None) -> RuleTable:
+    """Return a rule table for a file."""
+    return RuleTable(str(path), name, position, None)
+
+
+@pytest.mark.parametrize(
+    ("filename", "delimiter"), [("rules.csv", ","), ("rules.TSV", "\t")]
+)
+def test_read_csv(tmp_path: Path, filename: str, delimiter: str) -> None:
+    """Test reading comma and tab separated tables."""
+    path = tmp_path / filename
+    lines = ["key_field,key_value,field,value", *(",".join(row) for row in ROWS)]
+    path.write_text("\n".join(lines).replace(",", delimiter), encoding="utf-8")
+    assert read_rows(table(path), "rules") == ROWS
+
+
+def test_read_sqlite(tmp_path: Path) -> None:
+    """Test reading a table of an SQLite database."""
+    path = tmp_path / "rules.db"
+    with closing(sqlite3.connect(path)) as connection:
+        connection.execute(
+            'CREATE TABLE "my ""rules""" (key_field, key_value, field, value)'
+        )
+        connection.executemany(
+            'INSERT INTO "my ""rules""" VALUES (?, ?, ?, ?)',
+            [*ROWS[:2], ("year", 2000, "flex", None)],
+        )
+        connection.commit()
+    rows = read_rows(table(path, 'my "rules"'), "rules")
+    assert rows == [*ROWS[:2], ("year", "2000", "flex", "")]
+
+
+def test_unreadable(tmp_path: Path) -> None:
+    """Test that missing files, tables and columns are reported."""
+    with pytest.raises(UserError, match=r"^rules: can't read .*missing\.csv: "):
+        read_rows(table(tmp_path / "missing.csv"), "rules")
+
+    path = tmp_path / "rules.csv"
+    path.write_text("key_field,field\n", encoding="utf-8")
+    with pytest.raises(UserError, match=r"missing columns key_value, value$"):
+        read_rows(table(path), "rules")
+
+    path = tmp_path / "rules.sqlite"
+    with closing(sqlite3.connect(path)):
+        pass
+    with pytest.raises(UserError, match=r"no such table: rules$"):
+        read_rows(table(path), "rules")
+
+
+def test_table_rules() -> None:
+    """Test that the rows for each key make one exact match rule."""
+    rules = table_rules(ROWS, Album, "rules")
+    assert [rule.modify for rule in rules] == [
+        "mb_albumid:=album_id genre=Jazz year=1999 'flex!'",
+        "album:=other genre=Rock",
+    ]
+    assert rules[0].query == parse_rules([rules[0].modify], Album)[0].query
+    assert rules[0].mods == (("genre", "Jazz", None), ("year", 1999, None))
+    assert rules[0].dels == ("flex",)
+
+    ruleset = RuleSet(rules, Album)
+    assert [key and key.field for key in ruleset.index.keys] == ["mb_albumid", "album"]
+    albuminfo = new_albuminfo()
+    assert ruleset.apply(albuminfo) == [
+        ("flex", DELETE),
+        ("genre", "Jazz"),
+        ("year", 1999),
+    ]
+    assert "flex" not in albuminfo
+
+    with pytest.raises(UserError, match=r"^rules: no key field or field in row 2$"):
+        table_rules([ROWS[0], ("", "x", "genre", "y")], Album, "rules")
+
+
+def test_load_table(tmp_path: Path) -> None:
+    """Test that errors in a table's rows name the table."""
+    path = tmp_path / "rules.csv"
+    path.write_text("key_field,key_value,field,value\nalbum,x,,\n", encoding="utf-8")
+    with pytest.raises(UserError, match=r"^rules: .*rules\.csv: no key field"):
+        load_table(table(path), Album, "rules")
+
+
+@pytest.mark.parametrize(
+    ("positions", "expected"),
+    [
+        ([None], "abX"),
+        ([0], "Xab"),
+        ([1, None], "aXbY"),
+        ([5, 0], "YabX"),
+        ([1, 1], "aXYb"),
+    ],
+)
+def test_insert_tables(positions: List[Optional[int]], expected: str) -> None:
+    """Test that tables are inserted before the rules at their positions."""
+    rules = parse_rules(["a:a a=a", "b:b b=b"], Album)
+    tables = [
+        (position, parse_rules([f"{'XY'[n]}:x x=x"], Album))
+        for n, position in enumerate(positions)
+    ]
+    combined = insert_tables(rules, tables)
+    assert "".join(rule.modify[0] for rule in combined) == expected